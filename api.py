@@ -0,0 +1,403 @@
+# api.py
+# Local JSON HTTP API over services.py for handheld scanners and integration jobs, so
+# they no longer drive the Streamlit UI (and pay a full script rerun per action).
+# Requests are handled by a fixed pool of worker threads; with --processes N the
+# listening socket is opened once and N forked workers accept from it, each with its
+# own DB pool (created after the fork, on first use). Configure with an optional
+# API_CONFIG dict in config.py; set "tokens" to require "Authorization: Bearer <token>".
+#
+#   python api.py [--host 127.0.0.1] [--port 8502] [--threads 8] [--processes 1]
+#
+# Routes (JSON in, JSON out):
+#   GET  /health                       GET  /stock?warehouse_id=&item_id=&limit=
+#   GET  /metrics (Prometheus text)     GET  /scans (ingestion status of this worker)
+#   POST /po        {supplier_id, warehouse_id, order_date?, lines?: [{item_id, quantity}]}
+#   POST /po/<id>/lines   {item_id, quantity}
+#   POST /po/<id>/receive {emp_id}       POST /po/receive-batch {po_ids: [...], emp_id}
+#   POST /so        {customer_id, warehouse_id, order_date?, lines?: [{item_id, quantity, price?}]}
+#   POST /so/<id>/lines   {item_id, quantity, price?}
+#   POST /so/<id>/ship    {emp_id, check_stock?}
+#   POST /stock/adjust    {warehouse_id, item_id, delta, emp_id?}
+#   POST /stock/return    {warehouse_id, item_id, quantity, kind: customer|supplier, emp_id?}
+#   POST /scans           {scans: [{warehouse_id, item_id, direction: IN|OUT, quantity?, emp_id?,
+#                          scanned_at?}]} -> 202; journalled, committed in micro-batches
+# Errors: 400 bad input, 401 missing/unknown token, 404 unknown route, 409 business rule
+# or constraint violation, 503 pool exhausted, query timeout or scan backlog, 500 other DB errors.
+import argparse
+import hmac
+import json
+import os
+import re
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+
+from mysql.connector import Error, errors
+
+import db
+import metrics
+import scan_ingest
+import services
+from stock_ops import StockOpError
+
+try:
+    from config import API_CONFIG
+except ImportError:
+    API_CONFIG = {}
+
+API_DEFAULTS = {
+    "host": "127.0.0.1",
+    "port": 8502,
+    "threads": 8,         # per process; more than the DB pool size only queues on the pool
+    "processes": 1,
+    "tokens": [],         # bearer tokens; empty = no authentication (local use only)
+    "max_body": 1024 * 1024,
+}
+
+_opts = dict(API_DEFAULTS)
+_opts.update(API_CONFIG or {})
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_default(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    raise TypeError(f"{type(v).__name__} is not JSON serializable")
+
+
+def _date(value):
+    if value in (None, ""):
+        return None
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError("order_date must be YYYY-MM-DD") from None
+
+
+def _need(body, *names):
+    missing = [n for n in names if body.get(n) in (None, "")]
+    if missing:
+        raise ValueError(f"missing field(s): {', '.join(missing)}")
+    return [body[n] for n in names]
+
+
+# ---------- ROUTES ----------
+def get_health(query):
+    return 200, {"ok": True, "pid": os.getpid(), "pool": db.pool_stats()}
+
+
+def get_stock(query):
+    args = {k: v[0] for k, v in query.items() if k in ("warehouse_id", "item_id", "limit")}
+    return 200, {"rows": services.stock_lookup(**args)}
+
+
+def post_order(side, party):
+    def handler(body):
+        party_id, warehouse_id = _need(body, party, "warehouse_id")
+        lines = body.get("lines") or []
+        if not isinstance(lines, list) or not all(isinstance(ln, dict) for ln in lines):
+            raise ValueError("lines must be a list of objects")
+        order_id = services.create_order(side, party_id, warehouse_id, _date(body.get("order_date")), lines)
+        return 201, {"order_id": order_id}
+    return handler
+
+
+def post_line(side):
+    def handler(body, order_id):
+        item_id, quantity = _need(body, "item_id", "quantity")
+        price = None if side == "purchase" else body.get("price")
+        return 201, {"line_id": services.add_order_line(side, order_id, item_id, quantity, price)}
+    return handler
+
+
+def post_receive(body, po_id):
+    emp_id, = _need(body, "emp_id")
+    return 200, services.receive_po(po_id, emp_id)
+
+
+def post_receive_batch(body):
+    po_ids, emp_id = _need(body, "po_ids", "emp_id")
+    if not isinstance(po_ids, list):
+        raise ValueError("po_ids must be a list")
+    results = services.receive_pos_batch(po_ids, emp_id)
+    return 200, {"received": sum(1 for r in results if r["ok"]), "results": results}
+
+
+def post_ship(body, so_id):
+    emp_id, = _need(body, "emp_id")
+    check_stock = body.get("check_stock", True)
+    if not isinstance(check_stock, bool):
+        # bool("false") is True: only a JSON true/false is taken
+        raise ValueError("check_stock must be true or false")
+    return 200, services.ship_so(so_id, emp_id, check_stock=check_stock)
+
+
+def post_adjust(body):
+    warehouse_id, item_id, delta = _need(body, "warehouse_id", "item_id", "delta")
+    qty = services.adjust_stock(warehouse_id, item_id, delta, body.get("emp_id"))
+    return 200, {"warehouse_id": warehouse_id, "item_id": item_id, "quantity": qty}
+
+
+def post_return(body):
+    warehouse_id, item_id, quantity, kind = _need(body, "warehouse_id", "item_id", "quantity", "kind")
+    qty = services.process_return(warehouse_id, item_id, quantity, kind, body.get("emp_id"))
+    return 200, {"warehouse_id": warehouse_id, "item_id": item_id, "quantity": qty}
+
+
+def post_scans(body):
+    scans = body.get("scans")
+    if not isinstance(scans, list):
+        raise ValueError("scans must be a list")
+    first, last = scan_ingest.submit(scans)
+    return 202, {"accepted": len(scans), "first_seq": first, "last_seq": last}
+
+
+def get_scans(query):
+    return 200, scan_ingest.get_ingestor().status()
+
+
+# (method, pattern, route label for metrics, handler); path groups are passed as arguments
+ROUTES = [
+    ("GET", r"/health", "/health", get_health),
+    ("GET", r"/stock", "/stock", get_stock),
+    ("POST", r"/po", "/po", post_order("purchase", "supplier_id")),
+    ("POST", r"/po/receive-batch", "/po/receive-batch", post_receive_batch),
+    ("POST", r"/po/(\d+)/lines", "/po/:id/lines", post_line("purchase")),
+    ("POST", r"/po/(\d+)/receive", "/po/:id/receive", post_receive),
+    ("POST", r"/so", "/so", post_order("sales", "customer_id")),
+    ("POST", r"/so/(\d+)/lines", "/so/:id/lines", post_line("sales")),
+    ("POST", r"/so/(\d+)/ship", "/so/:id/ship", post_ship),
+    ("POST", r"/stock/adjust", "/stock/adjust", post_adjust),
+    ("POST", r"/stock/return", "/stock/return", post_return),
+    ("POST", r"/scans", "/scans", post_scans),
+    ("GET", r"/scans", "/scans", get_scans),
+]
+_ROUTES = [(m, re.compile(p + r"/?\Z"), label, fn) for m, p, label, fn in ROUTES]
+
+
+def _match(method, path):
+    allowed = False
+    for m, rx, label, fn in _ROUTES:
+        hit = rx.match(path)
+        if hit:
+            if m == method:
+                return label, fn, [int(g) for g in hit.groups()]
+            allowed = True
+    raise ApiError(405 if allowed else 404, "method not allowed" if allowed else "not found")
+
+
+def _status_for(exc):
+    """HTTP status and message for an exception raised by a service call."""
+    if isinstance(exc, ApiError):
+        return exc.status, str(exc)
+    if isinstance(exc, ValueError):
+        return 400, str(exc)
+    if isinstance(exc, StockOpError):
+        return 409, str(exc)
+    if isinstance(exc, errors.IntegrityError):
+        return 409, exc.msg or str(exc)
+    if isinstance(exc, (errors.PoolError, db.QueryTimeout, scan_ingest.Backlog)):
+        return 503, str(exc)
+    if isinstance(exc, Error):
+        return 500, "database error"
+    return 500, "internal error"
+
+
+# ---------- HTTP ----------
+class Handler(BaseHTTPRequestHandler):
+    server_version = "inventory-api/1"
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _authorized(self):
+        tokens = _opts.get("tokens") or []
+        if not tokens:
+            return True
+        auth = self.headers.get("Authorization", "")
+        given = auth[7:].strip() if auth.lower().startswith("bearer ") else ""
+        return any(hmac.compare_digest(given, str(t)) for t in tokens)
+
+    def _body(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            raise ApiError(400, "bad Content-Length") from None
+        if length > int(_opts["max_body"]):
+            raise ApiError(413, "request body too large")
+        raw = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            raise ApiError(400, "body is not valid JSON") from None
+        if not isinstance(body, dict):
+            raise ApiError(400, "body must be a JSON object")
+        return body
+
+    def _handle(self, method):
+        t0 = time.perf_counter()
+        url = urlsplit(self.path)
+        label, status = "unmatched", 500
+        try:
+            with metrics.source("api"):
+                if url.path == "/metrics" and method == "GET":
+                    label, status = "/metrics", 200
+                    self._send(200, metrics.render().encode("utf-8"), metrics.CONTENT_TYPE)
+                    return
+                try:
+                    label, fn, args = _match(method, url.path)
+                    if label != "/health" and not self._authorized():
+                        raise ApiError(401, "missing or unknown bearer token")
+                    if method == "GET":
+                        status, payload = fn(parse_qs(url.query), *args)
+                    else:
+                        status, payload = fn(self._body(), *args)
+                except Exception as e:
+                    status, message = _status_for(e)
+                    if status == 500:
+                        self.log_error("%s %s failed: %r", method, url.path, e)
+                    payload = {"error": message}
+                self._send(status, json.dumps(payload, default=_json_default).encode("utf-8"), "application/json")
+        finally:
+            metrics.API_SECONDS.observe(time.perf_counter() - t0, route=label, status=status)
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledHTTPServer(ThreadingMixIn, HTTPServer):
+    """HTTPServer handling connections on a fixed-size thread pool instead of a thread per connection."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, handler, threads):
+        super().__init__(address, handler)
+        self.threads = threads
+        self._executor = None
+
+    def process_request(self, request, client_address):
+        if self._executor is None:
+            # created lazily so a pre-forked worker gets its own threads
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="api")
+        self._executor.submit(self.process_request_thread, request, client_address)
+
+    def get_request(self):
+        request, client_address = super().get_request()
+        request.setblocking(True)
+        return request, client_address
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _serve(server):
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server._executor is not None:
+            server._executor.shutdown(wait=True)
+        # commit queued scans; anything left stays in the journal for the next start
+        try:
+            scan_ingest.shutdown()
+        except Error as e:
+            print(f"scan flush on shutdown failed: {e}", file=sys.stderr)
+
+
+def _prefork(server, processes):
+    """Fork `processes` workers accepting on the already-bound socket; restart any that die."""
+    children = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)   # the parent relays Ctrl-C as SIGTERM
+            _serve(server)
+            os._exit(0)
+        children[pid] = True
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    # every worker wakes up on a new connection; the ones that lose the accept() race
+    # get EAGAIN (an OSError socketserver ignores) instead of blocking in accept()
+    server.socket.setblocking(False)
+    for _ in range(processes):
+        spawn()
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.pop(pid, None)
+        if not stopping:
+            spawn()
+    server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JSON HTTP API for stock and order operations.")
+    parser.add_argument("--host", default=_opts["host"])
+    parser.add_argument("--port", type=int, default=_opts["port"])
+    parser.add_argument("--threads", type=int, default=_opts["threads"])
+    parser.add_argument("--processes", type=int, default=_opts["processes"])
+    args = parser.parse_args(argv)
+
+    if args.processes > 1 and not hasattr(os, "fork"):
+        print("--processes needs os.fork(); running one process", file=sys.stderr)
+        args.processes = 1
+    if not _opts.get("tokens") and args.host not in ("127.0.0.1", "localhost", "::1"):
+        print("warning: no API_CONFIG['tokens'] set and listening beyond localhost", file=sys.stderr)
+
+    # bind before forking; the DB pool is only created on the first request in each worker
+    server = PooledHTTPServer((args.host, args.port), Handler, max(1, args.threads))
+    print(f"listening on http://{args.host}:{server.server_address[1]} "
+          f"({args.processes} process(es) x {args.threads} threads)", file=sys.stderr)
+    if args.processes > 1:
+        _prefork(server, args.processes)
+    else:
+        _serve(server)
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
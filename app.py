@@ -1140,10 +1140,21 @@ if __name__ == "__main__":
 # app.py
 import streamlit as st
 import pandas as pd
-import mysql.connector
 from mysql.connector import Error
-from config import DB_CONFIG
-from datetime import datetime
+import db
+import query_cache
+import master_data
+import stock_ops
+import rollups
+import stock_history
+import query_profiler
+import metrics
+import render_profiler
+import columnar
+import exporter
+import services
+from datetime import datetime, timedelta
+import os
 import re
 import traceback
 import time
@@ -1325,38 +1336,85 @@ def safe_rerun():
 
 # ---------- DB HELPERS ----------
 def get_connection():
+    # Checked out from the process-wide pool in db.py; conn.close() returns it.
     try:
-        cfg = DB_CONFIG.copy()
-        if "port" in cfg and isinstance(cfg["port"], str):
-            try:
-                cfg["port"] = int(cfg["port"])
-            except Exception:
-                pass
-        conn = mysql.connector.connect(**cfg)
-        if conn.is_connected():
-            return conn
+        return db.get_connection()
     except Error as e:
+        metrics.db_error("connect")
         st.error(f"Database connection failed: {e}")
         st.write(traceback.format_exc())
         return None
 
-def fetch_df(query, params=None):
+def fetch_df(query, params=None, cache=False, ttl=None, compact=False):
+    # cache=True: serve from the shared result cache (query_cache.py); entries are
+    # invalidated by exec_query() and the stock transactions when they write.
+    # compact=True: typed columns read in chunks (columnar.py) instead of one dict per
+    # row; for large results (float64 prices, int64 ids, categorical names).
+    if cache:
+        key = query_cache.cache.make_key(query, params)
+        family = query_cache.fingerprint(query)
+        hit = query_cache.cache.get(key, family)
+        if hit is not None:
+            if query_profiler.active():
+                query_profiler.note_cache_hit(query, params, len(hit))
+            return hit
+        tables = query_cache.read_tables(query)
+        generation = query_cache.cache.generation(tables)
     conn = get_connection()
     if not conn:
         return pd.DataFrame()
     try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute(query, params or ())
-        rows = cur.fetchall()
-        df = pd.DataFrame(rows)
-        cur.close()
+        if compact:
+            df = columnar.fetch_frame(conn, query, params)
+        else:
+            cur = conn.cursor(dictionary=True)
+            cur.execute(query, params or ())
+            rows = cur.fetchall()
+            df = pd.DataFrame(rows)
+            cur.close()
+        if cache:
+            query_cache.cache.put(key, df, tables, family, generation, ttl)
         return df
     except Error as e:
+        metrics.db_error("query")
         st.error(f"Query failed: {e}")
         return pd.DataFrame()
     finally:
         conn.close()
 
+def fetch_dfs(queries, cache=False, timeout=None, compact=False):
+    # Independent reads run side by side on separate pooled connections (db.fetch_parallel),
+    # so a page waits for its slowest query instead of the sum of them.
+    # queries: {key: (sql, params)} -> {key: DataFrame}; a failed query is reported and
+    # comes back empty, like fetch_df().
+    out, todo, pending_cache = {}, {}, {}
+    for k, (query, params) in queries.items():
+        if cache:
+            key = query_cache.cache.make_key(query, params)
+            family = query_cache.fingerprint(query)
+            hit = query_cache.cache.get(key, family)
+            if hit is not None:
+                if query_profiler.active():
+                    query_profiler.note_cache_hit(query, params, len(hit))
+                out[k] = hit
+                continue
+            tables = query_cache.read_tables(query)
+            pending_cache[k] = (key, tables, family, query_cache.cache.generation(tables))
+        todo[k] = (query, params)
+    reader = columnar.read_columns if compact else None
+    for k, res in db.fetch_parallel(todo, timeout=timeout, reader=reader).items():
+        if isinstance(res, Exception):
+            metrics.db_error("query")
+            st.error(f"Query failed: {res}")
+            out[k] = pd.DataFrame()
+            continue
+        df = res if compact else pd.DataFrame(res[1], columns=res[0])
+        if cache:
+            key, tables, family, generation = pending_cache[k]
+            query_cache.cache.put(key, df, tables, family, generation, None)
+        out[k] = df
+    return {k: out[k] for k in queries}
+
 def exec_query(query, params=None, commit=True, get_lastrowid=False):
     conn = get_connection()
     if not conn:
@@ -1366,10 +1424,12 @@ def exec_query(query, params=None, commit=True, get_lastrowid=False):
         cur.execute(query, params or ())
         if commit:
             conn.commit()
+            query_cache.invalidate_for_write(query)
         lastrowid = cur.lastrowid if get_lastrowid else None
         cur.close()
         return lastrowid
     except Error as e:
+        metrics.db_error("write")
         st.error(f"DB operation failed: {e}")
         st.write(traceback.format_exc())
         return None
@@ -1454,6 +1514,126 @@ def show_sidebar_user_widget():
             st.session_state.pop("user", None)
             safe_rerun()
 
+def show_admin_diagnostics():
+    """Sidebar panel (admin only) with DB pool statistics."""
+    u = st.session_state.get("user") or {}
+    if u.get("role") != "admin":
+        return
+    with st.sidebar.expander("DB diagnostics", expanded=False):
+        ps = db.pool_stats()
+        st.write(f"Pool: {ps['in_use']} in use / {ps['open']} open (size {ps['size']})")
+        st.write(f"Checkouts: {ps['checkouts']}, waited: {ps['waits']} "
+                 f"(total {ps['wait_time_total']:.2f}s, max {ps['wait_time_max']:.2f}s)")
+        st.write(f"Created: {ps['created']}, recycled: {ps['recycled']}, timeouts: {ps['timeouts']}")
+
+        cs = query_cache.cache.stats()
+        st.write(f"Result cache: {cs['entries']} entries, {cs['bytes'] / 1024:.0f} KiB, "
+                 f"{cs['evictions']} evictions, {cs['invalidations']} invalidations")
+        if cs["families"]:
+            fam = pd.DataFrame(
+                [{"query": f, "hits": c["hits"], "misses": c["misses"]} for f, c in cs["families"].items()]
+            ).sort_values("hits", ascending=False)
+            st.dataframe(fam, use_container_width=True, hide_index=True)
+        if st.button("Clear result cache", key="clear_query_cache"):
+            query_cache.cache.invalidate()
+
+        md = master_data.store.stats()
+        st.write("Master data: " + ", ".join(
+            f"{t} {s['rows']}{' (searched)' if s['oversized'] else ''}" for t, s in md.items()
+        ))
+        ex = metrics.exporter_status()
+        if ex["error"]:
+            st.warning(ex["error"])
+        else:
+            st.write("Metrics: " + (", ".join(v for v in (ex["http"], ex["textfile"]) if v) or "not exported"))
+
+        st.checkbox("Profile queries on each rerun", key="profile_queries",
+                    help="Records every statement the page runs; shown at the bottom of the sidebar.")
+        if st.button("Profile next rerun", key="render_profile_arm",
+                     help="Samples the Python stack of the next page rerun (CPU and time blocked on MySQL)."):
+            st.session_state["render_profile_armed"] = True
+        if st.session_state.get("render_profile_armed"):
+            st.caption("Armed: interact with the page to capture its rerun.")
+        if st.checkbox("Show recent render profiles", key="render_profile_list"):
+            captures = render_profiler.recent()
+            if not captures:
+                st.write("No captures yet.")
+            for c in captures:
+                show_profile_downloads(c, key_prefix="rp_recent")
+
+def show_profile_downloads(capture, key_prefix):
+    st.write(capture["name"])
+    c1, c2 = st.columns(2)
+    for col, kind, mime, ext in ((c1, "speedscope", "application/json", ".speedscope.json"),
+                                 (c2, "folded", "text/plain", ".folded")):
+        try:
+            with open(capture[kind], "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        col.download_button(kind, data, file_name=capture["name"] + ext, mime=mime,
+                            key=f"{key_prefix}_{kind}_{capture['name']}")
+
+def show_render_capture(cap):
+    """Sidebar summary of a sampled rerun; the capture is saved for download."""
+    with st.sidebar.expander("Render profile (this rerun)", expanded=True):
+        cpu = f", {cap.cpu_s * 1000:.0f} ms on CPU" if cap.cpu_s is not None else ""
+        st.write(f"{cap.page}: {cap.wall_s * 1000:.0f} ms wall{cpu}, {len(cap.samples)} samples")
+        st.write("By layer: " + ", ".join(f"{layer} {share:.0%}" for layer, share in cap.layers()))
+        try:
+            path = cap.save()
+        except OSError as e:
+            st.warning(f"Could not save the profile: {e}")
+            return
+        name = os.path.basename(path)[: -len(".speedscope.json")]
+        show_profile_downloads({"name": name, "speedscope": path, "folded": path[: -len(".speedscope.json")] + ".folded"},
+                               key_prefix="rp_last")
+        st.caption("Open the speedscope file at https://www.speedscope.app, or feed the folded file to flamegraph.pl.")
+
+def show_query_profile(records):
+    """Sidebar panel (admin toggle): statements executed by the current rerun."""
+    with st.sidebar.expander("Query profile (this rerun)", expanded=True):
+        db_recs = [r for r in records if not r.cached]
+        st.write(f"{len(records)} statements, {len(records) - len(db_recs)} from the result cache, "
+                 f"{sum(r.wall_ms for r in db_recs):.1f} ms in the database")
+        if not records:
+            return
+        st.markdown("**Slowest**")
+        st.dataframe(pd.DataFrame([
+            {"ms": round(r.wall_ms, 2), "rows": r.rows, "params": r.n_params, "page": r.page,
+             "caller": r.site, "statement": r.fingerprint}
+            for r in query_profiler.slowest(records)
+        ]), use_container_width=True, hide_index=True)
+        rep = query_profiler.repeated(records)
+        if rep:
+            st.markdown("**Repeated**")
+            rep_df = pd.DataFrame(rep)[["count", "cached", "total_ms", "rows", "callers", "fingerprint"]]
+            st.dataframe(rep_df.round({"total_ms": 2}), use_container_width=True, hide_index=True)
+
+        # the EXPLAIN click reruns the page, so also look the pick up in the previous rerun's list
+        candidates = {}
+        for r in records:
+            if query_profiler.explainable(r):
+                candidates.setdefault(f"{r.site} · {r.fingerprint[:90]}", r)
+        previous = st.session_state.get("query_profile_candidates", {})
+        st.session_state["query_profile_candidates"] = candidates
+        if candidates:
+            label = st.selectbox("Statement", list(candidates), key="query_profile_pick")
+            if st.button("EXPLAIN", key="query_profile_explain"):
+                rec = candidates.get(label) or previous.get(label)
+                if rec is not None:
+                    st.code(rec.sql.strip(), language="sql")
+                    plan = fetch_df("EXPLAIN " + rec.sql, rec.params)
+                    if not plan.empty:
+                        st.dataframe(plan, use_container_width=True, hide_index=True)
+        # the index advisor (python -m bench.index_advisor) reviews saved statements too
+        if st.button("Save statements for the index advisor", key="query_profile_capture"):
+            try:
+                added = query_profiler.save_capture(records)
+                st.caption(f"{added} new statement(s) saved to {query_profiler.CAPTURE_PATH}.")
+            except OSError as e:
+                st.error(f"Could not save statements: {e}")
+
 # ---------- REQUIRE ROLE ----------
 def require_role(allowed_roles):
     us = st.session_state.get("user")
@@ -1466,19 +1646,36 @@ def require_role(allowed_roles):
     return True
 
 # ---------- UTIL ----------
-def load_choices(table, key_col, label_col=None, where=None, order_by=None):
+def load_choices(table, key_col, label_col=None, where=None, order_by=None, search_key=None):
+    # Master-data lookups (warehouse/item/supplier/customer/employee by name) come
+    # from the shared in-process store; the returned dict must not be mutated.
+    # Entities too large for the store get a name search box instead; search_key is its
+    # widget key and must be unique per picker (the same table can be picked twice on a page).
+    if where is None and master_data.store.handles(table, key_col, label_col):
+        try:
+            if master_data.store.oversized(table):
+                text = st.text_input(f"Search {table} by name", key=search_key or f"{table}_search")
+                found = master_data.store.search(table, text.strip())
+                if len(found) >= master_data.store.search_limit:
+                    st.caption(f"Showing the first {len(found)} matches; type more of the name to narrow it.")
+                return found
+            return master_data.store.choices(table)
+        except (Error, LookupError) as e:
+            metrics.db_error("master_data")
+            st.error(f"Query failed: {e}")
+            return {}
     q = f"SELECT {key_col}" + (f", {label_col}" if label_col else "") + f" FROM {table}"
     if where:
         q += " WHERE " + where
     if order_by:
         q += " ORDER BY " + order_by
-    df = fetch_df(q)
+    df = fetch_df(q, cache=True)
     if df.empty:
         return {}
     if label_col:
-        return {row[key_col]: row[label_col] for _, row in df.iterrows()}
+        return dict(zip(df[key_col].tolist(), df[label_col].tolist()))
     else:
-        return {row[key_col]: str(row[key_col]) for _, row in df.iterrows()}
+        return dict(zip(df[key_col].tolist(), df[key_col].astype(str).tolist()))
 
 def ensure_non_empty(text, field_name):
     if not text or (isinstance(text, str) and not text.strip()):
@@ -1492,76 +1689,255 @@ def is_valid_gmail(email: str) -> bool:
     pattern = r"^[a-zA-Z0-9._%+-]+@gmail\.com$"
     return re.match(pattern, email.strip()) is not None
 
+ORDER_PICKER_LIMIT = 200
+
+def pick_order(table, id_col, party_col, date_col, label, key):
+    # Order picker over the newest ORDER_PICKER_LIMIT orders (a backward primary-key read,
+    # not the whole table); older orders are opened by id. Returns (any orders?, row or None).
+    cols = f"{id_col}, {party_col}, warehouse_id, {date_col}, status"
+    df = fetch_df(f"SELECT {cols} FROM {table} ORDER BY {id_col} DESC LIMIT %s", (ORDER_PICKER_LIMIT,), cache=True)
+    if df.empty:
+        return False, None
+    rows = {int(r[id_col]): r for _, r in df.iterrows()}
+    sel = st.selectbox(label, options=["-- select --"] + [f'{i} (status={r["status"]})' for i, r in rows.items()], key=key)
+    if len(df) >= ORDER_PICKER_LIMIT:
+        st.caption(f"Newest {ORDER_PICKER_LIMIT} orders listed; enter an id below for an older one.")
+        older = int(st.number_input("... or order id", min_value=0, step=1, key=f"{key}_id"))
+        if older:
+            if older in rows:
+                return True, rows[older]
+            one = fetch_df(f"SELECT {cols} FROM {table} WHERE {id_col} = %s", (older,))
+            if one.empty:
+                st.warning(f"No order with id {older}.")
+                return True, None
+            return True, one.iloc[0]
+    if sel == "-- select --":
+        return True, None
+    return True, rows[int(str(sel).split(" ")[0])]
+
 # ---------- STOCK PAGE ----------
+STOCK_PAGE_SIZES = [50, 100, 250, 500]
+
+def _like_prefix(text):
+    # escape LIKE wildcards so the user's text is matched literally as a prefix
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def stock_filter_sql(wh_id=None, category=None, name_prefix=None, status=None):
+    """WHERE fragments + params shared by the stock grid page query and its count."""
+    where, params = [], []
+    if wh_id is not None:
+        where.append("s.warehouse_id = %s")
+        params.append(wh_id)
+    if category:
+        where.append("i.category = %s")
+        params.append(category)
+    if name_prefix:
+        where.append("i.name LIKE %s")
+        params.append(_like_prefix(name_prefix))
+    # LOW/OK come from the trigger-maintained low_stock table (PK lookup per row)
+    if status == "LOW":
+        where.append("EXISTS (SELECT 1 FROM low_stock ls WHERE ls.warehouse_id = s.warehouse_id AND ls.item_id = s.item_id)")
+    elif status == "OK":
+        where.append("NOT EXISTS (SELECT 1 FROM low_stock ls WHERE ls.warehouse_id = s.warehouse_id AND ls.item_id = s.item_id)")
+    return where, params
+
+def stock_page_query(filters, after=None, limit=100):
+    """
+    One page of the stock grid, keyset-paginated on (warehouse_id, item_id):
+    `after` is the last (warehouse_id, item_id) of the previous page (None = first page).
+    Status is computed in SQL.
+    """
+    where, params = stock_filter_sql(**filters)
+    if after is not None:
+        where.append("(s.warehouse_id > %s OR (s.warehouse_id = %s AND s.item_id > %s))")
+        params += [after[0], after[0], after[1]]
+    q = """
+    SELECT s.warehouse_id, w.name AS warehouse_name,
+           i.item_id, i.name AS item_name, i.category, s.quantity, i.unit_of_measure, i.price, i.reorder_level,
+           CASE WHEN s.quantity < i.reorder_level THEN 'LOW' ELSE 'OK' END AS status
+    FROM stock s
+    JOIN item i ON s.item_id = i.item_id
+    LEFT JOIN warehouse w ON s.warehouse_id = w.warehouse_id
+    """
+    if where:
+        q += " WHERE " + " AND ".join(where)
+    q += " ORDER BY s.warehouse_id, s.item_id LIMIT %s"
+    params.append(int(limit))
+    return q, tuple(params)
+
+LOW_STOCK_PAGE_SIZE = 500
+
+def low_stock_page_query(after=None, limit=LOW_STOCK_PAGE_SIZE):
+    """
+    One page of the low-stock list, largest shortfall first, keyset-paginated on
+    (shortfall, warehouse_id, item_id) descending: `after` is the last key of the previous page.
+    Walks ix_low_stock_shortfall backwards (the PK columns are its tail).
+    """
+    where, params = "", []
+    if after is not None:
+        where = ("WHERE (ls.shortfall < %s OR (ls.shortfall = %s AND (ls.warehouse_id < %s "
+                 "OR (ls.warehouse_id = %s AND ls.item_id < %s))))")
+        params = [after[0], after[0], after[1], after[1], after[2]]
+    q = f"""
+        SELECT ls.warehouse_id, w.name AS warehouse_name, ls.item_id, i.name AS item_name,
+               ls.quantity, ls.reorder_level, ls.shortfall
+        FROM low_stock ls
+        JOIN item i ON i.item_id = ls.item_id
+        LEFT JOIN warehouse w ON ls.warehouse_id = w.warehouse_id
+        {where}
+        ORDER BY ls.shortfall DESC, ls.warehouse_id DESC, ls.item_id DESC
+        LIMIT %s
+    """
+    params.append(int(limit))
+    return q, tuple(params)
+
+def stock_count_query(filters):
+    where, params = stock_filter_sql(**filters)
+    # item is only joined when a filter needs it; otherwise the count stays on stock's index
+    needs_item = bool(filters.get("category") or filters.get("name_prefix"))
+    q = "SELECT COUNT(*) AS total FROM stock s" + (" JOIN item i ON s.item_id = i.item_id" if needs_item else "")
+    if where:
+        q += " WHERE " + " AND ".join(where)
+    return q, tuple(params)
+
 def page_stock():
     st.header(" Stock ")
     st.markdown("")
 
-    warehouses = load_choices("warehouse", "warehouse_id", "name", order_by="name")
+    warehouses = load_choices("warehouse", "warehouse_id", "name", order_by="name", search_key="stock_wh_search")
     if not warehouses:
         st.info("No warehouses found. Make sure warehouse table exists.")
-    wh_choice = st.selectbox("Select warehouse", options=["All"] + [f"{k} - {v}" for k,v in warehouses.items()])
+    categories = fetch_df("SELECT DISTINCT category FROM item WHERE category IS NOT NULL ORDER BY category", cache=True)
+    col1, col2, col3, col4, col5 = st.columns([3,2,3,1,1])
+    with col1:
+        wh_choice = st.selectbox("Select warehouse", options=["All"] + [f"{k} - {v}" for k,v in warehouses.items()])
+    with col2:
+        cat_choice = st.selectbox("Category", options=["All"] + (categories["category"].tolist() if not categories.empty else []))
+    with col3:
+        name_prefix = st.text_input("Item name starts with", value="")
+    with col4:
+        status_choice = st.selectbox("Status", options=["All", "LOW", "OK"])
+    with col5:
+        page_size = st.selectbox("Rows", options=STOCK_PAGE_SIZES, index=1)
+
+    filters = {
+        "wh_id": None if wh_choice == "All" else int(str(wh_choice).split(" - ")[0]),
+        "category": None if cat_choice == "All" else cat_choice,
+        "name_prefix": name_prefix.strip() or None,
+        "status": None if status_choice == "All" else status_choice,
+    }
 
     # JOINs are used below (stock→item, left join warehouse)
     st.markdown(
         "<div class='dbnote'>Uses <b>JOIN</b>: <code>stock s</code> "
-        "<b>JOIN</b> <code>item i</code> and <b>LEFT JOIN</b> <code>warehouse w</code>.</div>",
+        "<b>JOIN</b> <code>item i</code> and <b>LEFT JOIN</b> <code>warehouse w</code>; "
+        "filtered and paged in SQL (keyset on <code>(warehouse_id, item_id)</code>).</div>",
         unsafe_allow_html=True
     )
 
-    if wh_choice == "All":
-        q = """
-        SELECT s.warehouse_id, w.name as warehouse_name,
-               i.item_id, i.name as item_name, s.quantity, i.unit_of_measure, i.price, i.reorder_level
-        FROM stock s
-        JOIN item i ON s.item_id = i.item_id
-        LEFT JOIN warehouse w ON s.warehouse_id = w.warehouse_id
-        """
-        params = ()
-    else:
-        try:
-            wid = int(str(wh_choice).split(" - ")[0])
-        except Exception:
-            wid = None
-        q = """
-        SELECT s.warehouse_id, w.name as warehouse_name,
-               i.item_id, i.name as item_name, s.quantity, i.unit_of_measure, i.price, i.reorder_level
-        FROM stock s
-        JOIN item i ON s.item_id = i.item_id
-        LEFT JOIN warehouse w ON s.warehouse_id = w.warehouse_id
-        WHERE s.warehouse_id = %s
-        """
-        params = (wid,)
-    df = fetch_df(q, params)
+    # keyset cursor: stack of page-start keys, reset whenever the filters change
+    nav = st.session_state.get("stock_grid_nav")
+    filter_sig = (tuple(sorted(filters.items())), page_size)
+    if not nav or nav["filters"] != filter_sig:
+        nav = {"filters": filter_sig, "starts": [None]}
+        st.session_state["stock_grid_nav"] = nav
+
+    q, params = stock_page_query(filters, after=nav["starts"][-1], limit=page_size + 1)
+    cq, cparams = stock_count_query(filters)
+    # low_stock is kept current by TRIGGERS on stock and item.reorder_level, so that list is
+    # an index scan over the (small) low set instead of a scan of stock; paged like the grid
+    low_nav = st.session_state.setdefault("low_stock_nav", [None])
+    low_q, low_params = low_stock_page_query(after=low_nav[-1], limit=LOW_STOCK_PAGE_SIZE + 1)
+    # grid page, row count and low-stock page + count are independent: fetched side by side
+    res = fetch_dfs({"grid": (q, params), "count": (cq, cparams), "low": (low_q, low_params),
+                     "low_count": ("SELECT COUNT(*) AS total FROM low_stock", None)}, cache=True, compact=True)
+    df, count_df, low_df = res["grid"], res["count"], res["low"]
+    total = int(count_df.at[0, "total"]) if not count_df.empty else 0
+    low_total = int(res["low_count"].at[0, "total"]) if not res["low_count"].empty else 0
+
+    st.subheader("Inventory")
     if df.empty:
         st.info("No stock records found.")
     else:
-        df["status"] = df.apply(
-            lambda r: "LOW" if (r.get("quantity") is not None and r.get("reorder_level") is not None and r["quantity"] < r["reorder_level"]) else "OK",
-            axis=1
-        )
-        st.subheader("Inventory")
-        st.dataframe(df[["warehouse_id","warehouse_name","item_id","item_name","quantity","unit_of_measure","price","reorder_level","status"]], use_container_width=True)
+        has_next = len(df) > page_size
+        df = df.head(page_size)
+        page_no = len(nav["starts"])
+        first_row = (page_no - 1) * page_size + 1
+        st.caption(f"Rows {first_row}–{first_row + len(df) - 1} of {total}")
+        st.dataframe(df[["warehouse_id","warehouse_name","item_id","item_name","category","quantity","unit_of_measure","price","reorder_level","status"]], use_container_width=True)
+        prev_col, next_col, _ = st.columns([1,1,6])
+        with prev_col:
+            if st.button("◀ Previous", disabled=page_no == 1, key="stock_prev"):
+                nav["starts"].pop()
+                safe_rerun()
+        with next_col:
+            if st.button("Next ▶", disabled=not has_next, key="stock_next"):
+                last = df.iloc[-1]
+                nav["starts"].append((int(last["warehouse_id"]), int(last["item_id"])))
+                safe_rerun()
 
-        st.subheader("Low-stock items (across all warehouses)")
-        # NESTED SUBQUERY example (equivalent to status=LOW)
-        low_nested = fetch_df("""
-            SELECT s.warehouse_id, w.name AS warehouse_name, s.item_id, i.name AS item_name, s.quantity,
-                   (SELECT reorder_level FROM item WHERE item_id = s.item_id) AS reorder_level
-            FROM stock s
-            LEFT JOIN warehouse w ON s.warehouse_id = w.warehouse_id
-            JOIN item i ON i.item_id = s.item_id
-            WHERE s.quantity < (SELECT reorder_level FROM item WHERE item_id = s.item_id);
-        """)
-        st.markdown(
-            "<div class='dbnote'>Uses <b>Nested Subquery</b> to compute "
-            "<i>items below reorder level</i>.</div>",
-            unsafe_allow_html=True
-        )
-        if low_nested.empty:
-            st.success("No low-stock items ")
-        else:
-            st.dataframe(low_nested[["warehouse_id","warehouse_name","item_id","item_name","quantity","reorder_level"]], use_container_width=True)
+    st.subheader("Low-stock items (across all warehouses)")
+    st.markdown(
+        "<div class='dbnote'>Reads <code>low_stock</code>, a table maintained by <b>TRIGGERS</b> "
+        "on <code>stock</code> and <code>item</code> (items below reorder level).</div>",
+        unsafe_allow_html=True
+    )
+    if low_df.empty and len(low_nav) > 1:
+        # the list shrank under the current page: start over
+        st.session_state["low_stock_nav"] = [None]
+        safe_rerun()
+    if low_df.empty:
+        st.success("No low-stock items ")
+    else:
+        low_has_next = len(low_df) > LOW_STOCK_PAGE_SIZE
+        low_df = low_df.head(LOW_STOCK_PAGE_SIZE)
+        low_first = (len(low_nav) - 1) * LOW_STOCK_PAGE_SIZE + 1
+        st.caption(f"Rows {low_first}–{low_first + len(low_df) - 1} of {low_total}, largest shortfall first")
+        st.dataframe(low_df[["warehouse_id","warehouse_name","item_id","item_name","quantity","reorder_level","shortfall"]], use_container_width=True)
+        prev_col, next_col, _ = st.columns([1,1,6])
+        with prev_col:
+            if st.button("◀ Previous", disabled=len(low_nav) == 1, key="low_stock_prev"):
+                low_nav.pop()
+                safe_rerun()
+        with next_col:
+            if st.button("Next ▶", disabled=not low_has_next, key="low_stock_next"):
+                last = low_df.iloc[-1]
+                low_nav.append((int(last["shortfall"]), int(last["warehouse_id"]), int(last["item_id"])))
+                safe_rerun()
+
+    with st.expander("Stock as of a date (audit)", expanded=False):
+        st.markdown("<div class='dbnote'>Starts from the nearest <code>stock_checkpoint</code> at or before the chosen time "
+                    "and replays only later <code>transaction_log</code> rows (<b>UNION ALL</b> + <b>GROUP BY</b>).</div>",
+                    unsafe_allow_html=True)
+        c1, c2, c3, c4 = st.columns([3,2,2,3])
+        with c1:
+            asof_wh = st.selectbox("Warehouse", options=[f"{k} - {v}" for k,v in warehouses.items()], key="asof_wh")
+        with c2:
+            asof_date = st.date_input("Date", value=datetime.today(), key="asof_date")
+        with c3:
+            asof_time = st.time_input("Time", value=datetime.strptime("23:59", "%H:%M").time(), key="asof_time")
+        with c4:
+            items = load_choices("item", "item_id", "name", order_by="name", search_key="asof_item_search")
+            asof_item = st.selectbox("Item (optional)", options=["All"] + [f"{k} - {v}" for k,v in items.items()], key="asof_item")
+        if asof_wh and st.button("Show stock as of", key="asof_go"):
+            at = datetime.combine(asof_date, asof_time)
+            try:
+                asof_df, ckpt = stock_history.stock_as_of(
+                    int(asof_wh.split(" - ")[0]), at,
+                    None if asof_item == "All" else int(asof_item.split(" - ")[0])
+                )
+                if ckpt:
+                    st.caption(f"From checkpoint #{ckpt[0]} taken {ckpt[1]}, plus log rows after log id {ckpt[2]}.")
+                else:
+                    st.caption("No checkpoint before this time: replayed the transaction log from the beginning.")
+                if asof_df.empty:
+                    st.info("No stock on hand at that time.")
+                else:
+                    st.dataframe(asof_df, use_container_width=True)
+            except ValueError as e:
+                st.warning(str(e))
+            except Error as e:
+                st.error(f"Query failed: {e}")
 
 # ---------- PURCHASE / RECEIVE PAGE ----------
 def page_purchase():
@@ -1570,8 +1946,8 @@ def page_purchase():
 
     # 2.1 Create PO
     with st.expander("2.1 Create PO", expanded=True):
-        suppliers = load_choices("supplier", "supplier_id", "name", order_by="name")
-        warehouses = load_choices("warehouse", "warehouse_id", "name", order_by="name")
+        suppliers = load_choices("supplier", "supplier_id", "name", order_by="name", search_key="po_supplier_search")
+        warehouses = load_choices("warehouse", "warehouse_id", "name", order_by="name", search_key="po_wh_search")
         col1, col2, col3 = st.columns(3)
         with col1:
             supplier_sel = st.selectbox("Pick supplier", options=["-- Add new --"] + [f"{k} - {v}" for k,v in suppliers.items()])
@@ -1599,8 +1975,7 @@ def page_purchase():
                 try:
                     sup_id = int(str(supplier_sel).split(" - ")[0])
                     wh_id = int(str(warehouse_sel).split(" - ")[0])
-                    q = "INSERT INTO purchase_order (supplier_id, warehouse_id, po_date, status) VALUES (%s,%s,%s,%s)"
-                    po_id = exec_query(q, (sup_id, wh_id, po_date, "CREATED"), commit=True, get_lastrowid=True)
+                    po_id = services.create_order("purchase", sup_id, wh_id, po_date)
                     if po_id:
                         st.success(f"Purchase Order created: PO#{po_id}")
                         st.markdown("<div class='dbnote'>PO header insert; "
@@ -1610,28 +1985,20 @@ def page_purchase():
 
     # 2.2 Add items to PO
     st.markdown("### 2.2 Add items to PO (price fixed from item, quantity editable later)")
-    po_choices = fetch_df("SELECT po_id, supplier_id, warehouse_id, po_date, status FROM purchase_order ORDER BY po_id DESC")
-    if po_choices.empty:
+    any_po, po_row = pick_order("purchase_order", "po_id", "supplier_id", "po_date",
+                                "Pick PO to add lines / edit lines", "po_select_box")
+    if not any_po:
         st.info("No Purchase Orders found. Create one first in 2.1.")
     else:
-        po_map = {row["po_id"]: row for _, row in po_choices.iterrows()}
-        po_option_list = ["-- select --"] + [f'{r["po_id"]} (status={r["status"]})' for _, r in po_choices.iterrows()]
-        po_sel = st.selectbox("Pick PO to add lines / edit lines", options=po_option_list, key="po_select_box")
-
-        selected_po_id = None
-        if po_sel != "-- select --":
-            try:
-                selected_po_id = int(str(po_sel).split(" ")[0])
-            except Exception:
-                selected_po_id = None
+        selected_po_id = int(po_row["po_id"]) if po_row is not None else None
 
         if selected_po_id is None:
             st.info("Select a PO above to add lines or edit its lines.")
         else:
-            st.write("PO details:", po_map[selected_po_id])
+            st.write("PO details:", po_row)
 
             with st.expander("Add item to this PO (unit price is fixed from item)", expanded=False):
-                items = load_choices("item", "item_id", "name", order_by="name")
+                items = load_choices("item", "item_id", "name", order_by="name", search_key=f"po_add_item_{selected_po_id}_search")
                 if not items:
                     st.info("No items found. Add items to the item table first.")
                 else:
@@ -1660,12 +2027,16 @@ def page_purchase():
                             qty = st.number_input("Quantity", min_value=1, step=1, key=f"add_po_qty_{selected_po_id}_{item_id}")
                             st.number_input("Unit Price (fixed from item)", value=price_val, format="%.2f", disabled=True, key=f"add_po_price_{selected_po_id}_{item_id}")
                             if st.button("➕ Add line to PO", key=f"add_line_btn_{selected_po_id}_{item_id}"):
-                                q = "INSERT INTO purchase_order_details (po_id, item_id, quantity, price) VALUES (%s,%s,%s,%s)"
-                                last = exec_query(q, (selected_po_id, item_id, qty, price_val), commit=True, get_lastrowid=True)
-                                if last is not None:
+                                # header locked and checked still open; the price is taken from the item
+                                try:
+                                    services.add_order_line("purchase", selected_po_id, item_id, qty)
                                     st.success("Line added to PO.")
                                     st.markdown("<div class='dbnote'>Detail insert uses <b>FOREIGN KEYS</b>. "
-                                                "PO total later uses <b>FUNCTION</b> <code>fn_po_total()</code> and <b>AGGREGATE</b> <code>SUM</code>.</div>", unsafe_allow_html=True)
+                                                "The <b>TRIGGER</b> on <code>purchase_order_details</code> adds the line value to the PO total.</div>", unsafe_allow_html=True)
+                                except (stock_ops.StockOpError, ValueError) as e:
+                                    st.error(str(e))
+                                except Error as e:
+                                    st.error(f"Failed to add line: {e}")
 
             # show/edit lines (JOIN to show item names)
             podf = fetch_df("""
@@ -1705,28 +2076,11 @@ def page_purchase():
                             upd = exec_query("UPDATE purchase_order_details SET quantity = %s WHERE po_detail_id = %s", (new_qty, pid))
                             if upd is not None:
                                 st.success(f"Updated line {pid} → qty={new_qty}")
-                                try:
-                                    df_total = fetch_df("SELECT fn_po_total(%s) AS po_total", (selected_po_id,))
-                                    if not df_total.empty and 'po_total' in df_total.columns:
-                                        po_total = float(df_total.at[0,'po_total'])
-                                    else:
-                                        raise Exception("fn_po_total missing or returned empty")
-                                except Exception:
-                                    df_tot2 = fetch_df("SELECT IFNULL(SUM(quantity * price),0) AS po_total FROM purchase_order_details WHERE po_id = %s", (selected_po_id,))
-                                    po_total = float(df_tot2.at[0,'po_total']) if not df_tot2.empty else 0.0
-                                st.info(f"PO #{selected_po_id} total: {po_total:.2f}")
-                try:
-                    # FUNCTION + AGGREGATE usage shown here
-                    df_total = fetch_df("SELECT fn_po_total(%s) AS po_total", (selected_po_id,))
-                    if not df_total.empty and 'po_total' in df_total.columns:
-                        po_total = float(df_total.at[0,'po_total'])
-                        st.markdown("<div class='dbnote'><b>FUNCTION</b>: <code>fn_po_total(po_id)</code> returns PO value.</div>", unsafe_allow_html=True)
-                    else:
-                        raise Exception("fn_po_total missing")
-                except Exception:
-                    df_tot2 = fetch_df("SELECT IFNULL(SUM(quantity * price),0) AS po_total FROM purchase_order_details WHERE po_id = %s", (selected_po_id,))
-                    po_total = float(df_tot2.at[0,'po_total']) if not df_tot2.empty else 0.0
-                    st.markdown("<div class='dbnote'><b>AGGREGATE</b>: Fallback <code>SUM(quantity*price)</code> computes total.</div>", unsafe_allow_html=True)
+                # header total is kept current by the delta triggers: one primary-key read
+                df_total = fetch_df("SELECT total_amount AS po_total FROM purchase_order WHERE po_id = %s", (selected_po_id,))
+                po_total = float(df_total.at[0,'po_total']) if not df_total.empty else 0.0
+                st.markdown("<div class='dbnote'><b>TRIGGER</b>s on <code>purchase_order_details</code> keep "
+                            "<code>purchase_order.total_amount</code> current by applying each line's change.</div>", unsafe_allow_html=True)
                 st.markdown("---")
                 st.metric(label=f"PO #{selected_po_id} total", value=f"{po_total:.2f}")
 
@@ -1734,7 +2088,7 @@ def page_purchase():
     with st.expander("2.3 Receive PO (Stock IN)", expanded=False):
         st.markdown("<div class='dbnote'>Receiving updates <code>stock</code> and logs to <code>transaction_log</code>. "
                     "DB <b>TRIGGER</b> <code>trg_stock_after_update</code> manages <code>reorder_alerts</code> (low-stock).</div>", unsafe_allow_html=True)
-        po_to_receive = fetch_df("SELECT po_id, supplier_id, warehouse_id, po_date, status FROM purchase_order WHERE status IN ('CREATED','APPROVED','PARTIAL') ORDER BY po_id DESC")
+        po_to_receive = fetch_df("SELECT po_id, supplier_id, warehouse_id, po_date, status FROM purchase_order WHERE status IN ('CREATED','APPROVED','PARTIAL') ORDER BY po_id DESC", cache=True)
         if po_to_receive.empty:
             st.info("No PO available to receive.")
         else:
@@ -1743,48 +2097,46 @@ def page_purchase():
             if po_sel2 != "-- select --":
                 poid = int(po_sel2)
                 st.write("PO details:", po_map[poid])
-                employee = load_choices("employee", "emp_id", "name", order_by="name")
+                employee = load_choices("employee", "emp_id", "name", order_by="name", search_key=f"receive_emp_{poid}_search")
                 emp_sel = st.selectbox("Enter receiving employee", options=["-- select employee --"] + [f"{k} - {v}" for k,v in employee.items()], key=f"receive_emp_{poid}")
                 if emp_sel != "-- select employee --":
                     emp_id = int(emp_sel.split(" - ")[0])
                     if st.button("Receive this PO", key=f"receive_btn_{poid}"):
-                        lines = fetch_df("SELECT item_id, quantity, price FROM purchase_order_details WHERE po_id = %s", (poid,))
-                        if lines.empty:
-                            st.error("PO has no lines.")
+                        try:
+                            res = services.receive_po(poid, emp_id)
+                            st.success(f"PO {poid} received and stock updated ({res['lines']} lines, {res['units']} units).")
+                        except stock_ops.StockOpError as e:
+                            st.error(str(e))
+                        except Error as e:
+                            st.error(f"Failed to receive PO: {e}")
+                            st.write(traceback.format_exc())
+
+            # Batch receive (dock close): many POs in one pass
+            st.markdown("---")
+            st.markdown("**Batch receive**")
+            st.markdown("<div class='dbnote'>Lines of all selected POs are merged per (warehouse, item) into one "
+                        "<code>stock</code> upsert and one bulk <code>transaction_log</code> insert; each PO is reported separately.</div>",
+                        unsafe_allow_html=True)
+            batch_sel = st.multiselect("Pick POs to receive together", options=[int(r) for r in po_to_receive["po_id"].tolist()], key="po_batch_select")
+            batch_emp_map = load_choices("employee", "emp_id", "name", order_by="name", search_key="po_batch_emp_search")
+            batch_emp = st.selectbox("Receiving employee", options=["-- select employee --"] + [f"{k} - {v}" for k,v in batch_emp_map.items()], key="po_batch_emp")
+            if st.button("Receive selected POs", key="po_batch_btn"):
+                if not batch_sel:
+                    st.error("Pick at least one PO.")
+                elif batch_emp == "-- select employee --":
+                    st.error("Pick the receiving employee.")
+                else:
+                    try:
+                        results = services.receive_pos_batch(batch_sel, int(batch_emp.split(" - ")[0]))
+                        ok = sum(1 for r in results if r["ok"])
+                        if ok == len(results):
+                            st.success(f"Received {ok} POs.")
                         else:
-                            conn = get_connection()
-                            if not conn:
-                                st.error("DB connection failed.")
-                            else:
-                                try:
-                                    cur = conn.cursor()
-                                    for _, r in lines.iterrows():
-                                        item_id = r["item_id"]
-                                        qty = r["quantity"]
-                                        cur.execute("SELECT quantity FROM stock WHERE warehouse_id = %s AND item_id = %s", (po_map[poid]["warehouse_id"], item_id))
-                                        currow = cur.fetchone()
-                                        if currow:
-                                            new_qty = currow[0] + qty
-                                            cur.execute("UPDATE stock SET quantity = %s, last_updated = %s WHERE warehouse_id = %s AND item_id = %s", (new_qty, datetime.now(), po_map[poid]["warehouse_id"], item_id))
-                                        else:
-                                            cur.execute("INSERT INTO stock (warehouse_id, item_id, quantity, last_updated) VALUES (%s,%s,%s,%s)", (po_map[poid]["warehouse_id"], item_id, qty, datetime.now()))
-                                        try:
-                                            cur.execute(
-                                                "INSERT INTO transaction_log (warehouse_id, item_id, change_type, delta_qty, ref_type, ref_id, emp_id, logged_at) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)",
-                                                (po_map[poid]["warehouse_id"], item_id, "IN", qty, "PO", poid, emp_id, datetime.now())
-                                            )
-                                        except Error:
-                                            pass
-                                    cur.execute("UPDATE purchase_order SET status = %s WHERE po_id = %s", ("RECEIVED", poid))
-                                    conn.commit()
-                                    st.success(f"PO {poid} received and stock updated.")
-                                except Error as e:
-                                    conn.rollback()
-                                    st.error(f"Failed to receive PO: {e}")
-                                    st.write(traceback.format_exc())
-                                finally:
-                                    cur.close()
-                                    conn.close()
+                            st.warning(f"Received {ok} of {len(results)} POs; see errors below.")
+                        st.dataframe(pd.DataFrame(results), use_container_width=True)
+                    except Error as e:
+                        st.error(f"Batch receive failed: {e}")
+                        st.write(traceback.format_exc())
 
 # ---------- SALES / SHIP PAGE ----------
 def page_sales():
@@ -1794,8 +2146,8 @@ def page_sales():
 
     # 3.1 Create SO
     with st.expander("3.1 Create SO", expanded=False):
-        customers = load_choices("customer", "customer_id", "name", order_by="name")
-        warehouses = load_choices("warehouse", "warehouse_id", "name", order_by="name")
+        customers = load_choices("customer", "customer_id", "name", order_by="name", search_key="so_customer_search")
+        warehouses = load_choices("warehouse", "warehouse_id", "name", order_by="name", search_key="so_wh_search")
         col1, col2, col3 = st.columns(3)
         with col1:
             customer_sel = st.selectbox("Pick customer", options=["-- Add new --"] + [f"{k} - {v}" for k,v in customers.items()])
@@ -1823,8 +2175,7 @@ def page_sales():
                 try:
                     cust_id = int(str(customer_sel).split(" - ")[0])
                     wh_id = int(str(warehouse_sel).split(" - ")[0])
-                    q = "INSERT INTO sales_order (customer_id, warehouse_id, so_date, status) VALUES (%s,%s,%s,%s)"
-                    so_id = exec_query(q, (cust_id, wh_id, so_date, "NEW"), commit=True, get_lastrowid=True)
+                    so_id = services.create_order("sales", cust_id, wh_id, so_date)
                     if so_id:
                         st.success(f"Sales Order created: SO#{so_id}")
                         st.markdown("<div class='dbnote'>SO header insert; detail lines use <b>JOIN</b> to show item names.</div>", unsafe_allow_html=True)
@@ -1833,16 +2184,15 @@ def page_sales():
 
     # 3.2 Add items to SO
     with st.expander("3.2 Add items to SO (price editable)", expanded=False):
-        so_choices = fetch_df("SELECT so_id, customer_id, warehouse_id, so_date, status FROM sales_order ORDER BY so_id DESC")
-        if so_choices.empty:
+        any_so, so_row = pick_order("sales_order", "so_id", "customer_id", "so_date",
+                                    "Pick SO to add lines", "so_select_box")
+        if not any_so:
             st.info("No Sales Orders found. Create one above.")
         else:
-            so_map = {row["so_id"]: row for _, row in so_choices.iterrows()}
-            so_sel = st.selectbox("Pick SO to add lines", options=["-- select --"] + [f'{r["so_id"]} (status={r["status"]})' for _, r in so_choices.iterrows()], key="so_select_box")
-            if so_sel != "-- select --":
-                selected_so_id = int(str(so_sel).split(" ")[0])
-                st.write("SO details:", so_map[selected_so_id])
-                items = load_choices("item", "item_id", "name", order_by="name")
+            if so_row is not None:
+                selected_so_id = int(so_row["so_id"])
+                st.write("SO details:", so_row)
+                items = load_choices("item", "item_id", "name", order_by="name", search_key=f"so_item_{selected_so_id}_search")
                 item_choice = st.selectbox("Pick item", options=[f"{k} - {v}" for k,v in items.items()], key=f"so_item_{selected_so_id}")
                 item_id = int(item_choice.split(" - ")[0])
                 item_row = fetch_df("SELECT item_id, name, price FROM item WHERE item_id = %s", (item_id,))
@@ -1850,11 +2200,14 @@ def page_sales():
                 qty = st.number_input("Quantity", min_value=1, step=1, key=f"so_qty_{selected_so_id}_{item_id}")
                 price_input = st.number_input("Price (editable for sales)", value=price_val, format="%.2f", key=f"so_price_{selected_so_id}_{item_id}")
                 if st.button("➕ Add line to SO", key=f"add_so_line_{selected_so_id}_{item_id}"):
-                    q = "INSERT INTO sales_order_details (so_id, item_id, quantity, price) VALUES (%s,%s,%s,%s)"
-                    last = exec_query(q, (selected_so_id, item_id, qty, price_input), commit=True, get_lastrowid=True)
-                    if last is not None:
+                    try:
+                        services.add_order_line("sales", selected_so_id, item_id, qty, price_input)
                         st.success("Line added to SO.")
                         st.markdown("<div class='dbnote'>Detail insert; reporting later uses <b>AGGREGATE</b> <code>SUM</code>.</div>", unsafe_allow_html=True)
+                    except (stock_ops.StockOpError, ValueError) as e:
+                        st.error(str(e))
+                    except Error as e:
+                        st.error(f"Failed to add line: {e}")
                 sodf = fetch_df("SELECT sod.so_detail_id, sod.item_id, i.name AS item_name, sod.quantity, sod.price FROM sales_order_details sod JOIN item i ON sod.item_id = i.item_id WHERE sod.so_id = %s", (selected_so_id,))
                 st.markdown("<div class='dbnote'>Uses <b>JOIN</b> to display item names for SO lines.</div>", unsafe_allow_html=True)
                 if not sodf.empty:
@@ -1864,72 +2217,29 @@ def page_sales():
     with st.expander("3.3 Ship / Dispatch (Stock OUT)", expanded=False):
         st.markdown("<div class='dbnote'>Shipping updates <code>stock</code> and writes to <code>transaction_log</code>. "
                     "DB <b>TRIGGER</b> on <code>stock</code> maintains <code>reorder_alerts</code>.</div>", unsafe_allow_html=True)
-        so_to_ship = fetch_df("SELECT so_id, customer_id, warehouse_id, so_date, status FROM sales_order WHERE status IN ('NEW','CONFIRMED') ORDER BY so_id DESC")
+        so_to_ship = fetch_df("SELECT so_id, customer_id, warehouse_id, so_date, status FROM sales_order WHERE status IN ('NEW','CONFIRMED') ORDER BY so_id DESC", cache=True)
         if so_to_ship.empty:
             st.info("No Sales Orders ready to ship.")
         else:
             so_sel2 = st.selectbox("Pick SO to ship", options=["-- select --"] + [str(r["so_id"]) for _, r in so_to_ship.iterrows()], key="so_ship_select")
             if so_sel2 != "-- select --":
                 soid = int(so_sel2)
-                emp_map = load_choices("employee", "emp_id", "name", order_by="name")
+                emp_map = load_choices("employee", "emp_id", "name", order_by="name", search_key=f"ship_emp_{soid}_search")
                 emp_sel = st.selectbox("Enter shipping employee", options=["-- select employee --"] + [f"{k} - {v}" for k,v in emp_map.items()], key=f"ship_emp_{soid}")
                 check_stock = st.checkbox("Check stock before ship", value=True, key=f"check_stock_{soid}")
                 if emp_sel != "-- select employee --":
                     emp_id = int(emp_sel.split(" - ")[0])
                     if st.button("Ship this SO", key=f"ship_btn_{soid}"):
-
-                        lines = fetch_df("SELECT item_id, quantity FROM sales_order_details WHERE so_id = %s", (soid,))
-                        if lines.empty:
-                            st.error("SO has no lines.")
-                        else:
-                            conn = get_connection()
-                            if not conn:
-                                st.error("DB connection failed.")
-                            else:
-                                try:
-                                    cur = conn.cursor()
-                                    so_row = so_to_ship[so_to_ship["so_id"] == soid].iloc[0]
-                                    whid = int(so_row["warehouse_id"])
-                                    if check_stock:
-                                        for _, r in lines.iterrows():
-                                            item_id = int(r["item_id"])
-                                            qty = int(r["quantity"])
-                                            cur.execute("SELECT quantity FROM stock WHERE warehouse_id = %s AND item_id = %s", (whid, item_id))
-                                            row = cur.fetchone()
-                                            available = int(row[0]) if row else 0
-                                            if available < qty:
-                                                st.error(f"Insufficient stock for item {item_id}. Available {available}, requested {qty}. Aborting.")
-                                                cur.close()
-                                                conn.close()
-                                                return
-                                    for _, r in lines.iterrows():
-                                        item_id = int(r["item_id"])
-                                        qty = int(r["quantity"])
-                                        cur.execute("SELECT quantity FROM stock WHERE warehouse_id = %s AND item_id = %s", (whid, item_id))
-                                        row = cur.fetchone()
-                                        if row:
-                                            new_qty = int(row[0]) - qty
-                                            cur.execute("UPDATE stock SET quantity = %s, last_updated = %s WHERE warehouse_id = %s AND item_id = %s",
-                                                        (new_qty, datetime.now(), whid, item_id))
-                                        else:
-                                            st.warning(f"No stock row for item {item_id} in warehouse {whid}. Skipping update.")
-                                        try:
-                                            cur.execute(
-                                                "INSERT INTO transaction_log (warehouse_id, item_id, change_type, delta_qty, ref_type, ref_id, emp_id, logged_at) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)",
-                                                (whid, item_id, "OUT", qty, "SO", soid, emp_id, datetime.now())
-                                            )
-                                        except Error:
-                                            pass
-                                    cur.execute("UPDATE sales_order SET status = %s WHERE so_id = %s", ("SHIPPED", soid))
-                                    conn.commit()
-                                    st.success(f"SO {soid} shipped and stock updated.")
-                                except Error as e:
-                                    conn.rollback()
-                                    st.error(f"Failed to ship SO: {e}")
-                                    st.write(traceback.format_exc())
-                                finally:
-                                    cur.close()
-                                    conn.close()
+                        try:
+                            res = services.ship_so(soid, emp_id, check_stock=check_stock)
+                            for item_id in res["skipped"]:
+                                st.warning(f"No stock row for item {item_id} in warehouse {res['warehouse_id']}. Skipping update.")
+                            st.success(f"SO {soid} shipped and stock updated.")
+                        except stock_ops.StockOpError as e:
+                            st.error(str(e))
+                        except Error as e:
+                            st.error(f"Failed to ship SO: {e}")
+                            st.write(traceback.format_exc())
 
 # ---------- ADJUST / RETURN PAGE ----------
 def page_adjust_return():
@@ -1937,9 +2247,9 @@ def page_adjust_return():
     st.markdown("Manual adjustments or processing returns.")
     st.markdown("---")
 
-    warehouses = load_choices("warehouse", "warehouse_id", "name", order_by="name")
-    items = load_choices("item", "item_id", "name", order_by="name")
-    emp_map = load_choices("employee", "emp_id", "name", order_by="name")
+    warehouses = load_choices("warehouse", "warehouse_id", "name", order_by="name", search_key="adj_wh_search")
+    items = load_choices("item", "item_id", "name", order_by="name", search_key="adj_item_search")
+    emp_map = load_choices("employee", "emp_id", "name", order_by="name", search_key="adj_emp_search")
 
     with st.expander("4.1 Manual Stock Adjustment", expanded=False):
         st.markdown("<div class='dbnote'>Writes to <code>stock</code> and <code>transaction_log</code>. "
@@ -1957,33 +2267,14 @@ def page_adjust_return():
                 whid = int(wh.split(" - ")[0])
                 itemid = int(it.split(" - ")[0])
                 empid = int(emp.split(" - ")[0])
-                conn = get_connection()
-                if not conn:
-                    st.error("DB connection failed.")
-                else:
-                    try:
-                        cur = conn.cursor()
-                        cur.execute("SELECT quantity FROM stock WHERE warehouse_id = %s AND item_id = %s", (whid, itemid))
-                        row = cur.fetchone()
-                        if row:
-                            new_qty = int(row[0]) + int(qty)
-                            cur.execute("UPDATE stock SET quantity = %s, last_updated = %s WHERE warehouse_id = %s AND item_id = %s", (new_qty, datetime.now(), whid, itemid))
-                        else:
-                            cur.execute("INSERT INTO stock (warehouse_id, item_id, quantity, last_updated) VALUES (%s,%s,%s,%s)", (whid, itemid, qty, datetime.now()))
-                        try:
-                            cur.execute("INSERT INTO transaction_log (warehouse_id, item_id, change_type, delta_qty, ref_type, ref_id, emp_id, logged_at) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)",
-                                        (whid, itemid, "ADJUST", qty, "MANUAL", None, empid, datetime.now()))
-                        except Error:
-                            pass
-                        conn.commit()
-                        st.success("Stock adjusted.")
-                    except Error as e:
-                        conn.rollback()
-                        st.error(f"Adjustment failed: {e}")
-                        st.write(traceback.format_exc())
-                    finally:
-                        cur.close()
-                        conn.close()
+                try:
+                    services.adjust_stock(whid, itemid, int(qty), emp_id=empid)
+                    st.success("Stock adjusted.")
+                except (stock_ops.StockOpError, ValueError) as e:
+                    st.error(str(e))
+                except Error as e:
+                    st.error(f"Adjustment failed: {e}")
+                    st.write(traceback.format_exc())
             else:
                 st.error("Please pick warehouse, item and employee.")
 
@@ -1997,49 +2288,18 @@ def page_adjust_return():
         if st.button("Process return"):
             whid = int(wh2.split(" - ")[0])
             itemid = int(it2.split(" - ")[0])
-            conn = get_connection()
-            if not conn:
-                st.error("DB connection failed.")
-            else:
-                try:
-                    cur = conn.cursor()
-                    if return_type.startswith("Customer"):
-                        cur.execute("SELECT quantity FROM stock WHERE warehouse_id = %s AND item_id = %s", (whid, itemid))
-                        row = cur.fetchone()
-                        if row:
-                            new_qty = int(row[0]) + int(qty2)
-                            cur.execute("UPDATE stock SET quantity = %s, last_updated = %s WHERE warehouse_id = %s AND item_id = %s", (new_qty, datetime.now(), whid, itemid))
-                        else:
-                            cur.execute("INSERT INTO stock (warehouse_id, item_id, quantity, last_updated) VALUES (%s,%s,%s,%s)", (whid, itemid, qty2, datetime.now()))
-                        try:
-                            cur.execute("INSERT INTO transaction_log (warehouse_id, item_id, change_type, delta_qty, ref_type, ref_id, emp_id, logged_at) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)",
-                                        (whid, itemid, "IN", qty2, "RETURN_CUST", None, None, datetime.now()))
-                        except Error:
-                            pass
-                        conn.commit()
-                        st.success("Customer return processed (stock IN).")
-                    else:
-                        cur.execute("SELECT quantity FROM stock WHERE warehouse_id = %s AND item_id = %s", (whid, itemid))
-                        row = cur.fetchone()
-                        if row:
-                            new_qty = int(row[0]) - int(qty2)
-                            cur.execute("UPDATE stock SET quantity = %s, last_updated = %s WHERE warehouse_id = %s AND item_id = %s", (new_qty, datetime.now(), whid, itemid))
-                        else:
-                            st.warning("No stock row found; negative stock not created.")
-                        try:
-                            cur.execute("INSERT INTO transaction_log (warehouse_id, item_id, change_type, delta_qty, ref_type, ref_id, emp_id, logged_at) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)",
-                                        (whid, itemid, "OUT", qty2, "RETURN_SUPP", None, None, datetime.now()))
-                        except Error:
-                            pass
-                        conn.commit()
-                        st.success("Return to supplier processed (stock OUT).")
-                except Error as e:
-                    conn.rollback()
-                    st.error(f"Return failed: {e}")
-                    st.write(traceback.format_exc())
-                finally:
-                    cur.close()
-                    conn.close()
+            try:
+                if return_type.startswith("Customer"):
+                    services.process_return(whid, itemid, int(qty2), "customer")
+                    st.success("Customer return processed (stock IN).")
+                else:
+                    services.process_return(whid, itemid, int(qty2), "supplier")
+                    st.success("Return to supplier processed (stock OUT).")
+            except (stock_ops.StockOpError, ValueError) as e:
+                st.warning(str(e))
+            except Error as e:
+                st.error(f"Return failed: {e}")
+                st.write(traceback.format_exc())
 
 # ---------- EMPLOYEES PAGE ----------
 def page_employees():
@@ -2069,7 +2329,7 @@ def page_employees():
             options=["Warehouse Manager", "Receiver", "Picker", "Admin", "Clerk", "Auditor", "Supervisor"]
         )
         econtact = st.text_input("Contact (Gmail only, e.g. user@gmail.com)")
-        warehouses = load_choices("warehouse", "warehouse_id", "name", order_by="name")
+        warehouses = load_choices("warehouse", "warehouse_id", "name", order_by="name", search_key="emp_wh_search")
         ewh = st.selectbox("Warehouse (optional)", options=["-- none --"] + [f"{k} - {v}" for k,v in warehouses.items()])
         add_b = st.form_submit_button("➕ Add employee")
         if add_b:
@@ -2087,7 +2347,7 @@ def page_employees():
                         st.success(f"Employee added (id {last}). Refresh the page to see them listed.")
 
     st.markdown("### Delete employee")
-    emp_map = load_choices("employee", "emp_id", "name", order_by="name")
+    emp_map = load_choices("employee", "emp_id", "name", order_by="name", search_key="emp_delete_search")
     emp_sel = st.selectbox("Pick employee to delete", options=["-- select --"] + [f"{k} - {v}" for k,v in emp_map.items()])
     if emp_sel != "-- select --":
         empid = int(emp_sel.split(" - ")[0])
@@ -2096,63 +2356,271 @@ def page_employees():
             st.success("Employee deleted.")
 
 # ---------- REPORTS PAGE ----------
+REPORT_PAGE_SIZE = 50
+
+# order-side SQL per report section: (header table, detail table, id col, date col, party col, party table, party id col)
+REPORT_SIDES = {
+    "purchases": ("purchase_order", "purchase_order_details", "po_id", "po_date", "supplier_id", "supplier", "supplier_id"),
+    "sales": ("sales_order", "sales_order_details", "so_id", "so_date", "customer_id", "customer", "customer_id"),
+}
+
+def report_totals_query(side, start, end):
+    head, det, idc, datec, _, _, _ = REPORT_SIDES[side]
+    return f"""
+        SELECT COUNT(DISTINCT h.{idc}) AS orders, COUNT(*) AS `lines`,
+               IFNULL(SUM(d.quantity), 0) AS units, IFNULL(SUM(d.quantity * d.price), 0) AS total
+        FROM {head} h
+        JOIN {det} d ON d.{idc} = h.{idc}
+        WHERE h.{datec} >= %s AND h.{datec} < %s
+    """, (start, end)
+
+def report_totals(df):
+    """The single aggregate row of report_totals_query() as plain numbers."""
+    if df.empty:
+        return {"orders": 0, "lines": 0, "units": 0, "total": 0.0}
+    row = df.iloc[0]
+    return {"orders": int(row["orders"]), "lines": int(row["lines"]),
+            "units": int(row["units"]), "total": float(row["total"])}
+
+def report_breakdown_query(side, by, start, end):
+    """GROUP BY warehouse or by counterparty (supplier/customer), largest first."""
+    head, det, idc, datec, partyc, party_tbl, party_id = REPORT_SIDES[side]
+    if by == "warehouse":
+        key, join = "h.warehouse_id", "LEFT JOIN warehouse g ON g.warehouse_id = h.warehouse_id"
+    else:
+        key, join = f"h.{partyc}", f"LEFT JOIN {party_tbl} g ON g.{party_id} = h.{partyc}"
+    return f"""
+        SELECT {key} AS id, g.name AS name, COUNT(DISTINCT h.{idc}) AS orders,
+               SUM(d.quantity) AS units, SUM(d.quantity * d.price) AS total
+        FROM {head} h
+        JOIN {det} d ON d.{idc} = h.{idc}
+        {join}
+        WHERE h.{datec} >= %s AND h.{datec} < %s
+        GROUP BY {key}, g.name
+        ORDER BY total DESC
+    """, (start, end)
+
+def show_order_page(side, start, end, state_key):
+    """Keyset-paginated (id DESC) order headers for the month; loaded only when asked for."""
+    head, _, idc, datec, partyc, _, _ = REPORT_SIDES[side]
+    starts = st.session_state.setdefault(state_key, [None])
+    where, params = [f"{datec} >= %s", f"{datec} < %s"], [start, end]
+    if starts[-1] is not None:
+        where.append(f"{idc} < %s")
+        params.append(starts[-1])
+    df = fetch_df(
+        f"SELECT {idc}, {partyc}, warehouse_id, {datec}, status, total_amount FROM {head} "
+        f"WHERE {' AND '.join(where)} ORDER BY {idc} DESC LIMIT %s",
+        tuple(params) + (REPORT_PAGE_SIZE + 1,), cache=True
+    )
+    if df.empty:
+        st.write("No orders in this month.")
+        return
+    has_next = len(df) > REPORT_PAGE_SIZE
+    df = df.head(REPORT_PAGE_SIZE)
+    st.caption(f"Page {len(starts)}")
+    st.dataframe(df, use_container_width=True)
+    c1, c2, _ = st.columns([1,1,6])
+    with c1:
+        if st.button("◀ Previous", disabled=len(starts) == 1, key=f"{state_key}_prev"):
+            starts.pop()
+            safe_rerun()
+    with c2:
+        if st.button("Next ▶", disabled=not has_next, key=f"{state_key}_next"):
+            starts.append(int(df.iloc[-1][idc]))
+            safe_rerun()
+
 def page_reports():
     st.header(" Reports")
     st.markdown("Enter month (YYYY-MM) to compute basic P&L and list POs/SOs.")
     st.markdown("---")
     month = st.text_input("Enter month (YYYY-MM)", value=datetime.today().strftime("%Y-%m"), key="report_month")
     if st.button("Generate report"):
-        try:
-            start = datetime.strptime(month + "-01", "%Y-%m-%d")
-            if start.month == 12:
-                end = datetime(start.year + 1, 1, 1)
-            else:
-                end = datetime(start.year, start.month + 1, 1)
-            purchases_q = """
-            SELECT po.po_id, pod.item_id, pod.quantity, pod.price, pod.quantity * pod.price AS line_total
-            FROM purchase_order po
-            JOIN purchase_order_details pod ON po.po_id = pod.po_id
-            WHERE po.po_date >= %s AND po.po_date < %s
-            """
-            pur_lines = fetch_df(purchases_q, (start, end))
-            total_purchases = float(pur_lines["line_total"].sum()) if not pur_lines.empty else 0.0
+        st.session_state["report_month_active"] = month
+        for k in ("report_po_pages", "report_so_pages"):
+            st.session_state.pop(k, None)
+    active = st.session_state.get("report_month_active")
+    if not active:
+        return
+    try:
+        start = datetime.strptime(active + "-01", "%Y-%m-%d")
+        if start.month == 12:
+            end = datetime(start.year + 1, 1, 1)
+        else:
+            end = datetime(start.year, start.month + 1, 1)
+        report_t0 = time.perf_counter()
+
+        # movements come from the tlog_daily rollup, never from the raw transaction_log;
+        # the page only reads it (rollups.py update folds from cron) and shows how far behind it is
+        res = fetch_dfs({
+            "pur": report_totals_query("purchases", start, end),
+            "sal": report_totals_query("sales", start, end),
+            "salaries": ("SELECT IFNULL(SUM(monthly_salary), 0) AS salaries FROM employee", None),
+            "pur_wh": report_breakdown_query("purchases", "warehouse", start, end),
+            "pur_party": report_breakdown_query("purchases", "party", start, end),
+            "sal_wh": report_breakdown_query("sales", "warehouse", start, end),
+            "sal_party": report_breakdown_query("sales", "party", start, end),
+            "mv": ("""
+                SELECT d.warehouse_id, w.name AS warehouse_name, d.change_type, d.ref_type,
+                       SUM(d.net_qty) AS net_qty, SUM(d.moves) AS moves
+                FROM tlog_daily d
+                LEFT JOIN warehouse w ON w.warehouse_id = d.warehouse_id
+                WHERE d.day >= %s AND d.day < %s
+                GROUP BY d.warehouse_id, w.name, d.change_type, d.ref_type
+                ORDER BY d.warehouse_id, d.change_type, d.ref_type
+            """, (start.date(), end.date())),
+            "rollup": ("""
+                SELECT r.last_log_id, r.updated_at,
+                       (SELECT IFNULL(MAX(log_id), 0) FROM transaction_log) AS log_max,
+                       (SELECT COUNT(*) FROM rollup_gap g WHERE g.name = r.name) AS gaps
+                FROM rollup_state r WHERE r.name = %s
+            """, (rollups.ROLLUP_NAME,)),
+        }, cache=True, compact=True)
+
+        # totals are computed in MySQL: one aggregate row per side instead of every line
+        pur = report_totals(res["pur"])
+        sal = report_totals(res["sal"])
+        sal_df = res["salaries"]
+        salaries = float(sal_df.at[0, "salaries"]) if not sal_df.empty else 0.0
+        profit_loss = sal["total"] - pur["total"] - salaries
+
+        st.subheader(f"P&L for {active}")
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Total purchases", f"{pur['total']:.2f}", help=f"{pur['orders']} POs, {pur['lines']} lines")
+        c2.metric("Total sales", f"{sal['total']:.2f}", help=f"{sal['orders']} SOs, {sal['lines']} lines")
+        c3.metric("Salaries", f"{salaries:.2f}", help="SUM(employee.monthly_salary)")
+        c4.metric("Profit/Loss", f"{profit_loss:.2f}")
+        st.markdown("<div class='dbnote'><b>AGGREGATE</b> totals via <code>SUM</code>/<code>COUNT</code> and "
+                    "<b>GROUP BY</b> breakdowns over a <b>JOIN</b> between headers and details.</div>", unsafe_allow_html=True)
+
+        st.subheader("Breakdown")
+        b1, b2 = st.columns(2)
+        with b1:
+            st.markdown("**Purchases by warehouse**")
+            st.dataframe(res["pur_wh"], use_container_width=True)
+            st.markdown("**Purchases by supplier**")
+            st.dataframe(res["pur_party"], use_container_width=True)
+        with b2:
+            st.markdown("**Sales by warehouse**")
+            st.dataframe(res["sal_wh"], use_container_width=True)
+            st.markdown("**Sales by customer**")
+            st.dataframe(res["sal_party"], use_container_width=True)
+
+        st.subheader("Stock movements")
+        lag = res["rollup"]
+        if lag.empty:
+            st.warning("The movement rollup has not been built yet: run python rollups.py backfill.")
+        else:
+            behind = int(lag.at[0, "log_max"]) - int(lag.at[0, "last_log_id"])
+            if behind > 0 or int(lag.at[0, "gaps"]):
+                st.caption(f"Rollup last updated {lag.at[0, 'updated_at']}: {max(behind, 0)} newer log ids and "
+                           f"{int(lag.at[0, 'gaps'])} pending range(s) are not in these figures yet.")
+        mv = res["mv"]
+        if mv.empty:
+            st.write("No stock movements in this month.")
+        else:
+            st.dataframe(mv, use_container_width=True)
+        st.markdown("<div class='dbnote'>Reads the daily rollup <code>tlog_daily</code> "
+                    "(<b>GROUP BY</b> day, warehouse, item, change type) instead of scanning <code>transaction_log</code>.</div>",
+                    unsafe_allow_html=True)
+        # P&L, breakdowns and movements; the order lists below are paged on demand
+        metrics.REPORT_SECONDS.observe(time.perf_counter() - report_t0, report="monthly")
+
+        st.subheader("Purchase Orders")
+        if st.checkbox("Show purchase orders", key="report_show_po"):
+            show_order_page("purchases", start, end, "report_po_pages")
+        st.subheader("Sales Orders")
+        if st.checkbox("Show sales orders", key="report_show_so"):
+            show_order_page("sales", start, end, "report_so_pages")
+    except Exception as e:
+        st.error(f"Failed to generate report: {e}")
+        st.write(traceback.format_exc())
 
-            sales_q = """
-            SELECT so.so_id, sod.item_id, sod.quantity, sod.price, sod.quantity * sod.price AS line_total
-            FROM sales_order so
-            JOIN sales_order_details sod ON so.so_id = sod.so_id
-            WHERE so.so_date >= %s AND so.so_date < %s
+    with st.expander("Item movement lookup", expanded=False):
+        items = load_choices("item", "item_id", "name", order_by="name", search_key="mv_item_search")
+        warehouses = load_choices("warehouse", "warehouse_id", "name", order_by="name", search_key="mv_wh_search")
+        c1, c2, c3, c4 = st.columns(4)
+        with c1:
+            it = st.selectbox("Item", options=[f"{k} - {v}" for k,v in items.items()], key="mv_item")
+        with c2:
+            wh = st.selectbox("Warehouse", options=["All"] + [f"{k} - {v}" for k,v in warehouses.items()], key="mv_wh")
+        with c3:
+            d_from = st.date_input("From", value=datetime.today().replace(day=1), key="mv_from")
+        with c4:
+            d_to = st.date_input("To (inclusive)", value=datetime.today(), key="mv_to")
+        if it and st.button("Look up movements", key="mv_go"):
+            q = """
+                SELECT d.change_type, d.ref_type, SUM(d.net_qty) AS net_qty, SUM(d.moves) AS moves
+                FROM tlog_daily d
+                WHERE d.item_id = %s AND d.day >= %s AND d.day <= %s
             """
-            sales_lines = fetch_df(sales_q, (start, end))
-            total_sales = float(sales_lines["line_total"].sum()) if not sales_lines.empty else 0.0
-
-            salaries = 0.0
-            profit_loss = total_sales - total_purchases - salaries
-
-            st.metric("Total purchases", f"{total_purchases:.2f}")
-            st.metric("Total sales", f"{total_sales:.2f}")
-            st.metric("Profit/Loss", f"{profit_loss:.2f}")
-            st.markdown("<div class='dbnote'><b>AGGREGATE</b> totals via <code>SUM</code>; tables above use <b>JOIN</b> between headers and details.</div>", unsafe_allow_html=True)
-
-            st.subheader("Purchase Orders")
-            po_df = fetch_df("SELECT po_id, supplier_id, warehouse_id, po_date, status FROM purchase_order WHERE po_date >= %s AND po_date < %s", (start, end))
-            if po_df.empty:
-                st.write("No POs in this month.")
+            params = [int(it.split(" - ")[0]), d_from, d_to]
+            if wh != "All":
+                q += " AND d.warehouse_id = %s"
+                params.append(int(wh.split(" - ")[0]))
+            q += " GROUP BY d.change_type, d.ref_type ORDER BY d.change_type, d.ref_type"
+            res = fetch_df(q, tuple(params))
+            if res.empty:
+                st.write("No movements for this item in the selected range.")
             else:
-                st.dataframe(po_df, use_container_width=True)
-            st.subheader("Sales Orders")
-            so_df = fetch_df("SELECT so_id, customer_id, warehouse_id, so_date, status FROM sales_order WHERE so_date >= %s AND so_date < %s", (start, end))
-            if so_df.empty:
-                st.write("No SOs in this month.")
+                st.dataframe(res, use_container_width=True)
+
+    if (st.session_state.get("user") or {}).get("role") == "admin":
+        show_export_panel()
+
+# files larger than this are left on the server instead of offered for download
+# (the download button holds the whole file in memory)
+EXPORT_DOWNLOAD_MAX_BYTES = 200 * 1024 * 1024
+
+def show_export_panel():
+    with st.expander("Export (CSV / Parquet)", expanded=False):
+        st.markdown("<div class='dbnote'>Streams rows through an unbuffered (server-side) cursor in chunks of "
+                    f"{exporter.CHUNK_ROWS} and appends each chunk to the file, so memory stays flat for any range.</div>",
+                    unsafe_allow_html=True)
+        warehouses = load_choices("warehouse", "warehouse_id", "name", order_by="name", search_key="exp_wh_search")
+        c1, c2, c3, c4, c5 = st.columns([3,2,2,3,2])
+        with c1:
+            dataset = st.selectbox("Data", options=list(exporter.DATASETS),
+                                   format_func=lambda k: exporter.DATASETS[k].label, key="exp_dataset")
+        with c2:
+            d_from = st.date_input("From", value=datetime.today().replace(day=1), key="exp_from")
+        with c3:
+            d_to = st.date_input("To (inclusive)", value=datetime.today(), key="exp_to")
+        with c4:
+            wh = st.selectbox("Warehouse", options=["All"] + [f"{k} - {v}" for k,v in warehouses.items()], key="exp_wh")
+        with c5:
+            fmt = st.selectbox("Format", options=list(exporter.FORMATS), key="exp_fmt")
+        if st.button("Export", key="exp_go"):
+            if d_to < d_from:
+                st.error("'To' is before 'From'.")
             else:
-                st.dataframe(so_df, use_container_width=True)
-        except Exception as e:
-            st.error(f"Failed to generate report: {e}")
-            st.write(traceback.format_exc())
+                bar = st.progress(0.0, text="Starting export...")
+                def report(rows, fraction):
+                    bar.progress(fraction if fraction is not None else 0.0, text=f"{rows:,} rows written")
+                try:
+                    res = exporter.export(dataset, datetime.combine(d_from, datetime.min.time()),
+                                          datetime.combine(d_to + timedelta(days=1), datetime.min.time()),
+                                          None if wh == "All" else int(wh.split(" - ")[0]), fmt, progress=report)
+                    bar.progress(1.0, text=f"{res['rows']:,} rows written")
+                    st.session_state["last_export"] = res
+                except Error as e:
+                    metrics.db_error("export")
+                    st.error(f"Export failed: {e}")
+                except RuntimeError as e:
+                    st.error(str(e))
+        res = st.session_state.get("last_export")
+        if res and os.path.exists(res["path"]):
+            st.write(f"{res['rows']:,} rows, {res['bytes'] / 1024 / 1024:.1f} MiB in {res['seconds']:.1f}s")
+            if res["bytes"] <= EXPORT_DOWNLOAD_MAX_BYTES:
+                with open(res["path"], "rb") as f:
+                    st.download_button("Download", f, file_name=os.path.basename(res["path"]), key="exp_download")
+            else:
+                st.info(f"Too large to download through the browser; the file is on the server at {os.path.abspath(res['path'])}.")
 
 # ---------- MAIN NAV ----------
 def main():
     st.title(" Inventory & Warehouse Management")
+    metrics.start_exporter()
 
     # If not logged-in, show only the login page
     if not st.session_state.get("user"):
@@ -2161,7 +2629,28 @@ def main():
             return
 
     # From here onwards, user is logged in
+    is_admin = (st.session_state.get("user") or {}).get("role") == "admin"
+    # armed by "Profile next rerun" in an earlier rerun (read before the panel can re-arm it)
+    sample_rerun = st.session_state.pop("render_profile_armed", False) and is_admin
     show_sidebar_user_widget()
+    show_admin_diagnostics()
+
+    # admin-only statement profiling for this rerun (see query_profiler.py)
+    profiling = is_admin and st.session_state.get("profile_queries", False)
+    if profiling:
+        query_profiler.start()
+    sampler = render_profiler.Sampler().start() if sample_rerun else None
+    try:
+        show_page()
+    finally:
+        capture = sampler.stop() if sampler is not None else None
+        records = query_profiler.stop()
+        if capture is not None:
+            show_render_capture(capture)
+        if profiling:
+            show_query_profile(records)
+
+def show_page():
 
     # determine menu items based on login (fallback to limited preview)
     if st.session_state.get("user") and st.session_state["user"].get("menu"):
@@ -2177,7 +2666,10 @@ def main():
 
     # Sidebar navigation
     menu = st.sidebar.radio("Go to", menu_options)
+    with metrics.page(menu):
+        dispatch_page(menu)
 
+def dispatch_page(menu):
     try:
         if menu == "Stock":
             page_stock()
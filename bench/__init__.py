@@ -0,0 +1,4 @@
+# bench/
+# Data generation and benchmarking tools; run from the repository root, e.g.
+#   python -m bench.datagen --scale 1
+#   python -m bench.benchmark --save local
@@ -0,0 +1,446 @@
+# bench/benchmark.py
+# Latency benchmark of the queries each page runs and of the stock write paths, against
+# the database in config.DB_CONFIG (use a local MySQL loaded with bench.datagen).
+# For every case it reports p50/p90/p99 latency, the rows the server actually read
+# (Handler_read* counters) and the optimizer's row estimate / access types from EXPLAIN.
+# Results can be saved as a baseline JSON under bench/baselines/ and compared later:
+#
+#   python -m bench.benchmark --save local          # record bench/baselines/local.json
+#   python -m bench.benchmark --compare local       # exit 2 when a case regressed
+#   python -m bench.benchmark --only stock_ --iterations 50
+#
+# Write cases run inside a transaction that is rolled back, so the dataset stays the same
+# from run to run (commit/fsync cost is therefore not included).
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+from mysql.connector import Error
+
+import db
+import order_totals
+import stock_history
+import stock_ops
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+# a case regresses when p50 or rows read grow by more than this share ...
+DEFAULT_TOLERANCE = 0.25
+# ... and p50 by more than this many milliseconds (filters out timer noise on fast queries)
+MIN_REGRESSION_MS = 2.0
+
+HANDLER_READS = ("Handler_read_first", "Handler_read_key", "Handler_read_last",
+                 "Handler_read_next", "Handler_read_prev", "Handler_read_rnd", "Handler_read_rnd_next")
+
+
+# ---------- CONTEXT ----------
+def _one(cur, sql, params=()):
+    cur.execute(sql, params)
+    row = cur.fetchone()
+    cur.fetchall()
+    if row is None or row[0] is None:
+        raise LookupError("dataset has no rows for: " + " ".join(sql.split())[:120])
+    return row
+
+
+def load_context(conn):
+    """Pick representative parameters from the loaded data (busiest warehouse, hot SKU, ...)."""
+    cur = conn.cursor()
+    try:
+        ctx = {}
+        ctx["warehouse_id"] = int(_one(cur, "SELECT warehouse_id FROM stock GROUP BY warehouse_id ORDER BY COUNT(*) DESC LIMIT 1")[0])
+        ctx["category"] = _one(cur, "SELECT category FROM item WHERE category IS NOT NULL GROUP BY category ORDER BY COUNT(*) DESC LIMIT 1")[0]
+        ctx["name_prefix"] = (_one(cur, "SELECT name FROM item ORDER BY item_id LIMIT 1")[0] or "")[:6]
+        ctx["item_id"] = int(_one(cur, "SELECT item_id FROM sales_order_details GROUP BY item_id ORDER BY COUNT(*) DESC LIMIT 1")[0])
+        n = int(_one(cur, "SELECT COUNT(*) FROM stock WHERE warehouse_id = %s", (ctx["warehouse_id"],))[0])
+        mid = _one(cur, "SELECT warehouse_id, item_id FROM stock WHERE warehouse_id = %s ORDER BY item_id LIMIT 1 OFFSET %s",
+                   (ctx["warehouse_id"], n // 2))
+        ctx["mid_key"] = (int(mid[0]), int(mid[1]))
+        last = _one(cur, "SELECT MAX(po_date) FROM purchase_order")[0]
+        month_start = datetime(last.year, last.month, 1) - timedelta(days=1)
+        ctx["month"] = (datetime(month_start.year, month_start.month, 1), datetime(last.year, last.month, 1))
+        ctx["as_of"] = datetime.combine(last, datetime.min.time()) - timedelta(days=3)
+        ctx["big_po"] = int(_one(cur, """
+            SELECT po.po_id FROM purchase_order po JOIN purchase_order_details d ON d.po_id = po.po_id
+            WHERE po.status IN ('CREATED','APPROVED') GROUP BY po.po_id ORDER BY COUNT(*) DESC LIMIT 1""")[0])
+        ctx["small_po"] = int(_one(cur, """
+            SELECT po.po_id FROM purchase_order po JOIN purchase_order_details d ON d.po_id = po.po_id
+            WHERE po.status IN ('CREATED','APPROVED') GROUP BY po.po_id HAVING COUNT(*) BETWEEN 3 AND 10
+            ORDER BY po.po_id DESC LIMIT 1""")[0])
+        cur.execute("SELECT po_id FROM purchase_order WHERE status IN ('CREATED','APPROVED') ORDER BY po_id DESC LIMIT 20")
+        ctx["po_batch"] = [int(r[0]) for r in cur.fetchall()]
+        cur.execute("""
+            SELECT item_id FROM item WHERE item_id NOT IN
+              (SELECT item_id FROM purchase_order_details WHERE po_id = %s)
+            ORDER BY item_id LIMIT 100""", (ctx["small_po"],))
+        ctx["free_items"] = [int(r[0]) for r in cur.fetchall()]
+        # an open SO with several lines that current stock can fill
+        ctx["so_id"] = int(_one(cur, """
+            SELECT so.so_id FROM sales_order so
+            WHERE so.status IN ('NEW','CONFIRMED')
+              AND (SELECT COUNT(*) FROM sales_order_details d WHERE d.so_id = so.so_id) >= 3
+              AND NOT EXISTS (
+                SELECT 1 FROM sales_order_details d
+                LEFT JOIN stock s ON s.warehouse_id = so.warehouse_id AND s.item_id = d.item_id
+                WHERE d.so_id = so.so_id AND IFNULL(s.quantity, 0) < d.quantity)
+            ORDER BY so.so_id DESC LIMIT 1""")[0])
+        ctx["emp_id"] = int(_one(cur, "SELECT MIN(emp_id) FROM employee")[0])
+        return ctx
+    finally:
+        cur.close()
+
+
+# ---------- READ CASES ----------
+# Each returns (sql, params); the SQL mirrors the page that issues it.
+def _stock_grid(ctx, where="", params=(), after=None):
+    q = """
+    SELECT s.warehouse_id, w.name AS warehouse_name,
+           i.item_id, i.name AS item_name, i.category, s.quantity, i.unit_of_measure, i.price, i.reorder_level,
+           CASE WHEN s.quantity < i.reorder_level THEN 'LOW' ELSE 'OK' END AS status
+    FROM stock s
+    JOIN item i ON s.item_id = i.item_id
+    LEFT JOIN warehouse w ON s.warehouse_id = w.warehouse_id
+    """
+    conds, params = ([where] if where else []), list(params)
+    if after is not None:
+        conds.append("(s.warehouse_id > %s OR (s.warehouse_id = %s AND s.item_id > %s))")
+        params += [after[0], after[0], after[1]]
+    if conds:
+        q += " WHERE " + " AND ".join(conds)
+    return q + " ORDER BY s.warehouse_id, s.item_id LIMIT 100", tuple(params)
+
+
+def _report_totals(side):
+    def build(ctx):
+        head, det, idc, datec = {
+            "purchases": ("purchase_order", "purchase_order_details", "po_id", "po_date"),
+            "sales": ("sales_order", "sales_order_details", "so_id", "so_date"),
+        }[side]
+        return f"""
+            SELECT COUNT(DISTINCT h.{idc}) AS orders, COUNT(*) AS `lines`,
+                   IFNULL(SUM(d.quantity), 0) AS units, IFNULL(SUM(d.quantity * d.price), 0) AS total
+            FROM {head} h
+            JOIN {det} d ON d.{idc} = h.{idc}
+            WHERE h.{datec} >= %s AND h.{datec} < %s
+        """, ctx["month"]
+    return build
+
+
+def _report_breakdown(side, by):
+    def build(ctx):
+        head, det, idc, datec, partyc, party_tbl, party_id = {
+            "purchases": ("purchase_order", "purchase_order_details", "po_id", "po_date", "supplier_id", "supplier", "supplier_id"),
+            "sales": ("sales_order", "sales_order_details", "so_id", "so_date", "customer_id", "customer", "customer_id"),
+        }[side]
+        if by == "warehouse":
+            key, join = "h.warehouse_id", "LEFT JOIN warehouse g ON g.warehouse_id = h.warehouse_id"
+        else:
+            key, join = f"h.{partyc}", f"LEFT JOIN {party_tbl} g ON g.{party_id} = h.{partyc}"
+        return f"""
+            SELECT {key} AS id, g.name AS name, COUNT(DISTINCT h.{idc}) AS orders,
+                   SUM(d.quantity) AS units, SUM(d.quantity * d.price) AS total
+            FROM {head} h
+            JOIN {det} d ON d.{idc} = h.{idc}
+            {join}
+            WHERE h.{datec} >= %s AND h.{datec} < %s
+            GROUP BY {key}, g.name
+            ORDER BY total DESC
+        """, ctx["month"]
+    return build
+
+
+READ_CASES = {
+    # page_stock
+    "stock_grid_first_page": lambda ctx: _stock_grid(ctx),
+    "stock_grid_deep_page": lambda ctx: _stock_grid(ctx, after=ctx["mid_key"]),
+    "stock_grid_wh_category": lambda ctx: _stock_grid(ctx, "s.warehouse_id = %s AND i.category = %s",
+                                                      (ctx["warehouse_id"], ctx["category"])),
+    "stock_grid_name_prefix": lambda ctx: _stock_grid(ctx, "i.name LIKE %s", (ctx["name_prefix"] + "%",)),
+    "stock_grid_low_only": lambda ctx: _stock_grid(
+        ctx, "s.warehouse_id = %s AND EXISTS (SELECT 1 FROM low_stock ls WHERE ls.warehouse_id = s.warehouse_id AND ls.item_id = s.item_id)",
+        (ctx["warehouse_id"],)),
+    "stock_count_warehouse": lambda ctx: ("SELECT COUNT(*) AS total FROM stock s WHERE s.warehouse_id = %s", (ctx["warehouse_id"],)),
+    "low_stock_panel": lambda ctx: ("""
+        SELECT ls.warehouse_id, w.name AS warehouse_name, ls.item_id, i.name AS item_name,
+               ls.quantity, ls.reorder_level, ls.shortfall
+        FROM low_stock ls
+        JOIN item i ON i.item_id = ls.item_id
+        LEFT JOIN warehouse w ON w.warehouse_id = ls.warehouse_id
+        ORDER BY ls.shortfall DESC, ls.warehouse_id DESC, ls.item_id DESC
+        LIMIT 501
+    """, ()),
+    "low_stock_count": lambda ctx: ("SELECT COUNT(*) AS total FROM low_stock", ()),
+    "stock_as_of_warehouse": lambda ctx: stock_history.stock_as_of_query(
+        ctx["warehouse_id"], ctx["as_of"], None, stock_history.latest_checkpoint(ctx["as_of"])),
+    "item_pick_list": lambda ctx: ("SELECT item_id, name FROM item ORDER BY name LIMIT 300000", ()),
+    # page_purchase / page_sales
+    "po_receive_list": lambda ctx: ("SELECT po_id, supplier_id, warehouse_id, po_date, status FROM purchase_order "
+                                    "WHERE status IN ('CREATED','APPROVED','PARTIAL') ORDER BY po_id DESC", ()),
+    "so_ship_list": lambda ctx: ("SELECT so_id, customer_id, warehouse_id, so_date, status FROM sales_order "
+                                 "WHERE status IN ('NEW','CONFIRMED') ORDER BY so_id DESC", ()),
+    "po_picker": lambda ctx: ("SELECT po_id, supplier_id, warehouse_id, po_date, status FROM purchase_order "
+                              "ORDER BY po_id DESC LIMIT %s", (200,)),
+    "so_picker": lambda ctx: ("SELECT so_id, customer_id, warehouse_id, so_date, status FROM sales_order "
+                              "ORDER BY so_id DESC LIMIT %s", (200,)),
+    "po_lines": lambda ctx: ("""
+        SELECT pod.po_detail_id, pod.item_id, i.name AS item_name, pod.quantity, pod.price,
+               (pod.quantity * pod.price) AS line_total
+        FROM purchase_order_details pod
+        JOIN item i ON pod.item_id = i.item_id
+        WHERE pod.po_id = %s
+    """, (ctx["big_po"],)),
+    # page_reports
+    "report_purchase_totals": _report_totals("purchases"),
+    "report_sales_totals": _report_totals("sales"),
+    "report_purchases_by_warehouse": _report_breakdown("purchases", "warehouse"),
+    "report_sales_by_customer": _report_breakdown("sales", "party"),
+    "report_salaries": lambda ctx: ("SELECT IFNULL(SUM(monthly_salary), 0) AS salaries FROM employee", ()),
+    "report_movements": lambda ctx: ("""
+        SELECT d.warehouse_id, w.name AS warehouse_name, d.change_type, d.ref_type,
+               SUM(d.net_qty) AS net_qty, SUM(d.moves) AS moves
+        FROM tlog_daily d
+        LEFT JOIN warehouse w ON w.warehouse_id = d.warehouse_id
+        WHERE d.day >= %s AND d.day < %s
+        GROUP BY d.warehouse_id, w.name, d.change_type, d.ref_type
+        ORDER BY d.warehouse_id, d.change_type, d.ref_type
+    """, (ctx["month"][0].date(), ctx["month"][1].date())),
+    "report_order_page": lambda ctx: ("SELECT so_id, customer_id, warehouse_id, so_date, status, total_amount FROM sales_order "
+                                      "WHERE so_date >= %s AND so_date < %s ORDER BY so_id DESC LIMIT %s",
+                                      ctx["month"] + (51,)),
+}
+
+
+# ---------- WRITE CASES ----------
+# Each runs one write path on `conn`; the harness rolls it back afterwards.
+WRITE_CASES = {
+    "receive_po_small": lambda conn, ctx: stock_ops.receive_po(conn, ctx["small_po"], ctx["emp_id"]),
+    "receive_po_large": lambda conn, ctx: stock_ops.receive_po(conn, ctx["big_po"], ctx["emp_id"]),
+    "receive_pos_batch_20": lambda conn, ctx: stock_ops.receive_pos_batch(conn, ctx["po_batch"], ctx["emp_id"]),
+    "ship_so": lambda conn, ctx: stock_ops.ship_so(conn, ctx["so_id"], ctx["emp_id"]),
+    "adjust_hot_sku": lambda conn, ctx: stock_ops.adjust_stock(conn, ctx["warehouse_id"], ctx["item_id"], 1, ctx["emp_id"]),
+    "add_po_lines_bulk_100": lambda conn, ctx: order_totals.insert_lines(
+        conn, "purchase", [(ctx["small_po"], i, 1, 1.00) for i in ctx["free_items"]]),
+}
+
+
+# ---------- MEASUREMENT ----------
+def _handler_reads(cur):
+    cur.execute("SHOW SESSION STATUS LIKE 'Handler_read%'")
+    vals = dict(cur.fetchall())
+    return sum(int(vals.get(k, 0)) for k in HANDLER_READS)
+
+
+def _explain(cur, sql, params):
+    cur.execute("EXPLAIN " + sql, params)
+    cols = [d[0] for d in cur.description]
+    rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+    return {
+        "explain_rows": int(sum(int(r.get("rows") or 0) for r in rows)),
+        "full_scans": sorted({r["table"] for r in rows if r.get("type") == "ALL" and r.get("table")}),
+        "plan": [f"{r.get('table')}:{r.get('type')}:{r.get('key')}" for r in rows],
+    }
+
+
+def percentile(values, p):
+    s = sorted(values)
+    if not s:
+        return 0.0
+    k = (len(s) - 1) * p
+    lo = int(k)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+def _summary(times_ms):
+    return {
+        "p50_ms": round(percentile(times_ms, 0.50), 3),
+        "p90_ms": round(percentile(times_ms, 0.90), 3),
+        "p99_ms": round(percentile(times_ms, 0.99), 3),
+        "max_ms": round(max(times_ms), 3),
+        "mean_ms": round(sum(times_ms) / len(times_ms), 3),
+        "runs": len(times_ms),
+    }
+
+
+def run_read_case(conn, build, ctx, iterations, warmup):
+    sql, params = build(ctx)
+    cur = conn.cursor()
+    try:
+        # SHOW STATUS reads a few rows itself; measure that and subtract it
+        base = _handler_reads(cur)
+        overhead = _handler_reads(cur) - base
+        before = _handler_reads(cur)
+        cur.execute(sql, params)
+        rows = len(cur.fetchall())
+        rows_read = _handler_reads(cur) - before - overhead
+        for _ in range(warmup):
+            cur.execute(sql, params)
+            cur.fetchall()
+        times = []
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            cur.execute(sql, params)
+            cur.fetchall()
+            times.append((time.perf_counter() - t0) * 1000.0)
+        out = _summary(times)
+        out.update({"rows_returned": rows, "rows_read": max(0, rows_read)})
+        out.update(_explain(cur, sql, params))
+        return out
+    finally:
+        cur.close()
+
+
+def run_write_case(conn, fn, ctx, iterations, warmup):
+    cur = conn.cursor()
+    try:
+        times, rows_read = [], None
+        for i in range(warmup + iterations):
+            conn.rollback()
+            before = _handler_reads(cur)
+            t0 = time.perf_counter()
+            fn(conn, ctx)
+            elapsed = (time.perf_counter() - t0) * 1000.0
+            if rows_read is None:
+                rows_read = _handler_reads(cur) - before
+            conn.rollback()
+            if i >= warmup:
+                times.append(elapsed)
+        out = _summary(times)
+        out["rows_read"] = max(0, rows_read or 0)
+        return out
+    finally:
+        cur.close()
+
+
+def run(only=None, iterations=20, warmup=2, progress=print):
+    conn = db.get_connection()
+    try:
+        ctx = load_context(conn)
+        cur = conn.cursor()
+        try:
+            meta = {"taken_at": datetime.now().isoformat(timespec="seconds"),
+                    "server": _one(cur, "SELECT VERSION()")[0], "iterations": iterations}
+            for t in ("stock", "transaction_log", "purchase_order_details", "sales_order_details", "item"):
+                # estimated row counts are enough to tell datasets apart
+                meta[f"{t}_rows"] = int(_one(cur, "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                                                  "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (t,))[0] or 0)
+        finally:
+            cur.close()
+        conn.rollback()
+        pattern = re.compile(only) if only else None
+        cases = {}
+        for name, build in READ_CASES.items():
+            if pattern and not pattern.search(name):
+                continue
+            try:
+                cases[name] = run_read_case(conn, build, ctx, iterations, warmup)
+            except Error as e:
+                cases[name] = {"error": str(e)}
+            progress(_line(name, cases[name]))
+        for name, fn in WRITE_CASES.items():
+            if pattern and not pattern.search(name):
+                continue
+            try:
+                cases[name] = run_write_case(conn, fn, ctx, iterations, warmup)
+            except (Error, stock_ops.StockOpError) as e:
+                conn.rollback()
+                cases[name] = {"error": str(e)}
+            progress(_line(name, cases[name]))
+        return {"meta": meta, "context": {k: str(v) for k, v in ctx.items()}, "cases": cases}
+    finally:
+        conn.close()
+
+
+# ---------- BASELINES ----------
+def _line(name, r):
+    if "error" in r:
+        return f"{name:32s} ERROR {r['error']}"
+    extra = f"  est {r['explain_rows']:>9}  {','.join(r['full_scans']) or '-'}" if "explain_rows" in r else ""
+    return (f"{name:32s} p50 {r['p50_ms']:9.2f}  p90 {r['p90_ms']:9.2f}  p99 {r['p99_ms']:9.2f} ms"
+            f"  read {r['rows_read']:>9}{extra}")
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save_baseline(result, name):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    with open(baseline_path(name), "w") as f:
+        # sorted, indented, one value per line: baselines diff cleanly under git
+        json.dump(result, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(result, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Returns (report lines, regressed case names)."""
+    lines, regressed = [], []
+    base_cases = baseline.get("cases", {})
+    for name, cur in result["cases"].items():
+        old = base_cases.get(name)
+        if old is None or "error" in old or "error" in cur:
+            lines.append(f"{name:32s} {'new case' if old is None else 'error in run or baseline'}")
+            continue
+        notes = []
+        ratio = cur["p50_ms"] / old["p50_ms"] if old["p50_ms"] else 1.0
+        slower = ratio > 1 + tolerance and cur["p50_ms"] - old["p50_ms"] > MIN_REGRESSION_MS
+        more_rows = cur["rows_read"] > old["rows_read"] * (1 + tolerance) + 10
+        if slower:
+            notes.append(f"p50 x{ratio:.2f}")
+        if more_rows:
+            notes.append(f"rows read {old['rows_read']} -> {cur['rows_read']}")
+        if cur.get("plan") != old.get("plan"):
+            notes.append("plan changed: " + " ".join(cur.get("plan") or []))
+        if slower or more_rows:
+            regressed.append(name)
+        status = "REGRESSED" if name in regressed else ("changed" if notes else "ok")
+        lines.append(f"{name:32s} {status:9s} p50 {old['p50_ms']:.2f} -> {cur['p50_ms']:.2f} ms"
+                     + (f"  ({'; '.join(notes)})" if notes else ""))
+    return lines, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark page queries and stock write paths.")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--only", help="regex; run only matching case names")
+    parser.add_argument("--save", metavar="NAME", help="write the results to bench/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare with bench/baselines/NAME.json")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        try:
+            with open(baseline_path(args.compare)) as f:
+                baseline = json.load(f)
+        except OSError as e:
+            print(f"cannot read baseline: {e}", file=sys.stderr)
+            return 1
+    try:
+        result = run(args.only, args.iterations, args.warmup, progress=lambda m: print(m, flush=True))
+    except Error as e:
+        print(f"benchmark failed: {e}", file=sys.stderr)
+        return 1
+    except LookupError as e:
+        print(f"{e}\nload a dataset first: python -m bench.datagen", file=sys.stderr)
+        return 1
+    if args.save:
+        save_baseline(result, args.save)
+        print(f"saved {baseline_path(args.save)}")
+    if baseline is not None:
+        lines, regressed = compare(result, baseline, args.tolerance)
+        print()
+        print("\n".join(lines))
+        if regressed:
+            print(f"\n{len(regressed)} regressed: {', '.join(regressed)}")
+            return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+# bench/datagen.py
+# Seeded synthetic dataset at warehouse scale: master data, ~1M stock rows, a year of
+# purchase/sales orders and the matching transaction_log, with the skew real traffic
+# has (a few hot SKUs take most of the movements, a long tail of very large POs).
+# The same --seed and --scale always produce the same rows (dates are relative to the
+# day of the run).
+#
+#   python -m bench.datagen --scale 1 --seed 42
+#   python -m bench.datagen --scale 0.05          # small, for a quick smoke run
+#
+# Writes to the database in config.DB_CONFIG: point it at a local MySQL, never production.
+import argparse
+import bisect
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from mysql.connector import Error
+
+import db
+import order_totals
+import rollups
+
+# row counts at --scale 1
+BASE_COUNTS = {
+    "warehouses": 20,
+    "items": 60000,
+    "suppliers": 800,
+    "customers": 25000,
+    "employees": 300,
+    "purchase_orders": 20000,
+    "sales_orders": 100000,
+    "adjustments": 200000,
+}
+STOCK_DENSITY = 0.85     # share of the catalogue each warehouse stocks (hot SKUs always)
+HOT_SHARE = 0.05         # top items by popularity
+ITEM_SKEW = 1.1          # Zipf exponent of item popularity
+WAREHOUSE_SKEW = 0.8
+LOW_STOCK_SHARE = 0.07   # stock rows generated below their reorder level
+OPEN_ORDER_DAYS = 14     # orders newer than this are still open (to receive / ship)
+MAX_PO_LINES = 2000
+MAX_SO_LINES = 200
+CHUNK_ROWS = 5000
+
+CATEGORIES = ["Hardware", "Electrical", "Plumbing", "Packaging", "Tools", "Safety",
+              "Cleaning", "Office", "Automotive", "Garden", "Paint", "Fasteners"]
+UOMS = ["pcs", "pcs", "pcs", "box", "kg", "l", "m"]
+ROLES = ["staff", "staff", "staff", "picker", "picker", "packer", "driver", "manager"]
+
+
+class Skewed:
+    """Zipf-like picker: the value at popularity rank r has weight 1 / r**s."""
+
+    def __init__(self, rng, values, s):
+        self.rng = rng
+        self.values = list(values)
+        # shuffle so hot values are spread over the id range, not the lowest ids
+        rng.shuffle(self.values)
+        self.cum = []
+        acc = 0.0
+        for r in range(1, len(self.values) + 1):
+            acc += 1.0 / r ** s
+            self.cum.append(acc)
+
+    def pick(self, rng=None):
+        return self.values[bisect.bisect_left(self.cum, (rng or self.rng).random() * self.cum[-1])]
+
+    def sample(self, k):
+        """k distinct values, drawn with the same skew (uniform once the head is used up)."""
+        k = min(k, len(self.values))
+        out = set()
+        tries = 0
+        while len(out) < k:
+            out.add(self.pick() if tries < 4 * k else self.rng.choice(self.values))
+            tries += 1
+        return list(out)
+
+    def hot(self, share):
+        return self.values[:max(1, int(len(self.values) * share))]
+
+
+class Generator:
+    def __init__(self, conn, seed, scale, days, progress=print):
+        self.conn = conn
+        self.rng = random.Random(seed)
+        self.tag = f"bench{seed}"
+        self.days = int(days)
+        self.counts = {k: max(1, int(v * scale)) for k, v in BASE_COUNTS.items()}
+        self.progress = progress
+        self.end = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.start = self.end - timedelta(days=self.days)
+
+    # ----- helpers -----
+    def _insert(self, sql, rows):
+        cur = self.conn.cursor()
+        try:
+            for i in range(0, len(rows), CHUNK_ROWS):
+                cur.executemany(sql, rows[i:i + CHUNK_ROWS])
+                self.conn.commit()
+        finally:
+            cur.close()
+
+    def _scalar(self, sql, params=()):
+        cur = self.conn.cursor()
+        try:
+            cur.execute(sql, params)
+            return cur.fetchone()[0]
+        finally:
+            cur.close()
+
+    def _ids_after(self, table, idc, after):
+        cur = self.conn.cursor()
+        try:
+            cur.execute(f"SELECT {idc} FROM {table} WHERE {idc} > %s ORDER BY {idc}", (after,))
+            return [int(r[0]) for r in cur.fetchall()]
+        finally:
+            cur.close()
+
+    def _max_id(self, table, idc):
+        return int(self._scalar(f"SELECT IFNULL(MAX({idc}), 0) FROM {table}"))
+
+    def _insert_new(self, table, idc, sql, rows):
+        before = self._max_id(table, idc)
+        self._insert(sql, rows)
+        return self._ids_after(table, idc, before)
+
+    def _when(self, day):
+        return day + timedelta(seconds=self.rng.randint(6 * 3600, 20 * 3600))
+
+    # ----- master data -----
+    def masters(self):
+        rng, c, tag = self.rng, self.counts, self.tag
+        self.warehouses = self._insert_new(
+            "warehouse", "warehouse_id",
+            "INSERT INTO warehouse (name, city, capacity) VALUES (%s,%s,%s)",
+            [(f"{tag} WH {n:03d}", f"City {n % 7}", rng.randint(50000, 500000)) for n in range(c["warehouses"])],
+        )
+        self.employees = self._insert_new(
+            "employee", "emp_id",
+            "INSERT INTO employee (name, role, contact, warehouse_id, monthly_salary) VALUES (%s,%s,%s,%s,%s)",
+            [(f"{tag} Employee {n:05d}", rng.choice(ROLES), f"{tag}.emp{n}@gmail.com",
+              rng.choice(self.warehouses), round(rng.uniform(1800, 6500), 2)) for n in range(c["employees"])],
+        )
+        item_rows = []
+        for n in range(c["items"]):
+            price = round(min(5000.0, rng.lognormvariate(3.0, 1.0)), 2)
+            item_rows.append((f"{tag} SKU {n:07d}", rng.choice(CATEGORIES), rng.choice(UOMS),
+                              price, rng.choice([0, 10, 20, 25, 50, 100, 200])))
+        self.items = self._insert_new(
+            "item", "item_id",
+            "INSERT INTO item (name, category, unit_of_measure, price, reorder_level) VALUES (%s,%s,%s,%s,%s)",
+            item_rows,
+        )
+        self.price = {i: r[3] for i, r in zip(self.items, item_rows)}
+        self.reorder = {i: r[4] for i, r in zip(self.items, item_rows)}
+        self.suppliers = self._insert_new(
+            "supplier", "supplier_id",
+            "INSERT INTO supplier (name, email, phone) VALUES (%s,%s,%s)",
+            [(f"{tag} Supplier {n:05d}", f"s{n}.{tag}@example.com", f"555-{n:06d}") for n in range(c["suppliers"])],
+        )
+        self.customers = self._insert_new(
+            "customer", "customer_id",
+            "INSERT INTO customer (name, email, phone) VALUES (%s,%s,%s)",
+            [(f"{tag} Customer {n:06d}", f"c{n}.{tag}@example.com", f"555-{n:07d}") for n in range(c["customers"])],
+        )
+        self.item_pick = Skewed(rng, self.items, ITEM_SKEW)
+        self.wh_pick = Skewed(rng, self.warehouses, WAREHOUSE_SKEW)
+        self.supplier_pick = Skewed(rng, self.suppliers, 0.9)
+        self.customer_pick = Skewed(rng, self.customers, 0.9)
+        self.progress(f"master data: {len(self.warehouses)} warehouses, {len(self.items)} items, "
+                      f"{len(self.suppliers)} suppliers, {len(self.customers)} customers, {len(self.employees)} employees")
+
+    # ----- stock -----
+    def stock(self):
+        rng = self.rng
+        hot = set(self.item_pick.hot(HOT_SHARE))
+        sql = "INSERT INTO stock (warehouse_id, item_id, quantity, last_updated) VALUES (%s,%s,%s,%s)"
+        total = 0
+        for wh in self.warehouses:
+            rows = []
+            for item in self.items:
+                if item not in hot and rng.random() > STOCK_DENSITY:
+                    continue
+                level = self.reorder[item]
+                if level and rng.random() < LOW_STOCK_SHARE:
+                    qty = rng.randint(0, level - 1)
+                else:
+                    qty = level + int(rng.lognormvariate(5.0 if item in hot else 3.5, 1.0))
+                rows.append((wh, item, qty, self._when(self.end - timedelta(days=rng.randint(0, self.days)))))
+            self._insert(sql, rows)
+            total += len(rows)
+            self.progress(f"stock: {total} rows")
+        return total
+
+    # ----- orders + log, one day at a time so log_id follows logged_at -----
+    def _po_lines(self):
+        return min(MAX_PO_LINES, max(1, int(self.rng.paretovariate(1.3) * 4)))
+
+    def _so_lines(self):
+        return min(MAX_SO_LINES, max(1, int(self.rng.paretovariate(1.8) * 2)))
+
+    def history(self):
+        rng, c = self.rng, self.counts
+        po_day = c["purchase_orders"] / self.days
+        so_day = c["sales_orders"] / self.days
+        adj_day = c["adjustments"] / self.days
+        log_sql = ("INSERT INTO transaction_log (warehouse_id, item_id, change_type, delta_qty, ref_type, ref_id, emp_id, logged_at) "
+                   "VALUES (%s,%s,%s,%s,%s,%s,%s,%s)")
+        totals = {"purchase_orders": 0, "sales_orders": 0, "log_rows": 0}
+        for d in range(self.days):
+            day = self.start + timedelta(days=d)
+            is_open = (self.end - day).days <= OPEN_ORDER_DAYS
+            growth = 0.6 + 0.8 * d / max(1, self.days - 1)   # traffic grows over the year
+            logs = []
+
+            # purchase orders
+            heads = []
+            for _ in range(max(0, int(round(po_day * growth * rng.uniform(0.7, 1.3))))):
+                r = rng.random()
+                if is_open:
+                    status = "CREATED" if r < 0.6 else "APPROVED"
+                else:
+                    status = "RECEIVED" if r < 0.95 else ("CANCELLED" if r < 0.98 else "APPROVED")
+                heads.append((rng.choice(self.suppliers) if r < 0.2 else self.supplier_pick.pick(),
+                              self.wh_pick.pick(), day.date(), status))
+            if heads:
+                ids = self._insert_new("purchase_order", "po_id",
+                                       "INSERT INTO purchase_order (supplier_id, warehouse_id, po_date, status) VALUES (%s,%s,%s,%s)",
+                                       heads)
+                lines = []
+                for po_id, (_, wh, _, status) in zip(ids, heads):
+                    when = self._when(day)
+                    for item in self.item_pick.sample(self._po_lines()):
+                        qty = int(rng.lognormvariate(3.5, 1.0)) + 1
+                        lines.append((po_id, item, qty, round(float(self.price[item]) * rng.uniform(0.55, 0.8), 2)))
+                        if status == "RECEIVED":
+                            logs.append((wh, item, "IN", qty, "PO", po_id, rng.choice(self.employees), when))
+                order_totals.insert_lines(self.conn, "purchase", lines)
+                self.conn.commit()
+                totals["purchase_orders"] += len(ids)
+
+            # sales orders
+            heads = []
+            for _ in range(max(0, int(round(so_day * growth * rng.uniform(0.7, 1.3))))):
+                r = rng.random()
+                if is_open:
+                    status = "NEW" if r < 0.5 else "CONFIRMED"
+                else:
+                    status = "SHIPPED" if r < 0.93 else ("CANCELLED" if r < 0.97 else "CONFIRMED")
+                heads.append((self.customer_pick.pick(), self.wh_pick.pick(), day.date(), status))
+            if heads:
+                ids = self._insert_new("sales_order", "so_id",
+                                       "INSERT INTO sales_order (customer_id, warehouse_id, so_date, status) VALUES (%s,%s,%s,%s)",
+                                       heads)
+                lines = []
+                for so_id, (_, wh, _, status) in zip(ids, heads):
+                    when = self._when(day)
+                    for item in self.item_pick.sample(self._so_lines()):
+                        qty = int(rng.lognormvariate(1.5, 0.9)) + 1
+                        lines.append((so_id, item, qty, round(float(self.price[item]) * rng.uniform(1.1, 1.4), 2)))
+                        if status == "SHIPPED":
+                            # positive OUT quantity, as the app writes it
+                            logs.append((wh, item, "OUT", qty, "SO", so_id, rng.choice(self.employees), when))
+                order_totals.insert_lines(self.conn, "sales", lines)
+                self.conn.commit()
+                totals["sales_orders"] += len(ids)
+
+            # manual adjustments, concentrated on hot SKUs
+            for _ in range(max(0, int(round(adj_day * growth * rng.uniform(0.7, 1.3))))):
+                delta = rng.choice([-1, -1, -2, -5, 1, 2, 10])
+                logs.append((self.wh_pick.pick(), self.item_pick.pick(), "ADJUST", delta, "MANUAL", None,
+                             rng.choice(self.employees), self._when(day)))
+
+            logs.sort(key=lambda r: r[7])
+            self._insert(log_sql, logs)
+            totals["log_rows"] += len(logs)
+            if d % 30 == 0 or d == self.days - 1:
+                self.progress(f"day {d + 1}/{self.days}: {totals['purchase_orders']} POs, "
+                              f"{totals['sales_orders']} SOs, {totals['log_rows']} log rows")
+        return totals
+
+    def finish(self):
+        cur = self.conn.cursor()
+        try:
+            cur.execute("CALL sp_reevaluate_reorder_alerts(NULL)")
+            self.conn.commit()
+            # fresh index statistics so EXPLAIN row estimates reflect the new volume
+            for t in ("warehouse", "item", "supplier", "customer", "employee", "stock", "low_stock",
+                      "transaction_log", "purchase_order", "purchase_order_details",
+                      "sales_order", "sales_order_details", "reorder_alerts"):
+                cur.execute(f"ANALYZE TABLE {t}")
+                cur.fetchall()
+        finally:
+            cur.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a seeded synthetic inventory dataset.")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier on the base row counts (1 ~ 1M stock rows)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=365, help="days of order and log history")
+    parser.add_argument("--append", action="store_true", help="allow loading into a database that already has stock")
+    parser.add_argument("--skip-rollup", action="store_true", help="do not backfill tlog_daily afterwards")
+    args = parser.parse_args(argv)
+
+    started = time.monotonic()
+    conn = db.get_connection()
+    try:
+        gen = Generator(conn, args.seed, args.scale, args.days, progress=lambda m: print(m, flush=True))
+        existing = int(gen._scalar("SELECT COUNT(*) FROM stock"))
+        if existing > 1000 and not args.append:
+            print(f"stock already has {existing} rows; use --append to load on top of it", file=sys.stderr)
+            return 1
+        if int(gen._scalar("SELECT COUNT(*) FROM item WHERE name LIKE %s", (f"{gen.tag} SKU %",))):
+            print(f"items for seed {args.seed} already exist; pick another --seed", file=sys.stderr)
+            return 1
+        gen.masters()
+        gen.stock()
+        gen.history()
+        gen.finish()
+    except Error as e:
+        print(f"datagen failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    if not args.skip_rollup:
+        try:
+            n = rollups.backfill(progress=lambda t: print(f"rollup: {t} log ids", flush=True))
+        except Error as e:
+            print(f"rollup backfill failed: {e}", file=sys.stderr)
+            return 1
+        print(f"rollup: {n} log ids folded")
+    print(f"done in {time.monotonic() - started:.0f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
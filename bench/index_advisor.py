@@ -0,0 +1,295 @@
+# bench/index_advisor.py
+# EXPLAIN review of the statements the app issues, against the database in
+# config.DB_CONFIG (use a local MySQL loaded with bench.datagen). Statements come from
+#   - the page query catalogue of bench.benchmark (READ_CASES),
+#   - the stock write paths (WRITE_CASES), recorded through query_profiler and rolled back,
+#   - statements saved from profiled reruns in the app (admin "Query profile" panel,
+#     "Save statements for the index advisor" -> bench/captured_queries.jsonl).
+# Each runs through EXPLAIN FORMAT=JSON; full table/index scans over more than --min-rows
+# estimated rows and filesorts are reported, and full scans get a proposed composite
+# index: equality columns of the scanned table first, then one range column or the
+# ORDER BY columns. Proposals already covered by an existing index are left out.
+#
+#   python -m bench.index_advisor                       # findings + proposed indexes
+#   python -m bench.index_advisor --migration out.sql   # write the proposals as DDL
+#   python -m bench.index_advisor --check               # exit 2 on a full scan not in ALLOWED
+import argparse
+import json
+import re
+import sys
+from datetime import datetime
+
+from mysql.connector import Error
+
+import db
+import query_cache
+import query_profiler
+import stock_ops
+from bench.benchmark import READ_CASES, WRITE_CASES, load_context
+
+DEFAULT_MIN_ROWS = 1000
+
+# full scans that are intended; (fingerprint regex, reason)
+ALLOWED = [
+    (r"FROM item ORDER BY name LIMIT", "whole item pick list, read once into the master-data store"),
+    (r"FROM employee$", "salary total over every employee"),
+    (r"FROM low_stock ls .* ORDER BY ls.shortfall DESC", "whole low-stock set by design (bounded by LIMIT)"),
+]
+
+_ALIAS_RE = re.compile(r"\b(?:FROM|JOIN)\s+`?(\w+)`?(?:\s+(?:AS\s+)?`?(\w+)`?)?", re.I)
+_NOT_ALIAS = {"WHERE", "JOIN", "LEFT", "RIGHT", "INNER", "OUTER", "CROSS", "STRAIGHT_JOIN", "ON", "USING",
+              "ORDER", "GROUP", "LIMIT", "HAVING", "PARTITION", "FOR", "UNION", "SET", "NATURAL", "WINDOW"}
+_COND_RE = re.compile(r"`[^`]+`\.`([^`]+)`\.`([^`]+)`\s*(<=>|<=|>=|<>|!=|=|<|>|\bin\b|\bbetween\b|\blike\b)\s*('?)(%?)",
+                      re.I)
+_ORDER_RE = re.compile(r"\bORDER\s+BY\s+(.+?)(?:\bLIMIT\b|\bFOR\s+(?:UPDATE|SHARE)\b|\)|$)", re.I | re.S)
+_EQ_OPS = {"=", "<=>", "in"}
+_RANGE_OPS = {"<", ">", "<=", ">=", "between", "like"}
+
+
+# ---------- STATEMENTS ----------
+def collect(conn, ctx, capture_path=query_profiler.CAPTURE_PATH):
+    """[(name, sql, params)] with one statement per fingerprint."""
+    out, seen = [], set()
+
+    def add(name, sql, params):
+        fp = query_cache.fingerprint(sql)
+        if fp not in seen:
+            seen.add(fp)
+            out.append((name, sql, params))
+
+    for name, build in READ_CASES.items():
+        sql, params = build(ctx)
+        add(name, sql, params)
+    for name, fn in WRITE_CASES.items():
+        query_profiler.start()
+        try:
+            fn(conn, ctx)
+        except (Error, stock_ops.StockOpError):
+            pass
+        finally:
+            records = query_profiler.stop()
+            conn.rollback()
+        for i, r in enumerate(records, 1):
+            if r.kind == "execute" and query_profiler.explainable(r):
+                add(f"{name}#{i}", r.sql, r.params)
+    for c in query_profiler.load_capture(capture_path):
+        add(f"{c['page']}/{c['site']}", c["sql"], c["params"])
+    return out
+
+
+def _aliases(sql):
+    """alias -> table for every FROM/JOIN in the statement (a table is its own alias)."""
+    out = {}
+    for table, alias in _ALIAS_RE.findall(sql):
+        out[table] = table
+        if alias and alias.upper() not in _NOT_ALIAS:
+            out[alias] = table
+    return out
+
+
+def _order_columns(sql):
+    """[(alias or None, column)] of the outermost ORDER BY."""
+    found = _ORDER_RE.findall(sql)
+    if not found:
+        return []
+    cols = []
+    for part in found[-1].split(","):
+        expr = part.strip().split()[0] if part.strip() else ""
+        if not re.fullmatch(r"(\w+\.)?\w+", expr):
+            return []          # expressions / positions: no index order to propose
+        alias, _, col = expr.rpartition(".")
+        cols.append((alias or None, col))
+    return cols
+
+
+# ---------- EXPLAIN ----------
+def _walk(node, tables, flags):
+    if isinstance(node, dict):
+        t = node.get("table")
+        if isinstance(t, dict) and "access_type" in t:
+            tables.append(t)
+        if node.get("using_filesort"):
+            flags.add("filesort")
+        if node.get("using_temporary_table"):
+            flags.add("temporary")
+        for v in node.values():
+            _walk(v, tables, flags)
+    elif isinstance(node, list):
+        for v in node:
+            _walk(v, tables, flags)
+
+
+def explain(cur, sql, params):
+    """Table nodes and query-level flags ('filesort', 'temporary') of EXPLAIN FORMAT=JSON."""
+    cur.execute("EXPLAIN FORMAT=JSON " + sql, params or ())
+    plan = json.loads(cur.fetchone()[0])
+    cur.fetchall()
+    tables, flags = [], set()
+    _walk(plan, tables, flags)
+    return tables, flags
+
+
+def _conditions(node, alias):
+    """(equality columns, range columns) the plan's condition applies to `alias`, in order."""
+    eq, rng = [], []
+    for a, col, op, quote, wildcard in _COND_RE.findall(node.get("attached_condition") or ""):
+        op = op.lower()
+        if a != alias:
+            continue
+        if op in _EQ_OPS and col not in eq:
+            eq.append(col)
+        elif op in _RANGE_OPS and col not in rng and not (op == "like" and quote and wildcard):
+            rng.append(col)
+    return eq, [c for c in rng if c not in eq]
+
+
+def propose(sql, node, existing):
+    """(table, columns) index for a full-scanned table node, or None."""
+    alias = node.get("table_name", "")
+    table = _aliases(sql).get(alias)
+    if table is None:
+        return None                        # derived table / CTE
+    eq, rng = _conditions(node, alias)
+    cols = list(eq)
+    if rng:
+        cols.append(rng[0])
+    else:
+        order = _order_columns(sql)
+        single = len(set(_aliases(sql).values())) == 1
+        if order and all(a == alias or (a is None and single) for a, _ in order):
+            cols += [c for _, c in order if c not in cols]
+    if not cols or _covered(cols, existing.get(table, [])):
+        return None
+    return table, cols
+
+
+# ---------- EXISTING INDEXES ----------
+def existing_indexes(cur):
+    """table -> [column lists], secondary indexes with the primary key columns appended (InnoDB)."""
+    cur.execute(
+        "SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX"
+    )
+    idx = {}
+    for table, name, col in cur.fetchall():
+        idx.setdefault(table, {}).setdefault(name, []).append(col)
+    out = {}
+    for table, by_name in idx.items():
+        pk = by_name.get("PRIMARY", [])
+        out[table] = [cols + [c for c in pk if c not in cols] if name != "PRIMARY" else cols
+                      for name, cols in by_name.items()]
+    return out
+
+
+def _covered(cols, indexes):
+    return any(ix[:len(cols)] == cols for ix in indexes)
+
+
+def index_name(table, cols):
+    return f"ix_{table}_{'_'.join(cols)}"[:64]
+
+
+# ---------- REVIEW ----------
+def _allowed(sql):
+    fp = query_cache.fingerprint(sql)
+    for pattern, reason in ALLOWED:
+        if re.search(pattern, fp):
+            return reason
+    return None
+
+
+def review(min_rows=DEFAULT_MIN_ROWS, capture_path=query_profiler.CAPTURE_PATH):
+    """
+    [{'name','fingerprint','full_scans','filesort','temporary','allowed','error'}] per statement,
+    plus the proposed indexes [(table, columns, [statement names])].
+    """
+    conn = db.get_connection()
+    try:
+        ctx = load_context(conn)
+        statements = collect(conn, ctx, capture_path)
+        cur = conn.cursor()
+        try:
+            existing = existing_indexes(cur)
+            findings, proposals = [], {}
+            for name, sql, params in statements:
+                f = {"name": name, "fingerprint": query_cache.fingerprint(sql), "full_scans": [],
+                     "filesort": False, "temporary": False, "allowed": _allowed(sql), "error": None}
+                try:
+                    tables, flags = explain(cur, sql, params)
+                except Error as e:
+                    f["error"] = str(e)
+                    findings.append(f)
+                    continue
+                f["filesort"], f["temporary"] = "filesort" in flags, "temporary" in flags
+                for node in tables:
+                    rows = int(node.get("rows_examined_per_scan") or 0)
+                    if node["access_type"] in ("ALL", "index") and rows >= min_rows:
+                        kind = "full scan" if node["access_type"] == "ALL" else "full index scan"
+                        f["full_scans"].append(f"{node.get('table_name')} ({kind}, ~{rows} rows)")
+                        p = propose(sql, node, existing)
+                        if p:
+                            proposals.setdefault((p[0], tuple(p[1])), []).append(name)
+                findings.append(f)
+        finally:
+            cur.close()
+        conn.rollback()
+    finally:
+        conn.close()
+    return findings, [(t, list(c), names) for (t, c), names in proposals.items()]
+
+
+def migration(proposals):
+    lines = [f"-- proposed by python -m bench.index_advisor on {datetime.now():%Y-%m-%d}"]
+    for table, cols, names in proposals:
+        lines.append(f"-- {', '.join(sorted(names))}")
+        lines.append(f"CREATE INDEX {index_name(table, cols)} ON {table} ({', '.join(cols)});")
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="EXPLAIN every app statement; flag full scans and filesorts.")
+    parser.add_argument("--min-rows", type=int, default=DEFAULT_MIN_ROWS,
+                        help="ignore scans estimated below this many rows (small lookup tables)")
+    parser.add_argument("--capture", default=query_profiler.CAPTURE_PATH, help="statements saved from the app")
+    parser.add_argument("--migration", metavar="PATH", help="write the proposed indexes as SQL")
+    parser.add_argument("--check", action="store_true", help="exit 2 when a statement full-scans and is not in ALLOWED")
+    args = parser.parse_args(argv)
+
+    try:
+        findings, proposals = review(args.min_rows, args.capture)
+    except Error as e:
+        print(f"index advisor failed: {e}", file=sys.stderr)
+        return 1
+    except LookupError as e:
+        print(f"{e}\nload a dataset first: python -m bench.datagen", file=sys.stderr)
+        return 1
+
+    failing = []
+    for f in findings:
+        if f["error"]:
+            status, detail = "ERROR", f["error"]
+        elif f["full_scans"]:
+            status = "allowed" if f["allowed"] else "FULL SCAN"
+            detail = "; ".join(f["full_scans"]) + (f"  [{f['allowed']}]" if f["allowed"] else "")
+            if not f["allowed"]:
+                failing.append(f["name"])
+        else:
+            status, detail = "ok", ""
+        sort = ",".join(k for k in ("filesort", "temporary") if f[k])
+        print(f"{f['name']:40s} {status:9s} {sort or '-':18s} {detail}")
+
+    if proposals:
+        print("\nproposed indexes:")
+        print(migration(proposals), end="")
+    if args.migration:
+        with open(args.migration, "w", encoding="utf-8") as fh:
+            fh.write(migration(proposals))
+        print(f"wrote {args.migration}")
+    if args.check and failing:
+        print(f"\n{len(failing)} statement(s) full-scan a large table: {', '.join(failing)}")
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
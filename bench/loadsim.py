@@ -0,0 +1,326 @@
+# bench/loadsim.py
+# Concurrent workload simulator: N clerks (threads, one connection each) receive POs,
+# ship SOs and post adjustments/returns against the database in config.DB_CONFIG for a
+# fixed duration, through the same stock_ops functions the pages use (--paths app) or
+# through the stored procedures sp_receive_po / sp_ship_so / sp_adjust_stock (--paths proc).
+# Deadlocks and lock-wait timeouts are retried like a clerk pressing the button again.
+#
+#   python -m bench.loadsim --clerks 16 --duration 60 --mix receive=30,ship=50,adjust=15,return=5
+#   python -m bench.loadsim --clerks 16 --paths proc --skew 1.3 --warehouses 1
+#
+# Work orders (POs/SOs on hot SKUs) are created before the timed run and are left in the
+# database afterwards: use a benchmark database loaded with bench.datagen.
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+from mysql.connector import Error, errorcode
+
+import db
+import order_totals
+import stock_ops
+from bench.benchmark import percentile
+from bench.datagen import Skewed
+
+OPS = ("receive", "ship", "adjust", "return")
+DEFAULT_MIX = "receive=30,ship=50,adjust=15,return=5"
+RETRY_ERRORS = {errorcode.ER_LOCK_DEADLOCK: "deadlocks", errorcode.ER_LOCK_WAIT_TIMEOUT: "lock_timeouts"}
+# SIGNAL from the stored procedures (status / availability checks) is a business rejection
+REJECT_SQLSTATE = "45000"
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPS:
+            raise ValueError(f"unknown operation {name!r} (expected one of {', '.join(OPS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Stats:
+    """Per-operation counters and latencies shared by all clerks."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ops = {op: {"ok": 0, "rejected": 0, "failed": 0, "retries": 0, "deadlocks": 0,
+                         "lock_timeouts": 0, "latency_ms": []} for op in OPS}
+
+    def record(self, op, outcome, elapsed_ms, retries, retry_kinds):
+        with self.lock:
+            s = self.ops[op]
+            s[outcome] += 1
+            s["retries"] += retries
+            for kind in retry_kinds:
+                s[kind] += 1
+            if outcome == "ok":
+                s["latency_ms"].append(elapsed_ms)
+
+
+class Workload:
+    def __init__(self, conn, seed, warehouses, skew, orders, po_lines):
+        self.rng = random.Random(seed)
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT warehouse_id FROM stock GROUP BY warehouse_id ORDER BY COUNT(*) DESC LIMIT %s", (warehouses,))
+            self.warehouses = [int(r[0]) for r in cur.fetchall()]
+            cur.execute("SELECT item_id, price FROM item ORDER BY item_id")
+            prices = {int(i): float(p) for i, p in cur.fetchall()}
+            cur.execute("SELECT MIN(supplier_id) FROM supplier")
+            self.supplier_id = cur.fetchone()[0]
+            cur.execute("SELECT MIN(customer_id) FROM customer")
+            self.customer_id = cur.fetchone()[0]
+            cur.execute("SELECT emp_id FROM employee ORDER BY emp_id LIMIT 50")
+            self.employees = [int(r[0]) for r in cur.fetchall()]
+        finally:
+            cur.close()
+        if not self.warehouses or not prices or not self.employees or self.supplier_id is None or self.customer_id is None:
+            raise LookupError("no stock/items/employees to work with; load a dataset with bench.datagen")
+        self.prices = prices
+        self.items = Skewed(self.rng, sorted(prices), skew)
+        self.po_queue = deque(self._create_orders(conn, "purchase", orders, po_lines))
+        self.so_queue = deque(self._create_orders(conn, "sales", orders, max(1, po_lines // 4)))
+        self.queue_lock = threading.Lock()
+
+    def _create_orders(self, conn, side, n, mean_lines):
+        rng = self.rng
+        head_sql = {
+            "purchase": "INSERT INTO purchase_order (supplier_id, warehouse_id, status) VALUES (%s,%s,'APPROVED')",
+            "sales": "INSERT INTO sales_order (customer_id, warehouse_id, status) VALUES (%s,%s,'CONFIRMED')",
+        }[side]
+        party = self.supplier_id if side == "purchase" else self.customer_id
+        ids = []
+        cur = conn.cursor()
+        try:
+            for _ in range(n):
+                cur.execute(head_sql, (party, rng.choice(self.warehouses)))
+                ids.append(cur.lastrowid)
+        finally:
+            cur.close()
+        lines = []
+        for order_id in ids:
+            for item in self.items.sample(rng.randint(1, 2 * mean_lines - 1)):
+                # sales quantities stay small so receipts keep hot SKUs shippable
+                qty = rng.randint(5, 50) if side == "purchase" else rng.randint(1, 3)
+                lines.append((order_id, item, qty, self.prices[item]))
+        order_totals.insert_lines(conn, side, lines)
+        conn.commit()
+        return ids
+
+    def next_order(self, side):
+        q = self.po_queue if side == "purchase" else self.so_queue
+        with self.queue_lock:
+            return q.popleft() if q else None
+
+
+def plan_op(op, work, rng):
+    """Pick the target of one operation; None when that order queue is used up."""
+    if op == "receive":
+        po = work.next_order("purchase")
+        return None if po is None else (po,)
+    if op == "ship":
+        so = work.next_order("sales")
+        return None if so is None else (so,)
+    wh, item = rng.choice(work.warehouses), work.items.pick(rng)
+    if op == "adjust":
+        return (wh, item, rng.choice([-2, -1, 1, 2, 5]))
+    return (wh, item, rng.choice([-1, 1]) * rng.randint(1, 5))
+
+
+def _app_op(conn, op, target, emp):
+    if op == "receive":
+        stock_ops.receive_po(conn, target[0], emp)
+    elif op == "ship":
+        stock_ops.ship_so(conn, target[0], emp)
+    elif op == "adjust":
+        stock_ops.adjust_stock(conn, *target, emp_id=emp)
+    else:
+        # customer return (IN) or return to supplier (OUT)
+        stock_ops.adjust_stock(conn, *target, change_type="IN" if target[2] > 0 else "OUT")
+
+
+def _proc_op(conn, op, target, emp):
+    cur = conn.cursor()
+    try:
+        if op == "receive":
+            cur.callproc("sp_receive_po", (target[0], emp))
+        elif op == "ship":
+            cur.callproc("sp_ship_so", (target[0], emp))
+        else:
+            cur.callproc("sp_adjust_stock", target + (emp, f"loadsim {op}"))
+    finally:
+        cur.close()
+
+
+def clerk(pool, work, stats, mix, paths, seed, deadline, think_ms, max_retries):
+    rng = random.Random(seed)
+    ops, weights = zip(*mix.items())
+    run_op = _app_op if paths == "app" else _proc_op
+    conn = pool.acquire()
+    try:
+        while time.monotonic() < deadline:
+            op = rng.choices(ops, weights)[0]
+            target = plan_op(op, work, rng)
+            if target is None:
+                mix = {k: v for k, v in mix.items() if k != op}
+                if not mix:
+                    return
+                ops, weights = zip(*mix.items())
+                continue
+            emp = rng.choice(work.employees)
+            retries, kinds = 0, []
+            t0 = time.perf_counter()
+            while True:
+                try:
+                    # a retry repeats the same operation on the same order / SKU
+                    run_op(conn, op, target, emp)
+                    conn.commit()
+                    outcome = "ok"
+                    break
+                except stock_ops.StockOpError:
+                    conn.rollback()
+                    outcome = "rejected"
+                    break
+                except Error as e:
+                    try:
+                        conn.rollback()
+                    except Error:
+                        pass
+                    kind = RETRY_ERRORS.get(e.errno)
+                    if kind and retries < max_retries:
+                        retries += 1
+                        kinds.append(kind)
+                        time.sleep(rng.uniform(0.005, 0.02) * retries)
+                        continue
+                    if kind:
+                        kinds.append(kind)
+                    outcome = "rejected" if getattr(e, "sqlstate", None) == REJECT_SQLSTATE else "failed"
+                    break
+            stats.record(op, outcome, (time.perf_counter() - t0) * 1000.0, retries, kinds)
+            if think_ms:
+                time.sleep(rng.expovariate(1.0 / think_ms) / 1000.0)
+    finally:
+        conn.close()
+
+
+def _row_lock_status(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute("SHOW GLOBAL STATUS LIKE 'Innodb_row_lock_%'")
+        return {k: int(v) for k, v in cur.fetchall()}
+    finally:
+        cur.close()
+
+
+def simulate(clerks=8, duration=30.0, mix=None, paths="app", seed=7, warehouses=3, skew=1.1,
+             orders=None, po_lines=8, think_ms=0.0, max_retries=3, progress=print):
+    mix = mix or parse_mix(DEFAULT_MIX)
+    pool = db.ConnectionPool(db.connection_config(), size=clerks + 1, checkout_timeout=30.0)
+    try:
+        setup = pool.acquire()
+        try:
+            # enough work orders for a busy run; the clerks stop early if they run out
+            n_orders = orders or max(200, int(clerks * duration * 10))
+            progress(f"preparing {n_orders} POs and {n_orders} SOs ...")
+            work = Workload(setup, seed, warehouses, skew, n_orders, po_lines)
+            locks_before = _row_lock_status(setup)
+        finally:
+            setup.close()
+
+        stats = Stats()
+        deadline = time.monotonic() + duration
+        threads = [threading.Thread(target=clerk, daemon=True,
+                                    args=(pool, work, stats, mix, paths, seed * 1000 + i, deadline, think_ms, max_retries))
+                   for i in range(clerks)]
+        started = time.monotonic()
+        progress(f"running {clerks} clerks for {duration:.0f}s ({paths} paths) ...")
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - started
+
+        check = pool.acquire()
+        try:
+            locks_after = _row_lock_status(check)
+        finally:
+            check.close()
+    finally:
+        pool.close_all()
+
+    waits = locks_after.get("Innodb_row_lock_waits", 0) - locks_before.get("Innodb_row_lock_waits", 0)
+    wait_ms = locks_after.get("Innodb_row_lock_time", 0) - locks_before.get("Innodb_row_lock_time", 0)
+    report = {"clerks": clerks, "paths": paths, "elapsed_s": round(elapsed, 2), "mix": mix,
+              "row_lock_waits": waits, "row_lock_time_ms": wait_ms,
+              "row_lock_avg_ms": round(wait_ms / waits, 2) if waits else 0.0, "ops": {}}
+    all_lat = []
+    for op, s in stats.ops.items():
+        lat = s.pop("latency_ms")
+        all_lat += lat
+        s.update({"per_s": round(s["ok"] / elapsed, 2) if elapsed else 0.0,
+                  "p50_ms": round(percentile(lat, 0.5), 2), "p99_ms": round(percentile(lat, 0.99), 2)})
+        report["ops"][op] = s
+    report["total"] = {
+        "ok": sum(s["ok"] for s in report["ops"].values()),
+        "per_s": round(len(all_lat) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(all_lat, 0.5), 2),
+        "p99_ms": round(percentile(all_lat, 0.99), 2),
+        "deadlocks": sum(s["deadlocks"] for s in report["ops"].values()),
+        "lock_timeouts": sum(s["lock_timeouts"] for s in report["ops"].values()),
+        "retries": sum(s["retries"] for s in report["ops"].values()),
+    }
+    return report
+
+
+def format_report(r):
+    out = [f"{r['clerks']} clerks, {r['paths']} paths, {r['elapsed_s']}s",
+           f"{'op':8s} {'ok':>7s} {'/s':>8s} {'p50 ms':>8s} {'p99 ms':>8s} {'rejected':>8s} {'failed':>7s} "
+           f"{'retries':>7s} {'deadlk':>7s} {'lockto':>7s}"]
+    for op, s in list(r["ops"].items()) + [("total", dict(r["total"], rejected="", failed=""))]:
+        out.append(f"{op:8s} {s['ok']:>7} {s['per_s']:>8} {s['p50_ms']:>8} {s['p99_ms']:>8} {s['rejected']:>8} "
+                   f"{s['failed']:>7} {s['retries']:>7} {s['deadlocks']:>7} {s['lock_timeouts']:>7}")
+    out.append(f"InnoDB row lock waits: {r['row_lock_waits']} (total {r['row_lock_time_ms']} ms, "
+               f"avg {r['row_lock_avg_ms']} ms)")
+    return "\n".join(out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate concurrent clerks receiving, shipping and adjusting stock.")
+    parser.add_argument("--clerks", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"operation weights (default {DEFAULT_MIX})")
+    parser.add_argument("--paths", choices=("app", "proc"), default="app",
+                        help="app: stock_ops functions used by the pages; proc: sp_receive_po/sp_ship_so/sp_adjust_stock")
+    parser.add_argument("--warehouses", type=int, default=3, help="busiest N warehouses to work in")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of SKU popularity (higher = hotter)")
+    parser.add_argument("--orders", type=int, help="POs and SOs to prepare (default: scaled to clerks x duration)")
+    parser.add_argument("--po-lines", type=int, default=8, help="average lines per prepared PO")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between a clerk's operations")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        report = simulate(args.clerks, args.duration, parse_mix(args.mix), args.paths, args.seed,
+                          args.warehouses, args.skew, args.orders, args.po_lines, args.think_ms,
+                          args.max_retries, progress=lambda m: print(m, flush=True))
+    except (Error, LookupError, ValueError) as e:
+        print(f"simulation failed: {e}", file=sys.stderr)
+        return 1
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
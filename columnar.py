@@ -0,0 +1,134 @@
+# columnar.py
+# Dtype-compact fetch path for large result sets.
+# fetch_df() builds one dict per row and lets pandas infer types, so DECIMAL columns
+# (price, totals) end up as object columns of Decimal and every repeated name is its
+# own Python string. Here rows are read as tuples in chunks and each chunk is turned
+# into typed column pieces straight away, using the column types MySQL reports:
+#   - DECIMAL -> float64, or int64 scaled by 100 ("cents") with decimals="cents"
+#   - integer types -> int64 (pandas Int64 when the column has NULLs)
+#   - DATE/DATETIME/TIMESTAMP -> datetime64
+#   - strings/ENUM -> dictionary-encoded while reading, categorical when repetitive
+# Results come back as a pandas DataFrame, or as an Arrow table (pyarrow, optional).
+import numpy as np
+import pandas as pd
+from mysql.connector.constants import FieldType
+
+CHUNK_ROWS = 10000
+# strings become categorical when distinct values are at most this share of the rows
+CATEGORICAL_MAX_RATIO = 0.5
+
+_INT_TYPES = {FieldType.TINY, FieldType.SHORT, FieldType.LONG, FieldType.LONGLONG, FieldType.INT24, FieldType.YEAR}
+_FLOAT_TYPES = {FieldType.FLOAT, FieldType.DOUBLE}
+_DECIMAL_TYPES = {FieldType.DECIMAL, FieldType.NEWDECIMAL}
+_TIME_TYPES = {FieldType.DATE, FieldType.NEWDATE, FieldType.DATETIME, FieldType.TIMESTAMP}
+_STRING_TYPES = {FieldType.VARCHAR, FieldType.VAR_STRING, FieldType.STRING, FieldType.ENUM, FieldType.SET}
+_EMPTY_DTYPES = {"int": "int64", "cents": "int64", "float": "float64", "time": "datetime64[us]"}
+
+
+class _Column:
+    """Typed pieces of one result column, appended chunk by chunk."""
+
+    def __init__(self, name, type_code, decimals):
+        self.name = name
+        if type_code in _INT_TYPES:
+            self.kind = "int"
+        elif type_code in _FLOAT_TYPES:
+            self.kind = "float"
+        elif type_code in _DECIMAL_TYPES:
+            self.kind = "cents" if decimals == "cents" else "float"
+        elif type_code in _TIME_TYPES:
+            self.kind = "time"
+        elif type_code in _STRING_TYPES:
+            self.kind = "string"
+        else:
+            self.kind = "object"
+        self.pieces = []
+        self.nulls = False
+        self.codes = {}          # string -> dictionary code
+
+    def add(self, values):
+        if self.kind in ("int", "cents"):
+            if any(v is None for v in values):
+                self.nulls = True
+                arr = np.array([np.nan if v is None else v for v in values], dtype="float64")
+            else:
+                arr = np.array(values, dtype="float64" if self.kind == "cents" else "int64")
+            self.pieces.append(np.rint(arr * 100) if self.kind == "cents" else arr)
+        elif self.kind == "float":
+            self.pieces.append(np.array([np.nan if v is None else v for v in values], dtype="float64"))
+        elif self.kind == "time":
+            self.pieces.append(np.array([np.datetime64("NaT") if v is None else v for v in values],
+                                        dtype="datetime64[us]"))
+        elif self.kind == "string":
+            codes, lookup = np.empty(len(values), dtype="int32"), self.codes
+            for i, v in enumerate(values):
+                if v is None:
+                    codes[i] = -1
+                else:
+                    c = lookup.get(v)
+                    if c is None:
+                        c = lookup[v] = len(lookup)
+                    codes[i] = c
+            self.pieces.append(codes)
+        else:
+            self.pieces.append(np.array(values, dtype=object))
+
+    def finish(self, categorical):
+        if not self.pieces:
+            return np.array([], dtype=_EMPTY_DTYPES.get(self.kind, object))
+        data = np.concatenate(self.pieces)
+        if self.kind in ("int", "cents"):
+            # NaN marks NULL in the float pieces; nullable Int64 keeps them as <NA>
+            return pd.array(data, dtype="Int64") if self.nulls else data.astype("int64")
+        if self.kind == "string":
+            cat = pd.Categorical.from_codes(data, categories=list(self.codes))
+            if categorical == "auto":
+                use = len(self.codes) <= CATEGORICAL_MAX_RATIO * len(data)
+            elif categorical is None or isinstance(categorical, bool):
+                use = bool(categorical)
+            else:
+                use = self.name in categorical
+            return cat if use else np.asarray(cat, dtype=object)
+        return data
+
+
+def read_columns(cursor, chunk_rows=CHUNK_ROWS, decimals="float", categorical="auto"):
+    """
+    DataFrame from an executed tuple cursor, read in chunks of `chunk_rows`.
+    decimals: "float" (float64) or "cents" (int64, value * 100).
+    categorical: "auto" (repetitive string columns), True (all), False, or column names.
+    """
+    if not cursor.description:
+        return pd.DataFrame()
+    cols = [_Column(d[0], d[1], decimals) for d in cursor.description]
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        for col, values in zip(cols, zip(*rows)):
+            col.add(values)
+        del rows
+    return pd.DataFrame({c.name: c.finish(categorical) for c in cols})
+
+
+def fetch_frame(conn, sql, params=None, **kwargs):
+    """Run `sql` on `conn` and read it with read_columns()."""
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params or ())
+        return read_columns(cur, **kwargs)
+    finally:
+        cur.close()
+
+
+def to_arrow(df):
+    """Arrow table of a columnar DataFrame (categoricals become dictionary arrays)."""
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise RuntimeError("Arrow output needs pyarrow (pip install pyarrow)") from e
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def fetch_arrow(conn, sql, params=None, **kwargs):
+    return to_arrow(fetch_frame(conn, sql, params, **kwargs))
@@ -0,0 +1,365 @@
+# db.py
+# Process-wide MySQL connection pool shared by the Streamlit pages (every
+# session runs in the same process) and by any helper module that needs a
+# connection without going through the UI.
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import mysql.connector
+from mysql.connector import errors
+from config import DB_CONFIG
+
+import metrics
+import query_profiler
+
+try:
+    from config import POOL_CONFIG
+except ImportError:
+    POOL_CONFIG = {}
+
+# ---------- POOL DEFAULTS ----------
+# Override any of these with a POOL_CONFIG dict in config.py.
+POOL_DEFAULTS = {
+    "size": 8,                 # max open connections in the process
+    "checkout_timeout": 10.0,  # seconds to wait for a free connection
+    "ping_after": 30.0,        # ping connections idle for longer than this on checkout
+    "max_lifetime": 3600.0,    # recycle connections older than this (seconds)
+    "reset_on_return": True,   # reset session state (variables, temp tables) on return
+    "fanout_workers": 4,       # threads for fetch_parallel(); capped at size - 1
+    "fanout_timeout": 15.0,    # default per-batch timeout for fetch_parallel() (seconds)
+}
+
+
+class QueryTimeout(errors.Error):
+    """A fetch_parallel() statement did not finish within the batch timeout."""
+
+
+def connection_config():
+    """DB_CONFIG with the port coerced to int (config.py often holds it as a string)."""
+    cfg = DB_CONFIG.copy()
+    if "port" in cfg and isinstance(cfg["port"], str):
+        try:
+            cfg["port"] = int(cfg["port"])
+        except Exception:
+            pass
+    return cfg
+
+
+class PooledConnection:
+    """
+    Thin proxy around a raw mysql.connector connection.
+    close() hands the connection back to the pool instead of closing the socket,
+    so existing `conn.close()` calls keep working unchanged.
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._returned = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        cur = self._raw.cursor(*args, **kwargs)
+        # statements are only timed while the admin query profiler is recording
+        return query_profiler.wrap(cur) if query_profiler.active() else cur
+
+    def close(self):
+        if self._returned:
+            return
+        self._returned = True
+        self._pool._release(self._raw, self._created_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    def __init__(self, config, size=8, checkout_timeout=10.0, ping_after=30.0,
+                 max_lifetime=3600.0, reset_on_return=True, fanout_workers=4, fanout_timeout=15.0):
+        self._config = config
+        self.size = int(size)
+        self.checkout_timeout = float(checkout_timeout)
+        self.ping_after = float(ping_after)
+        self.max_lifetime = float(max_lifetime)
+        self.reset_on_return = bool(reset_on_return)
+        self.fanout_workers = max(1, min(int(fanout_workers), self.size - 1))
+        self.fanout_timeout = float(fanout_timeout)
+        self._fanout = None
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (raw, created_at, last_used)
+        self._open = 0
+        self._in_use = 0
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "created": 0,
+            "recycled": 0,
+        }
+
+    # ----- internals -----
+    def _connect(self):
+        with metrics.DB_CONNECT_SECONDS.time():
+            return mysql.connector.connect(**self._config)
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, raw, created_at, last_used, now):
+        if now - created_at > self.max_lifetime:
+            return False
+        if now - last_used > self.ping_after:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    def _release(self, raw, created_at):
+        healthy = True
+        try:
+            if raw.in_transaction:
+                raw.rollback()
+            if self.reset_on_return:
+                raw.reset_session()
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((raw, created_at, time.monotonic()))
+            else:
+                self._open -= 1
+                self._stats["recycled"] += 1
+            self._cond.notify()
+        if not healthy:
+            self._discard(raw)
+
+    # ----- public API -----
+    def acquire(self, timeout=None):
+        """
+        Check out a connection. Blocks up to `timeout` (default: checkout_timeout)
+        when all `size` connections are in use, then raises PoolError.
+        """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        while True:
+            candidate = None
+            create = False
+            with self._cond:
+                while not self._idle and self._open >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise errors.PoolError(
+                            f"No free DB connection after {timeout:.1f}s (pool size {self.size})"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    candidate = self._idle.pop()
+                else:
+                    self._open += 1
+                    create = True
+                self._in_use += 1
+
+            if create:
+                try:
+                    raw = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+                created_at = time.monotonic()
+                with self._cond:
+                    self._stats["created"] += 1
+                break
+
+            raw, created_at, last_used = candidate
+            if self._is_usable(raw, created_at, last_used, time.monotonic()):
+                break
+            # stale or dead: drop it and try again (a new one may be opened)
+            self._discard(raw)
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._stats["recycled"] += 1
+
+        wait_time = time.monotonic() - started
+        metrics.DB_CHECKOUT_SECONDS.observe(wait_time)
+        with self._cond:
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_time_total"] += wait_time
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait_time)
+        return PooledConnection(self, raw, created_at)
+
+    def stats(self):
+        with self._cond:
+            out = dict(self._stats)
+            out.update({
+                "size": self.size,
+                "open": self._open,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+            })
+        return out
+
+    def fetch_parallel(self, statements, timeout=None, reader=None):
+        """
+        Run independent reads concurrently, each on its own pooled connection.
+        statements: {key: (sql, params)}. Returns {key: (column_names, rows)}, or
+        {key: reader(cursor)} when a reader is given, with the exception in place of the result for a statement that failed. Statements still
+        running when the batch timeout expires are stopped with KILL QUERY and get
+        QueryTimeout. A single statement runs in the calling thread.
+        """
+        if not statements:
+            return {}
+        timeout = self.fanout_timeout if timeout is None else float(timeout)
+        deadline = time.monotonic() + timeout
+        running = {}            # key -> server connection id while executing
+        running_lock = threading.Lock()
+        records, origin = query_profiler.current(), query_profiler.origin()
+
+        def work(key, sql, params):
+            with query_profiler.attached(records, origin):
+                conn = self.acquire(timeout=max(0.0, deadline - time.monotonic()))
+                try:
+                    with running_lock:
+                        running[key] = conn.connection_id
+                    cur = conn.cursor()
+                    try:
+                        cur.execute(sql, params or ())
+                        if reader is not None:
+                            return reader(cur)
+                        rows = cur.fetchall()
+                        columns = [d[0] for d in cur.description] if cur.description else []
+                    finally:
+                        cur.close()
+                    return columns, rows
+                finally:
+                    with running_lock:
+                        running.pop(key, None)
+                    conn.close()
+
+        if len(statements) == 1:
+            (key, (sql, params)), = statements.items()
+            try:
+                return {key: work(key, sql, params)}
+            except Exception as e:
+                return {key: e}
+
+        with self._cond:
+            if self._fanout is None:
+                self._fanout = ThreadPoolExecutor(self.fanout_workers, thread_name_prefix="db-fanout")
+        futures = {self._fanout.submit(work, k, sql, params): k for k, (sql, params) in statements.items()}
+        done, pending = wait(futures, timeout=timeout)
+        out = {}
+        for f in done:
+            try:
+                out[futures[f]] = f.result()
+            except Exception as e:
+                out[futures[f]] = e
+        if pending:
+            for f in pending:
+                f.cancel()
+                out[futures[f]] = QueryTimeout(msg=f"Query did not finish within {timeout:.1f}s")
+            # the lock keeps a worker from handing its connection back (and someone else
+            # starting a statement on it) between reading its id and the KILL
+            with running_lock:
+                self._kill([running[futures[f]] for f in pending if futures[f] in running])
+        return {k: out[k] for k in statements}
+
+    def _kill(self, connection_ids):
+        if not connection_ids:
+            return
+        # a side connection outside the pool: the pool may be exhausted by the stuck statements
+        try:
+            raw = self._connect()
+        except Exception:
+            return
+        try:
+            cur = raw.cursor()
+            for cid in connection_ids:
+                try:
+                    cur.execute(f"KILL QUERY {int(cid)}")
+                except errors.Error:
+                    pass
+            cur.close()
+        finally:
+            self._discard(raw)
+
+    def close_all(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+        for raw, _, _ in idle:
+            self._discard(raw)
+
+
+# ---------- PROCESS-WIDE POOL ----------
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                opts = dict(POOL_DEFAULTS)
+                opts.update(POOL_CONFIG or {})
+                _pool = ConnectionPool(connection_config(), **opts)
+    return _pool
+
+
+def get_connection(timeout=None):
+    """Check out a pooled connection; raises mysql.connector.Error on failure."""
+    return get_pool().acquire(timeout=timeout)
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def fetch_parallel(statements, timeout=None, reader=None):
+    """Independent reads side by side over separate pooled connections (see ConnectionPool.fetch_parallel)."""
+    return get_pool().fetch_parallel(statements, timeout=timeout, reader=reader)
+
+
+def _pool_metrics():
+    if _pool is None:
+        return []
+    s = _pool.stats()
+    return [
+        ("inv_db_pool_connections", "gauge", "Pool connections by state.",
+         [({"state": k}, s[k]) for k in ("open", "in_use", "idle")]),
+        ("inv_db_pool_checkouts_total", "counter", "Pool checkouts.", [({}, s["checkouts"])]),
+        ("inv_db_pool_timeouts_total", "counter", "Checkouts that gave up waiting.", [({}, s["timeouts"])]),
+    ]
+
+
+metrics.add_collector(_pool_metrics)
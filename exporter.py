@@ -0,0 +1,248 @@
+# exporter.py
+# Streaming export of transaction_log and PO/SO lines for a date range (and optionally
+# one warehouse) to CSV or Parquet. Rows come through an unbuffered (server-side) cursor
+# in fixed-size chunks and each chunk is written out before the next is read, so memory
+# stays flat however large the export is: CSV rows are appended, Parquet gets one row
+# group per chunk. Progress is reported from the time column of the last row written
+# (rows arrive in time order), which needs no COUNT(*) up front.
+#
+#   python exporter.py transaction_log 2024-01-01 2024-02-01 [--warehouse 3] [--format parquet]
+import argparse
+import csv
+import gzip
+import os
+import sys
+import time
+from datetime import date, datetime
+
+from mysql.connector import Error
+
+import db
+from rollups import SIGNED_DELTA_SQL
+
+EXPORT_DIR = "exports"
+CHUNK_ROWS = 5000
+FORMATS = ("csv", "csv.gz", "parquet")
+
+# the client may pause between chunks while a file is written; keep the server sending
+NET_WRITE_TIMEOUT = 600
+
+
+class Dataset:
+    def __init__(self, label, sql, time_col, range_expr, wh_expr):
+        self.label = label
+        self.sql = sql                # with {where}
+        self.time_col = time_col      # result column used for progress
+        self.range_expr = range_expr  # filtered to [start, end)
+        self.wh_expr = wh_expr
+
+    def query(self, start, end, warehouse_id=None):
+        where, params = [f"{self.range_expr} >= %s", f"{self.range_expr} < %s"], [start, end]
+        if warehouse_id is not None:
+            where.append(f"{self.wh_expr} = %s")
+            params.append(int(warehouse_id))
+        return self.sql.format(where=" AND ".join(where)), tuple(params)
+
+
+_LINES_SQL = """
+    SELECT h.{idc}, h.{datec}, h.status, h.warehouse_id, w.name AS warehouse_name,
+           h.{partyc}, p.name AS {party}_name, d.item_id, i.name AS item_name,
+           d.quantity, d.price, d.quantity * d.price AS line_total
+    FROM {head} h
+    JOIN {det} d ON d.{idc} = h.{idc}
+    JOIN item i ON i.item_id = d.item_id
+    LEFT JOIN warehouse w ON w.warehouse_id = h.warehouse_id
+    LEFT JOIN {party} p ON p.{partyc} = h.{partyc}
+    WHERE {{where}}
+    ORDER BY h.{datec}, h.{idc}, d.item_id
+"""
+
+DATASETS = {
+    "transaction_log": Dataset(
+        "Stock movements (transaction_log)",
+        f"""
+        SELECT t.log_id, t.logged_at, t.warehouse_id, w.name AS warehouse_name, t.item_id,
+               i.name AS item_name, t.change_type, t.delta_qty, {SIGNED_DELTA_SQL} AS signed_qty,
+               t.ref_type, t.ref_id, t.emp_id
+        FROM transaction_log t
+        JOIN item i ON i.item_id = t.item_id
+        LEFT JOIN warehouse w ON w.warehouse_id = t.warehouse_id
+        WHERE {{where}}
+        ORDER BY t.log_id
+        """,
+        "logged_at", "t.logged_at", "t.warehouse_id"),
+    "purchase_lines": Dataset(
+        "Purchase order lines",
+        _LINES_SQL.format(idc="po_id", datec="po_date", partyc="supplier_id", party="supplier",
+                          head="purchase_order", det="purchase_order_details"),
+        "po_date", "h.po_date", "h.warehouse_id"),
+    "sales_lines": Dataset(
+        "Sales order lines",
+        _LINES_SQL.format(idc="so_id", datec="so_date", partyc="customer_id", party="customer",
+                          head="sales_order", det="sales_order_details"),
+        "so_date", "h.so_date", "h.warehouse_id"),
+}
+
+
+def default_path(dataset, start, end, warehouse_id=None, fmt="csv"):
+    wh = f"_wh{warehouse_id}" if warehouse_id is not None else ""
+    return os.path.join(EXPORT_DIR, f"{dataset}_{start:%Y%m%d}-{end:%Y%m%d}{wh}.{fmt}")
+
+
+def _as_dt(d):
+    return d if isinstance(d, datetime) else datetime(d.year, d.month, d.day)
+
+
+def _fraction(value, start, end):
+    """Share of [start, end) covered once the row with time `value` is written."""
+    if not isinstance(value, date):
+        return None
+    span = (_as_dt(end) - _as_dt(start)).total_seconds() or 1.0
+    return min(1.0, max(0.0, (_as_dt(value) - _as_dt(start)).total_seconds() / span))
+
+
+class _CsvSink:
+    def __init__(self, path, columns, compress):
+        self.f = gzip.open(path, "wt", newline="", encoding="utf-8") if compress else \
+            open(path, "w", newline="", encoding="utf-8")
+        self.w = csv.writer(self.f)
+        self.w.writerow(columns)
+
+    def write(self, rows):
+        self.w.writerows(rows)
+
+    def close(self):
+        self.f.close()
+
+
+class _ParquetSink:
+    """One row group per chunk; the schema is fixed from the first chunk."""
+
+    def __init__(self, path, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from e
+        self.pa, self.pq = pa, pq
+        self.path = path
+        self.columns = columns
+        self.schema = None
+        self.writer = None
+
+    def _schema(self, arrays):
+        pa = self.pa
+        fields = []
+        for name, arr in zip(self.columns, arrays):
+            t = arr.type
+            if pa.types.is_decimal(t):
+                t = pa.decimal128(38, t.scale)   # later chunks may hold wider values
+            elif pa.types.is_integer(t):
+                t = pa.int64()
+            elif pa.types.is_null(t):
+                t = pa.string()                  # all-NULL so far: no better guess
+            fields.append(pa.field(name, t))
+        return pa.schema(fields)
+
+    def write(self, rows):
+        pa = self.pa
+        cols = list(zip(*rows))
+        if self.schema is None:
+            self.schema = self._schema([pa.array(c) for c in cols])
+            self.writer = self.pq.ParquetWriter(self.path, self.schema, compression="snappy")
+        arrays = [pa.array(c, type=f.type) for c, f in zip(cols, self.schema)]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        if self.writer is None:
+            # no rows: still leave a readable file with the column names
+            self.schema = self.pa.schema([self.pa.field(c, self.pa.string()) for c in self.columns])
+            self.writer = self.pq.ParquetWriter(self.path, self.schema)
+        self.writer.close()
+
+
+def export(dataset, start, end, warehouse_id=None, fmt="csv", path=None, chunk_rows=CHUNK_ROWS, progress=None):
+    """
+    Stream `dataset` rows with start <= time < end to a file and return
+    {'path','rows','bytes','seconds'}. progress(rows_written, fraction or None) is called
+    after every chunk. The file is written under a temporary name and renamed when complete.
+    """
+    if dataset not in DATASETS:
+        raise ValueError(f"unknown dataset {dataset!r}; choose from {', '.join(DATASETS)}")
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format {fmt!r}; choose from {', '.join(FORMATS)}")
+    ds = DATASETS[dataset]
+    sql, params = ds.query(start, end, warehouse_id)
+    path = path or default_path(dataset, start, end, warehouse_id, fmt)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.part"
+
+    t0 = time.perf_counter()
+    rows_written = 0
+    conn = db.get_connection()
+    sink = None
+    try:
+        cur = conn.cursor(buffered=False)
+        try:
+            cur.execute("SET SESSION net_write_timeout = %s", (NET_WRITE_TIMEOUT,))
+            cur.execute(sql, params)
+            columns = [d[0] for d in cur.description]
+            tcol = columns.index(ds.time_col)
+            sink = _ParquetSink(tmp, columns) if fmt == "parquet" else _CsvSink(tmp, columns, fmt == "csv.gz")
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                sink.write(rows)
+                rows_written += len(rows)
+                if progress:
+                    progress(rows_written, _fraction(rows[-1][tcol], start, end))
+        finally:
+            cur.close()
+        sink.close()
+        sink = None
+        os.replace(tmp, path)
+    finally:
+        if sink is not None:
+            try:
+                sink.close()
+            except Exception:
+                pass
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        # an abandoned unbuffered result makes the pool discard the connection on return
+        conn.close()
+    return {"path": path, "rows": rows_written, "bytes": os.path.getsize(path),
+            "seconds": time.perf_counter() - t0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream transaction_log / order lines to CSV or Parquet.")
+    parser.add_argument("dataset", choices=sorted(DATASETS))
+    parser.add_argument("start", help="YYYY-MM-DD (inclusive)")
+    parser.add_argument("end", help="YYYY-MM-DD (exclusive)")
+    parser.add_argument("--warehouse", type=int, default=None)
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--out", default=None, help=f"output file (default under {EXPORT_DIR}/)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    start = datetime.strptime(args.start, "%Y-%m-%d")
+    end = datetime.strptime(args.end, "%Y-%m-%d")
+
+    def report(rows, fraction):
+        pct = f"{fraction:6.1%}" if fraction is not None else "   ?  "
+        print(f"\r{pct}  {rows} rows", end="", file=sys.stderr, flush=True)
+
+    try:
+        res = export(args.dataset, start, end, args.warehouse, args.format, args.out, args.chunk_rows, report)
+    except (Error, RuntimeError, ValueError) as e:
+        print(f"\nfailed: {e}", file=sys.stderr)
+        return 1
+    print(f"\n{res['rows']} rows, {res['bytes'] / 1024 / 1024:.1f} MiB in {res['seconds']:.1f}s -> {res['path']}",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+# master_data.py
+# In-process master-data dictionaries (warehouse, item, supplier, customer, employee)
+# shared by every Streamlit session. Each entity is loaded once as an id -> name dict
+# ordered by name, then kept current with a cheap version probe: one primary-key read of
+# master_data_version, whose counters the table triggers bump on every insert, rename
+# and delete (changes_made.sql), whichever process made them. Pure appends are fetched
+# incrementally, anything else triggers a full reload. Entities with more than max_rows
+# rows are not held at all; their pickers search the table by name instead (search()).
+import threading
+import time
+
+import db
+import query_cache
+
+try:
+    from config import MASTER_DATA_CONFIG
+except ImportError:
+    MASTER_DATA_CONFIG = {}
+
+MASTER_DATA_DEFAULTS = {
+    "check_interval": 5.0,   # seconds between version probes per entity
+    "max_rows": 300000,      # entities above this are searched server-side instead of held
+    "search_limit": 200,     # rows returned by one search()
+}
+
+# table -> (key column, label column)
+ENTITIES = {
+    "warehouse": ("warehouse_id", "name"),
+    "item": ("item_id", "name"),
+    "supplier": ("supplier_id", "name"),
+    "customer": ("customer_id", "name"),
+    "employee": ("emp_id", "name"),
+}
+
+
+def _sort_key(pair):
+    return (pair[1] or "").casefold()
+
+
+def _sorted(rows):
+    # the one ordering for full loads, appends and searches (not the server collation)
+    return dict(sorted(rows, key=_sort_key))
+
+
+class _Snapshot:
+    """Immutable view of one entity; swapped atomically on refresh."""
+
+    __slots__ = ("choices", "version", "max_id", "oversized", "loaded_at", "_options")
+
+    def __init__(self, choices, version, oversized=False):
+        self.choices = choices
+        self.version = version
+        self.max_id = max(choices) if choices else 0
+        self.oversized = oversized
+        self.loaded_at = time.time()
+        self._options = None
+
+    def options(self):
+        # "id - name" labels as used by the selectboxes; built once per snapshot
+        if self._options is None:
+            self._options = [f"{k} - {v}" for k, v in self.choices.items()]
+        return self._options
+
+
+class _Entity:
+    def __init__(self, table, key_col, label_col):
+        self.table = table
+        self.key_col = key_col
+        self.label_col = label_col
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.checked_at = 0.0
+        self.dirty = False
+        self.full_loads = 0
+        self.incremental_loads = 0
+
+
+class MasterDataStore:
+    def __init__(self, check_interval=5.0, max_rows=300000, search_limit=200):
+        self.check_interval = float(check_interval)
+        self.max_rows = int(max_rows)
+        self.search_limit = int(search_limit)
+        self._entities = {t: _Entity(t, k, l) for t, (k, l) in ENTITIES.items()}
+
+    # ----- loading -----
+    def _version(self, cur, ent):
+        """(inserts, changes, row_count) from master_data_version."""
+        cur.execute("SELECT inserts, changes, row_count FROM master_data_version WHERE entity = %s", (ent.table,))
+        row = cur.fetchone()
+        if row is None:
+            raise LookupError(f"master_data_version has no row for {ent.table}; apply changes_made.sql")
+        return tuple(int(v) for v in row)
+
+    def _full_load(self, cur, ent, version):
+        # read after the version: a write in between is loaded now and reloaded once more later
+        if version[2] > self.max_rows:
+            ent.full_loads += 1
+            return _Snapshot({}, version, oversized=True)
+        cur.execute(f"SELECT {ent.key_col}, {ent.label_col} FROM {ent.table}")
+        choices = _sorted(cur.fetchall())
+        ent.full_loads += 1
+        return _Snapshot(choices, version, oversized=len(choices) > self.max_rows)
+
+    def _append_load(self, cur, ent, old, version):
+        cur.execute(
+            f"SELECT {ent.key_col}, {ent.label_col} FROM {ent.table} WHERE {ent.key_col} > %s",
+            (old.max_id,),
+        )
+        new_rows = cur.fetchall()
+        if len(new_rows) != version[0] - old.version[0] or len(old.choices) + len(new_rows) > self.max_rows:
+            # an insert below the max id, or one we already had: fall back to a full reload
+            return self._full_load(cur, ent, version)
+        ent.incremental_loads += 1
+        return _Snapshot(_sorted(list(old.choices.items()) + list(new_rows)), version)
+
+    def _refresh(self, ent):
+        conn = db.get_connection()
+        # clear first so a write landing mid-refresh marks the entity dirty again
+        dirty, ent.dirty = ent.dirty, False
+        try:
+            cur = conn.cursor()
+            try:
+                version = self._version(cur, ent)
+                old = ent.snapshot
+                if old is not None and version == old.version:
+                    snap = old
+                elif old is None or old.oversized or version[1] != old.version[1]:
+                    snap = self._full_load(cur, ent, version)
+                else:
+                    snap = self._append_load(cur, ent, old, version)
+            finally:
+                cur.close()
+        except Exception:
+            ent.dirty = ent.dirty or dirty
+            raise
+        finally:
+            conn.close()
+        ent.snapshot = snap
+        ent.checked_at = time.monotonic()
+
+    def _get(self, table):
+        ent = self._entities[table]
+        snap = ent.snapshot
+        if snap is not None and not ent.dirty and time.monotonic() - ent.checked_at < self.check_interval:
+            return snap
+        with ent.lock:
+            # another session may have refreshed while we waited
+            if ent.snapshot is None or ent.dirty or time.monotonic() - ent.checked_at >= self.check_interval:
+                self._refresh(ent)
+            return ent.snapshot
+
+    # ----- public API -----
+    def handles(self, table, key_col, label_col):
+        return ENTITIES.get(table) == (key_col, label_col)
+
+    def choices(self, table):
+        """id -> name dict ordered by name ({} when oversized). Shared between sessions: do not mutate."""
+        return self._get(table).choices
+
+    def oversized(self, table):
+        """True when the entity is above max_rows and has to be picked through search()."""
+        return self._get(table).oversized
+
+    def search(self, table, text, limit=None):
+        """id -> name dict of up to `limit` rows whose name starts with `text`, ordered like choices()."""
+        ent = self._entities[table]
+        pattern = (text or "").replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        conn = db.get_connection()
+        try:
+            cur = conn.cursor()
+            try:
+                cur.execute(
+                    f"SELECT {ent.key_col}, {ent.label_col} FROM {ent.table} "
+                    f"WHERE {ent.label_col} LIKE %s ORDER BY {ent.label_col} LIMIT %s",
+                    (pattern, int(limit or self.search_limit)),
+                )
+                return _sorted(cur.fetchall())
+            finally:
+                cur.close()
+        finally:
+            conn.close()
+
+    def options(self, table):
+        """['id - name', ...] in the same order as choices()."""
+        return self._get(table).options()
+
+    def mark_dirty(self, tables):
+        for t, ent in self._entities.items():
+            if tables is None or t in tables:
+                ent.dirty = True
+
+    def stats(self):
+        out = {}
+        for t, ent in self._entities.items():
+            snap = ent.snapshot
+            out[t] = {
+                "rows": len(snap.choices) if snap else 0,
+                "oversized": bool(snap and snap.oversized),
+                "full_loads": ent.full_loads,
+                "incremental_loads": ent.incremental_loads,
+            }
+        return out
+
+
+_opts = dict(MASTER_DATA_DEFAULTS)
+_opts.update(MASTER_DATA_CONFIG or {})
+store = MasterDataStore(**_opts)
+
+# Writes that go through exec_query()/the stock transactions reach the store via the
+# cache invalidation hook, so a user's own insert/rename shows up on the next rerun.
+query_cache.cache.add_listener(store.mark_dirty)
@@ -0,0 +1,317 @@
+# metrics.py
+# Process-wide counters and latency histograms for the business and DB operations,
+# exposed in the Prometheus text exposition format (0.0.4) for operational dashboards.
+# Exposure is configured with an optional METRICS_CONFIG dict in config.py:
+#   - an HTTP endpoint (default 127.0.0.1:9464/metrics) served from a daemon thread, and/or
+#   - a text file rewritten every few seconds (for node_exporter's textfile collector).
+# Labels are kept low-cardinality (page, operation, warehouse, ...); each metric caps its
+# number of series and folds anything beyond the cap into one "_other" series.
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from config import METRICS_CONFIG
+except ImportError:
+    METRICS_CONFIG = {}
+
+METRICS_DEFAULTS = {
+    "host": "127.0.0.1",
+    "port": 9464,              # None disables the HTTP endpoint
+    "textfile": None,          # e.g. "/var/lib/node_exporter/textfile/inventory.prom"
+    "textfile_interval": 15.0,
+    "max_series": 200,         # per metric
+}
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; covers a sub-millisecond pool checkout up to a slow month report
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_opts = dict(METRICS_DEFAULTS)
+_opts.update(METRICS_CONFIG or {})
+
+OVERFLOW = "_other"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+def _num(v):
+    if v == float("inf"):
+        return "+Inf"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v)) if abs(v) < 1e15 else repr(v)
+    return repr(v) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        key = tuple(str(labels[n]) for n in self.labels)
+        if key not in self._series and len(self._series) >= _opts["max_series"]:
+            key = tuple(OVERFLOW for _ in self.labels)
+        return key
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._series.get(tuple(str(labels[n]) for n in self.labels), 0)
+
+    def render(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        return self._header() + [f"{self.name}{_label_str(self.labels, k)} {_num(v)}" for k, v in series]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, seconds, **labels):
+        with self._lock:
+            key = self._key(labels)
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if seconds <= b:
+                    s[0][i] += 1
+                    break
+            s[1] += seconds
+            s[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the block, also when it raises."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self):
+        with self._lock:
+            series = sorted((k, (list(s[0]), s[1], s[2])) for k, s in self._series.items())
+        out = self._header()
+        for key, (counts, total, n) in series:
+            cumulative = 0
+            for b, c in zip(self.buckets, counts):
+                cumulative += c
+                out.append(f"{self.name}_bucket{_label_str(self.labels, key, ('le', _num(float(b))))} {cumulative}")
+            out.append(f"{self.name}_bucket{_label_str(self.labels, key, ('le', '+Inf'))} {n}")
+            out.append(f"{self.name}_sum{_label_str(self.labels, key)} {_num(total)}")
+            out.append(f"{self.name}_count{_label_str(self.labels, key)} {n}")
+        return out
+
+
+# ---------- REGISTRY ----------
+_registry = {}
+_registry_lock = threading.Lock()
+_collectors = []
+
+
+def _register(cls, name, help, labels=(), **kwargs):
+    with _registry_lock:
+        m = _registry.get(name)
+        if m is None:
+            m = _registry[name] = cls(name, help, labels, **kwargs)
+        elif not isinstance(m, cls) or m.labels != tuple(labels):
+            raise ValueError(f"metric {name} already registered with a different type or labels")
+        return m
+
+
+def counter(name, help, labels=()):
+    return _register(Counter, name, help, labels)
+
+
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, help, labels, buckets=buckets)
+
+
+def add_collector(fn):
+    """
+    fn() -> [(name, 'gauge'|'counter', help, [(labels_dict, value), ...]), ...]
+    Called at scrape time for numbers that already live elsewhere (pool, cache stats).
+    """
+    _collectors.append(fn)
+
+
+def _render_collected(name, kind, help, samples):
+    out = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        names = tuple(labels)
+        out.append(f"{name}{_label_str(names, [labels[n] for n in names])} {_num(value)}")
+    return out
+
+
+def render():
+    """All metrics in the Prometheus text format."""
+    with _registry_lock:
+        metrics = [_registry[n] for n in sorted(_registry)]
+    lines = []
+    for m in metrics:
+        lines.extend(m.render())
+    for fn in list(_collectors):
+        try:
+            for name, kind, help, samples in fn():
+                lines.extend(_render_collected(name, kind, help, samples))
+        except Exception:
+            # a broken collector must not take the whole scrape down
+            continue
+    return "\n".join(lines) + "\n"
+
+
+# ---------- APPLICATION METRICS ----------
+PO_RECEIVED = counter("inv_po_received_total", "Purchase orders received.", ("warehouse", "mode"))
+PO_RECEIVED_UNITS = counter("inv_po_received_units_total", "Units booked into stock by PO receipts.", ("warehouse",))
+PO_RECEIVE_SECONDS = histogram("inv_po_receive_seconds", "PO receive transaction time, commit included.", ("mode",))
+SO_SHIPPED = counter("inv_so_shipped_total", "Sales orders shipped.", ("warehouse",))
+SO_SHIP_SECONDS = histogram("inv_so_ship_seconds", "SO ship transaction time (locks, stock check, decrements, commit).",
+                            ("warehouse",))
+STOCK_ADJUSTS = counter("inv_stock_adjust_total", "Manual stock adjustments and returns.", ("warehouse", "kind"))
+STOCK_OP_REJECTED = counter("inv_stock_op_rejected_total", "Stock operations refused by a business rule.",
+                            ("operation",))
+DB_ERRORS = counter("inv_db_errors_total", "mysql.connector errors caught by the pages.", ("page", "operation"))
+DB_CONNECT_SECONDS = histogram("inv_db_connect_seconds", "Time to open a new MySQL connection.")
+DB_CHECKOUT_SECONDS = histogram("inv_db_checkout_seconds", "Pool checkout time, waits and health pings included.")
+REPORT_SECONDS = histogram("inv_report_seconds", "Report generation time.", ("report",))
+PAGE_SECONDS = histogram("inv_page_render_seconds", "Streamlit page script time per rerun.", ("page",))
+API_SECONDS = histogram("inv_api_request_seconds", "HTTP API request time.", ("route", "status"))
+
+_local = threading.local()
+
+
+@contextmanager
+def source(name):
+    """Label DB errors raised inside the block with `name` (a page, or "api")."""
+    prev = getattr(_local, "page", None)
+    _local.page = name
+    try:
+        yield
+    finally:
+        _local.page = prev
+
+
+@contextmanager
+def page(name):
+    """Time one page rerun and label DB errors raised inside it with the page."""
+    with source(name), PAGE_SECONDS.time(page=name):
+        yield
+
+
+def current_page():
+    return getattr(_local, "page", None) or "none"
+
+
+def db_error(operation):
+    DB_ERRORS.inc(page=current_page(), operation=operation)
+
+
+# ---------- EXPOSITION ----------
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def write_textfile(path):
+    """Write the current metrics atomically (rename) so a collector never reads half a file."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+def _textfile_loop(path, interval):
+    while True:
+        try:
+            write_textfile(path)
+        except OSError:
+            pass
+        time.sleep(interval)
+
+
+_exporter_lock = threading.Lock()
+_exporter = {"started": False, "http": None, "textfile": None, "error": None}
+
+
+def start_exporter():
+    """
+    Start the HTTP endpoint and/or textfile writer once per process (Streamlit re-runs
+    app.py on every interaction, this module is imported once). Never raises: a port
+    already in use is reported by exporter_status().
+    """
+    with _exporter_lock:
+        if _exporter["started"]:
+            return exporter_status()
+        _exporter["started"] = True
+        if _opts.get("port"):
+            try:
+                server = ThreadingHTTPServer((_opts["host"], int(_opts["port"])), _Handler)
+                server.daemon_threads = True
+                threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+                _exporter["http"] = f"http://{_opts['host']}:{server.server_address[1]}/metrics"
+            except OSError as e:
+                _exporter["error"] = f"metrics endpoint on {_opts['host']}:{_opts['port']} not started: {e}"
+        if _opts.get("textfile"):
+            path = _opts["textfile"]
+            threading.Thread(target=_textfile_loop, args=(path, float(_opts["textfile_interval"])),
+                             name="metrics-textfile", daemon=True).start()
+            _exporter["textfile"] = path
+    return exporter_status()
+
+
+def exporter_status():
+    return {k: v for k, v in _exporter.items() if k != "started"}
+
+
+if __name__ == "__main__":
+    # one-off dump, e.g. to check the format: python metrics.py
+    print(render(), end="")
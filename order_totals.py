@@ -0,0 +1,171 @@
+# order_totals.py
+# purchase_order / sales_order total_amount is kept current by delta triggers on the
+# detail tables (changes_made.sql): every line change adds its own value difference
+# to the header. This module has the two paths around them:
+#   insert_lines()  bulk line insert with the triggers deferred, then one recompute
+#   verify()        recompute every total in one set-based pass and report drift
+#
+#   python order_totals.py verify          # report headers whose total drifted
+#   python order_totals.py verify --fix    # ... and repair them
+import argparse
+import sys
+
+from mysql.connector import Error
+
+import db
+import query_cache
+from stock_ops import BATCH_ROWS, StockOpError
+
+# side -> (header table, detail table, id column)
+SIDES = {
+    "purchase": ("purchase_order", "purchase_order_details", "po_id"),
+    "sales": ("sales_order", "sales_order_details", "so_id"),
+}
+
+# session variable checked by the detail triggers; the pool resets sessions on return,
+# so a connection never goes back with it still set
+DEFER_VAR = "@order_totals_deferred"
+
+
+def _in_list(values):
+    return ",".join(["%s"] * len(values))
+
+
+def recompute(conn, side, order_ids=None):
+    """
+    Set total_amount from the detail lines with one UPDATE ... JOIN, for `order_ids`
+    or for every header when None. Runs in the caller's transaction.
+    Returns the number of headers whose total changed.
+    """
+    head, det, idc = SIDES[side]
+    params = []
+    det_where = head_where = ""
+    if order_ids is not None:
+        ids = sorted({int(i) for i in order_ids})
+        if not ids:
+            return 0
+        det_where = f"WHERE {idc} IN ({_in_list(ids)})"
+        head_where = f"WHERE h.{idc} IN ({_in_list(ids)})"
+        params = ids + ids
+    else:
+        head_where = f"WHERE h.{idc} > 0"
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            f"""
+            UPDATE {head} h
+            LEFT JOIN (
+              SELECT {idc}, SUM(quantity * price) AS total FROM {det} {det_where} GROUP BY {idc}
+            ) d ON d.{idc} = h.{idc}
+            SET h.total_amount = IFNULL(d.total, 0.00)
+            {head_where}
+            """,
+            params,
+        )
+        return cur.rowcount
+    finally:
+        cur.close()
+
+
+def insert_lines(conn, side, lines):
+    """
+    Bulk-insert detail lines [(order_id, item_id, quantity, price), ...] inside the
+    caller's transaction. Headers are locked first (in id order), the per-row total
+    triggers are switched off for the batch, and each touched header is recomputed once.
+    Returns the number of lines inserted.
+    """
+    head, det, idc = SIDES[side]
+    lines = [(int(o), int(i), int(q), p) for o, i, q, p in lines]
+    if not lines:
+        return 0
+    ids = sorted({o for o, _, _, _ in lines})
+    cur = conn.cursor()
+    try:
+        cur.execute(f"SELECT {idc} FROM {head} WHERE {idc} IN ({_in_list(ids)}) ORDER BY {idc} FOR UPDATE", ids)
+        found = {int(r[0]) for r in cur.fetchall()}
+        missing = [o for o in ids if o not in found]
+        if missing:
+            raise StockOpError(f"{head} not found: {', '.join(map(str, missing))}")
+        cur.execute(f"SET {DEFER_VAR} = 1")
+        try:
+            sql = f"INSERT INTO {det} ({idc}, item_id, quantity, price) VALUES (%s,%s,%s,%s)"
+            for i in range(0, len(lines), BATCH_ROWS):
+                cur.executemany(sql, lines[i:i + BATCH_ROWS])
+        finally:
+            cur.execute(f"SET {DEFER_VAR} = NULL")
+    finally:
+        cur.close()
+    recompute(conn, side, ids)
+    return len(lines)
+
+
+def drift_query(side, limit=None):
+    head, det, idc = SIDES[side]
+    sql = f"""
+        SELECT h.{idc} AS order_id, h.total_amount, IFNULL(d.total, 0.00) AS lines_total
+        FROM {head} h
+        LEFT JOIN (
+          SELECT {idc}, SUM(quantity * price) AS total FROM {det} GROUP BY {idc}
+        ) d ON d.{idc} = h.{idc}
+        WHERE h.total_amount <> IFNULL(d.total, 0.00)
+        ORDER BY h.{idc}
+    """
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    return sql
+
+
+def verify(sides=None, fix=False, limit=1000):
+    """
+    Compare every header total with the sum of its lines (one grouped pass per side).
+    Returns {side: [(order_id, total_amount, lines_total), ...]} (at most `limit` rows
+    each); with fix=True the drifted headers are recomputed and committed.
+    """
+    out = {}
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        try:
+            for side in sides or SIDES:
+                cur.execute(drift_query(side, limit))
+                out[side] = [(int(o), t, l) for o, t, l in cur.fetchall()]
+        finally:
+            cur.close()
+        if fix and any(out.values()):
+            for side, rows in out.items():
+                if rows:
+                    recompute(conn, side, [r[0] for r in rows])
+            conn.commit()
+            query_cache.invalidate_tables(*(SIDES[s][0] for s, rows in out.items() if rows))
+    finally:
+        conn.close()
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check order header totals against their lines.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    v = sub.add_parser("verify", help="report (and optionally repair) drifted totals")
+    v.add_argument("--fix", action="store_true", help="recompute the drifted headers")
+    v.add_argument("--side", choices=sorted(SIDES), help="only check one order type")
+    v.add_argument("--limit", type=int, default=1000, help="max drifted orders listed per side")
+    args = parser.parse_args(argv)
+
+    try:
+        drift = verify([args.side] if args.side else None, fix=args.fix, limit=args.limit)
+    except Error as e:
+        print(f"verify failed: {e}", file=sys.stderr)
+        return 1
+    bad = 0
+    for side, rows in drift.items():
+        print(f"{side}: {len(rows)} drifted")
+        for order_id, total, lines_total in rows:
+            print(f"  {order_id}: header {total}, lines {lines_total}")
+        bad += len(rows)
+    if bad and args.fix:
+        print("fixed")
+    return 1 if bad and not args.fix else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+# query_cache.py
+# Opt-in, process-wide result cache for read-only queries (fetch_df(..., cache=True)).
+# Entries are keyed on normalized SQL + params, expire after a TTL, are evicted LRU
+# under an entry/memory cap, and are dropped as soon as a write touches a table
+# the cached query reads.
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+try:
+    from config import CACHE_CONFIG
+except ImportError:
+    CACHE_CONFIG = {}
+
+CACHE_DEFAULTS = {
+    "ttl": 60.0,                      # seconds; bounds staleness from writers outside this process
+    "max_entries": 512,
+    "max_bytes": 64 * 1024 * 1024,    # approximate DataFrame memory across all entries
+}
+
+# Tables that DB triggers write to when the key table changes
+# (see review3(triggers,func,procedures).sql and changes_made.sql).
+TRIGGER_WRITES = {
+    "stock": {"reorder_alerts", "low_stock"},
+    "item": {"low_stock", "reorder_alerts"},
+    "purchase_order_details": {"purchase_order"},
+    "sales_order_details": {"sales_order"},
+}
+
+_WS_RE = re.compile(r"\s+")
+_READ_TABLES_RE = re.compile(r"\b(?:from|join)\s+`?(\w+)`?", re.IGNORECASE)
+_WRITE_TABLE_RE = re.compile(
+    r"^\s*(?:insert\s+(?:ignore\s+)?into|replace\s+into|update|delete\s+from)\s+`?(\w+)`?",
+    re.IGNORECASE,
+)
+_STR_LIT_RE = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUM_LIT_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN\s*\((?:\s*(?:\?|%s)\s*,?)+\)", re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    return _WS_RE.sub(" ", sql).strip().rstrip(";").strip()
+
+
+def fingerprint(sql):
+    """Query family: normalized SQL with literals and IN-lists collapsed."""
+    s = normalize_sql(sql)
+    s = _STR_LIT_RE.sub("?", s)
+    s = _NUM_LIT_RE.sub("?", s)
+    s = _IN_LIST_RE.sub("IN (...)", s)
+    return s
+
+
+def read_tables(sql):
+    return frozenset(t.lower() for t in _READ_TABLES_RE.findall(sql))
+
+
+def write_tables(sql):
+    """
+    Tables a statement writes to, including trigger side effects.
+    Returns None when it can't be determined (CALL, DDL, ...), meaning "assume everything".
+    """
+    m = _WRITE_TABLE_RE.match(sql)
+    if not m:
+        return None
+    return expand_tables([m.group(1)])
+
+
+def expand_tables(tables):
+    out = set()
+    for t in tables:
+        t = t.lower()
+        out.add(t)
+        out |= TRIGGER_WRITES.get(t, set())
+    return out
+
+
+def _df_bytes(df):
+    try:
+        return int(df.memory_usage(index=True, deep=True).sum())
+    except Exception:
+        return 0
+
+
+class QueryCache:
+    def __init__(self, ttl=60.0, max_entries=512, max_bytes=64 * 1024 * 1024):
+        self.ttl = float(ttl)
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (df, tables, expires_at, nbytes, family)
+        self._by_table = {}             # table -> set(keys)
+        self._table_gen = {}            # table -> write generation
+        self._global_gen = 0            # bumped by invalidate(None)
+        self._bytes = 0
+        self._families = {}             # family -> {"hits","misses"}
+        self._evictions = 0
+        self._invalidations = 0
+        self._listeners = []            # callables(tables or None), run after invalidation
+
+    # ----- internals (lock held) -----
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        _, tables, _, nbytes, _ = entry
+        self._bytes -= nbytes
+        for t in tables:
+            keys = self._by_table.get(t)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[t]
+
+    def _count(self, family, hit):
+        c = self._families.setdefault(family, {"hits": 0, "misses": 0})
+        c["hits" if hit else "misses"] += 1
+
+    # ----- public API -----
+    @staticmethod
+    def make_key(sql, params):
+        return (normalize_sql(sql), tuple(params or ()))
+
+    def _generation(self, tables):
+        return (self._global_gen,) + tuple(self._table_gen.get(t, 0) for t in sorted(tables))
+
+    def generation(self, tables):
+        with self._lock:
+            return self._generation(tables)
+
+    def get(self, key, family):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] < time.monotonic():
+                self._drop(key)
+                entry = None
+            self._count(family, entry is not None)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            # shallow copy: callers may add columns without touching the cached frame
+            return entry[0].copy(deep=False)
+
+    def put(self, key, df, tables, family, generation, ttl=None):
+        """Store a result unless one of its tables was written since `generation` was taken."""
+        nbytes = _df_bytes(df)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if self._generation(tables) != generation:
+                return
+            self._drop(key)
+            expires = time.monotonic() + (self.ttl if ttl is None else float(ttl))
+            self._entries[key] = (df.copy(deep=False), tables, expires, nbytes, family)
+            self._bytes += nbytes
+            for t in tables:
+                self._by_table.setdefault(t, set()).add(key)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self._evictions += 1
+
+    def add_listener(self, fn):
+        """Register fn(tables) to be told about writes; tables is None for "everything"."""
+        self._listeners.append(fn)
+
+    def invalidate(self, tables=None):
+        """Drop entries reading any of `tables` (None drops everything)."""
+        expanded = None if tables is None else expand_tables(tables)
+        with self._lock:
+            self._invalidations += 1
+            if expanded is None:
+                self._global_gen += 1
+                self._entries.clear()
+                self._by_table.clear()
+                self._bytes = 0
+            else:
+                for t in expanded:
+                    self._table_gen[t] = self._table_gen.get(t, 0) + 1
+                    for key in list(self._by_table.get(t, ())):
+                        self._drop(key)
+        for fn in self._listeners:
+            try:
+                fn(expanded)
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "families": {f: dict(c) for f, c in self._families.items()},
+            }
+
+
+# ---------- PROCESS-WIDE CACHE ----------
+_opts = dict(CACHE_DEFAULTS)
+_opts.update(CACHE_CONFIG or {})
+cache = QueryCache(**_opts)
+
+
+def invalidate_tables(*tables):
+    cache.invalidate(tables)
+
+
+def invalidate_for_write(sql):
+    cache.invalidate(write_tables(sql))
+
+
+def _cache_metrics():
+    s = cache.stats()
+    # per-family counts would be one series per query shape; export the totals only
+    hits = sum(c["hits"] for c in s["families"].values())
+    misses = sum(c["misses"] for c in s["families"].values())
+    return [
+        ("inv_query_cache_lookups_total", "counter", "Result cache lookups.",
+         [({"result": "hit"}, hits), ({"result": "miss"}, misses)]),
+        ("inv_query_cache_entries", "gauge", "Result cache entries.", [({}, s["entries"])]),
+        ("inv_query_cache_bytes", "gauge", "Approximate result cache size.", [({}, s["bytes"])]),
+    ]
+
+
+metrics.add_collector(_cache_metrics)
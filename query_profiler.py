@@ -0,0 +1,258 @@
+# query_profiler.py
+# Per-rerun statement profiler behind the admin "Profile queries" toggle.
+# While a rerun is profiled, cursors handed out by db.PooledConnection are wrapped so
+# every execute()/executemany()/callproc() is recorded with its fingerprint, parameter
+# count, wall time (execute + fetch), rows returned and the page function that issued it.
+# When profiling is off, cursors are returned untouched: the only cost is one
+# thread-local lookup per cursor.
+#
+# Recording is per thread, which matches Streamlit: each rerun runs on its session's
+# script thread.
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import query_cache
+
+_local = threading.local()
+
+# files and app helpers skipped when looking for the statement's caller
+_SKIP_FILES = {"query_profiler.py", "db.py", "query_cache.py", "cursor.py", "cursor_cext.py"}
+_HELPERS = {"fetch_df", "fetch_dfs", "exec_query", "load_choices", "get_connection"}
+
+
+class Record:
+    __slots__ = ("sql", "params", "fingerprint", "kind", "n_params", "wall_ms", "rows", "page", "site", "cached")
+
+    def __init__(self, sql, params, kind, n_params, page, site, cached=False):
+        self.sql = sql
+        self.params = params
+        self.fingerprint = query_cache.fingerprint(sql)
+        self.kind = kind
+        self.n_params = n_params
+        self.wall_ms = 0.0
+        self.rows = 0
+        self.page = page
+        self.site = site
+        self.cached = cached
+
+    def as_dict(self):
+        return {s: getattr(self, s) for s in self.__slots__}
+
+
+def start():
+    """Begin recording statements issued by this thread (the current rerun)."""
+    _local.records = []
+
+
+def stop():
+    """Stop recording and return the captured records."""
+    records = getattr(_local, "records", None)
+    _local.records = None
+    return records or []
+
+
+def active():
+    return getattr(_local, "records", None) is not None
+
+
+def current():
+    """This thread's record list (to hand to worker threads), or None when not profiling."""
+    return getattr(_local, "records", None)
+
+
+def origin():
+    """(page, site) of the calling code, for statements a worker thread runs on its behalf."""
+    return _caller() if active() else None
+
+
+@contextmanager
+def attached(records, origin=None):
+    """Record this thread's statements into another thread's list (db.fetch_parallel workers)."""
+    if records is None:
+        yield
+        return
+    _local.records, _local.origin = records, origin
+    try:
+        yield
+    finally:
+        _local.records, _local.origin = None, None
+
+
+def _count(params):
+    if params is None:
+        return 0
+    try:
+        return len(params)
+    except TypeError:
+        return 1
+
+
+def _caller():
+    """(page function, 'function:line' of the first app frame that is not a DB helper)."""
+    page, fallback, site = "", "", ""
+    f = sys._getframe(1)
+    while f is not None:
+        code = f.f_code
+        base = os.path.basename(code.co_filename)
+        if base not in _SKIP_FILES:
+            if base == "app.py":
+                if not site and code.co_name not in _HELPERS:
+                    site = f"{code.co_name}:{f.f_lineno}"
+                if code.co_name.startswith("page_"):
+                    page = code.co_name
+                    break
+                if not fallback and (code.co_name.startswith("show_") or code.co_name == "main"):
+                    fallback = code.co_name
+            elif not site:
+                # stock_ops / rollups / ... called from a page
+                site = f"{os.path.splitext(base)[0]}.{code.co_name}:{f.f_lineno}"
+        f = f.f_back
+    return page or fallback or "?", site or "?"
+
+
+def _record(sql, params, kind, n_params, cached=False):
+    records = getattr(_local, "records", None)
+    if records is None:
+        return None
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    page, site = getattr(_local, "origin", None) or _caller()
+    rec = Record(sql, params, kind, n_params, page, site, cached)
+    records.append(rec)
+    return rec
+
+
+def note_cache_hit(sql, params, rows):
+    """fetch_df(cache=True) served from the result cache: recorded with zero DB time."""
+    rec = _record(sql, params, "cache", _count(params), cached=True)
+    if rec is not None:
+        rec.rows = rows
+
+
+class ProfiledCursor:
+    """Cursor proxy that times statements and counts fetched rows."""
+
+    def __init__(self, raw):
+        self._raw = raw
+        self._rec = None
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _timed(self, rec, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if rec is not None:
+                rec.wall_ms += (time.perf_counter() - t0) * 1000.0
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._rec = _record(operation, params, "execute", _count(params))
+        result = self._timed(self._rec, self._raw.execute, operation, params, *args, **kwargs)
+        if self._rec is not None and not self._raw.with_rows and self._raw.rowcount > 0:
+            self._rec.rows = self._raw.rowcount   # affected rows for writes
+        return result
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        seq_params = list(seq_params)
+        self._rec = _record(operation, None, "executemany", sum(_count(p) for p in seq_params))
+        result = self._timed(self._rec, self._raw.executemany, operation, seq_params, *args, **kwargs)
+        if self._rec is not None and self._raw.rowcount > 0:
+            self._rec.rows = self._raw.rowcount
+        return result
+
+    def callproc(self, procname, args=()):
+        self._rec = _record(f"CALL {procname}", args, "callproc", _count(args))
+        return self._timed(self._rec, self._raw.callproc, procname, args)
+
+    def fetchone(self):
+        row = self._timed(self._rec, self._raw.fetchone)
+        if row is not None and self._rec is not None:
+            self._rec.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._timed(self._rec, self._raw.fetchmany, *args, **kwargs)
+        if self._rec is not None:
+            self._rec.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._rec, self._raw.fetchall)
+        if self._rec is not None:
+            self._rec.rows += len(rows)
+        return rows
+
+
+def wrap(cursor):
+    return ProfiledCursor(cursor)
+
+
+# ---------- SUMMARIES ----------
+def slowest(records, n=10):
+    return sorted((r for r in records if not r.cached), key=lambda r: r.wall_ms, reverse=True)[:n]
+
+
+def repeated(records, min_count=2):
+    """Fingerprints issued more than once: [{'fingerprint','count','total_ms','rows','callers'}], most frequent first."""
+    groups = {}
+    for r in records:
+        g = groups.setdefault(r.fingerprint, {"fingerprint": r.fingerprint, "count": 0, "cached": 0,
+                                              "total_ms": 0.0, "rows": 0, "callers": set()})
+        g["count"] += 1
+        g["cached"] += int(r.cached)
+        g["total_ms"] += r.wall_ms
+        g["rows"] += r.rows
+        g["callers"].add(r.site)
+    out = [dict(g, callers=", ".join(sorted(g["callers"]))) for g in groups.values() if g["count"] >= min_count]
+    return sorted(out, key=lambda g: (g["count"], g["total_ms"]), reverse=True)
+
+
+def explainable(record):
+    head = record.sql.lstrip().split(None, 1)[0].upper() if record.sql.strip() else ""
+    return record.kind in ("execute", "cache") and head in ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT", "REPLACE")
+
+
+# ---------- CAPTURE ----------
+# statements saved from profiled reruns, read by bench.index_advisor
+CAPTURE_PATH = os.path.join("bench", "captured_queries.jsonl")
+
+
+def load_capture(path=CAPTURE_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def save_capture(records, path=CAPTURE_PATH):
+    """Append one example per new fingerprint (params as JSON, dates as strings). Returns how many were added."""
+    seen = {c["fingerprint"] for c in load_capture(path)}
+    out = []
+    for r in records:
+        if r.fingerprint in seen or not explainable(r):
+            continue
+        seen.add(r.fingerprint)
+        out.append(json.dumps({"fingerprint": r.fingerprint, "sql": r.sql, "params": r.params,
+                               "page": r.page, "site": r.site}, default=str))
+    if out:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(out) + "\n")
+    return len(out)
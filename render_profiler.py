@@ -0,0 +1,220 @@
+# render_profiler.py
+# Sampling profiler for one Streamlit rerun (admin "Profile next rerun" button).
+# A daemon thread samples the script thread's Python stack every few milliseconds with
+# sys._current_frames(), so time blocked in MySQL shows up as well as CPU time. Each
+# sample also reads the script thread's CPU clock to tell on-CPU from waiting, and is
+# attributed to a layer (app, pandas, streamlit, mysql) by its innermost library frame.
+# Captures are written to PROFILE_CONFIG["dir"] as speedscope JSON (two profiles:
+# wall and on-CPU) plus folded stacks for flamegraph.pl; only the newest few are kept.
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+try:
+    from config import PROFILE_CONFIG
+except ImportError:
+    PROFILE_CONFIG = {}
+
+PROFILE_DEFAULTS = {
+    "interval": 0.005,   # seconds between samples
+    "dir": "profiles",
+    "keep": 10,          # newest captures kept on disk
+}
+
+_opts = dict(PROFILE_DEFAULTS)
+_opts.update(PROFILE_CONFIG or {})
+
+# innermost frame from one of these packages decides the sample's layer
+LAYERS = (
+    ("mysql", ("mysql/connector", "mysql\\connector", "socket.py", "ssl.py")),
+    ("pandas", ("pandas/", "pandas\\", "numpy/", "numpy\\", "pyarrow/", "pyarrow\\")),
+    ("streamlit", ("streamlit/", "streamlit\\", "tornado/", "tornado\\")),
+)
+
+
+def _layer(stack):
+    for name, filename, _ in reversed(stack):
+        for layer, marks in LAYERS:
+            if any(m in filename for m in marks):
+                return layer
+    return "app"
+
+
+def _cpu_clock(thread_id):
+    """CPU clock of another thread (Linux/BSD); None where the platform has none."""
+    try:
+        return time.pthread_getcpuclockid(thread_id)
+    except (AttributeError, OSError):
+        return None
+
+
+class Capture:
+    """Samples of one rerun: [(stack, seconds, on_cpu)], stack = ((func, file, firstline), ...) root first."""
+
+    def __init__(self, samples, started_at, wall_s, cpu_s):
+        self.samples = samples
+        self.started_at = started_at
+        self.wall_s = wall_s
+        self.cpu_s = cpu_s
+        pages = Counter(f[0] for stack, _, _ in samples for f in stack if f[0].startswith("page_"))
+        self.page = pages.most_common(1)[0][0] if pages else "main"
+
+    def layers(self):
+        """Share of sampled wall time per layer, largest first."""
+        total = sum(w for _, w, _ in self.samples) or 1.0
+        by = Counter()
+        for stack, w, _ in self.samples:
+            by[_layer(stack)] += w
+        return [(k, v / total) for k, v in by.most_common()]
+
+    def cpu_share(self):
+        total = sum(w for _, w, _ in self.samples)
+        if not total:
+            return None
+        return sum(w for _, w, cpu in self.samples if cpu) / total
+
+    def speedscope(self):
+        frames, index = [], {}
+        profiles = []
+        for name, keep in (("wall", lambda cpu: True), ("on-CPU", lambda cpu: cpu)):
+            stacks, weights = [], []
+            for stack, w, cpu in self.samples:
+                if not keep(cpu):
+                    continue
+                ids = []
+                for f in stack:
+                    if f not in index:
+                        index[f] = len(frames)
+                        frames.append({"name": f[0], "file": f[1], "line": f[2]})
+                    ids.append(index[f])
+                stacks.append(ids)
+                weights.append(w)
+            profiles.append({
+                "type": "sampled", "name": f"{self.page} ({name})", "unit": "seconds",
+                "startValue": 0, "endValue": sum(weights), "samples": stacks, "weights": weights,
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.page} {self.started_at:%Y-%m-%d %H:%M:%S}",
+            "exporter": "render_profiler.py",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def folded(self):
+        """Brendan Gregg's collapsed-stack format; weights in microseconds."""
+        agg = Counter()
+        for stack, w, _ in self.samples:
+            key = ";".join(f"{name} ({os.path.basename(filename)}:{line})" for name, filename, line in stack)
+            agg[key] += int(round(w * 1e6))
+        return "".join(f"{k} {v}\n" for k, v in sorted(agg.items()))
+
+    def save(self, directory=None):
+        """Write <stamp>_<page>.speedscope.json and .folded; prune old captures. Returns the JSON path."""
+        directory = directory or _opts["dir"]
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"{self.started_at:%Y%m%d-%H%M%S-%f}_{self.page}")
+        with open(base + ".speedscope.json", "w", encoding="utf-8") as f:
+            json.dump(self.speedscope(), f)
+        with open(base + ".folded", "w", encoding="utf-8") as f:
+            f.write(self.folded())
+        _prune(directory, int(_opts["keep"]))
+        return base + ".speedscope.json"
+
+
+class Sampler:
+    """Samples the calling thread's stack below the caller's frame until stop()."""
+
+    def __init__(self, interval=None):
+        self.interval = float(interval or _opts["interval"])
+        self._samples = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._target = threading.get_ident()
+        self._anchor = sys._getframe(1)
+        self._clock = _cpu_clock(self._target)
+        self._started_at = datetime.now()
+        self._t0 = time.perf_counter()
+        self._cpu0 = time.clock_gettime(self._clock) if self._clock is not None else None
+        self._thread = threading.Thread(target=self._run, name="render-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _stack(self, frame):
+        out = []
+        while frame is not None:
+            code = frame.f_code
+            out.append((code.co_name, code.co_filename, code.co_firstlineno))
+            if frame is self._anchor:
+                break
+            frame = frame.f_back
+        out.reverse()
+        return tuple(out)
+
+    def _run(self):
+        last = time.perf_counter()
+        last_cpu = self._cpu0
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            now = time.perf_counter()
+            on_cpu = True
+            if self._clock is not None:
+                try:
+                    cpu = time.clock_gettime(self._clock)
+                except OSError:
+                    cpu = last_cpu
+                # mostly on-CPU since the previous sample => count it as CPU time
+                on_cpu = (cpu - last_cpu) >= 0.5 * (now - last)
+                last_cpu = cpu
+            if frame is not None:
+                self._samples.append((self._stack(frame), now - last, on_cpu))
+            last = now
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        wall = time.perf_counter() - self._t0
+        cpu = None
+        if self._clock is not None:
+            try:
+                cpu = time.clock_gettime(self._clock) - self._cpu0
+            except OSError:
+                pass
+        return Capture(self._samples, self._started_at, wall, cpu)
+
+
+def _captures(directory):
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted((n for n in names if n.endswith(".speedscope.json")), reverse=True)
+
+
+def _prune(directory, keep):
+    for name in _captures(directory)[keep:]:
+        base = name[: -len(".speedscope.json")]
+        for suffix in (".speedscope.json", ".folded"):
+            try:
+                os.remove(os.path.join(directory, base + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def recent(directory=None):
+    """Newest captures first: [{'name', 'speedscope', 'folded'}] (paths)."""
+    directory = directory or _opts["dir"]
+    out = []
+    for name in _captures(directory):
+        base = os.path.join(directory, name[: -len(".speedscope.json")])
+        out.append({"name": os.path.basename(base), "speedscope": base + ".speedscope.json",
+                    "folded": base + ".folded"})
+    return out
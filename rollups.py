@@ -0,0 +1,254 @@
+# rollups.py
+# Daily movement rollup of transaction_log -> tlog_daily, keyed by
+# (day, warehouse, item, change_type, ref_type) with signed net quantity and move count.
+# The rollup advances from a log_id high-water mark kept in rollup_state, so each run
+# only reads log rows it has not seen yet.
+# log_ids are taken at insert time but become visible at commit, so a lower id can show
+# up after higher ones (a long transaction, a scan batch). Ids missing below the mark are
+# kept in rollup_gap and re-checked on every run until their rows appear (and are folded)
+# or every transaction that could still write them has ended.
+#
+#   python rollups.py update     # incremental, safe to run from cron every minute
+#   python rollups.py backfill   # rebuild from the whole log (resumable)
+import argparse
+import sys
+
+from mysql.connector import Error, errorcode
+
+import db
+import query_cache
+
+ROLLUP_NAME = "tlog_daily"
+
+# log rows folded per transaction
+BATCH_LOG_IDS = 200000
+
+# gap ranges folded around per transaction; a batch stops short of the next one
+MAX_GAPS_PER_BATCH = 100
+
+# without the PROCESS privilege (information_schema.INNODB_TRX) a gap is given up after
+# this long, i.e. it assumes no transaction writing the log stays open longer
+GAP_TIMEOUT_SECONDS = 3600
+
+# Signed movement of one log row: IN adds, OUT subtracts, ADJUST keeps its sign.
+# (The app writes OUT rows with a positive delta, sp_ship_so with a negative one.)
+SIGNED_DELTA_SQL = (
+    "CASE WHEN change_type = 'OUT' THEN -ABS(delta_qty) "
+    "WHEN change_type = 'IN' THEN ABS(delta_qty) ELSE delta_qty END"
+)
+
+FOLD_SQL = f"""
+    INSERT INTO tlog_daily (day, warehouse_id, item_id, change_type, ref_type, net_qty, moves)
+    SELECT DATE(logged_at), warehouse_id, item_id, change_type, ref_type,
+           SUM({SIGNED_DELTA_SQL}), COUNT(*)
+    FROM transaction_log
+    WHERE log_id > %s AND log_id <= %s{{skip}}
+    GROUP BY DATE(logged_at), warehouse_id, item_id, change_type, ref_type
+    ON DUPLICATE KEY UPDATE net_qty = net_qty + VALUES(net_qty), moves = moves + VALUES(moves)
+"""
+
+# present log ids after lo (up to hi), reduced to the ones right after a hole plus the last
+SCAN_SQL = """
+    SELECT log_id, prev, top FROM (
+      SELECT log_id, LAG(log_id, 1, %s) OVER (ORDER BY log_id) AS prev, MAX(log_id) OVER () AS top
+      FROM (SELECT log_id FROM transaction_log WHERE log_id > %s AND log_id <= %s ORDER BY log_id LIMIT %s) b
+    ) t
+    WHERE log_id > prev + 1 OR log_id = top
+    ORDER BY log_id
+"""
+
+_NO_LIMIT = 2 ** 63 - 1
+
+
+def settled_before(cur):
+    """
+    Server time before which every transaction that can still commit has started: a
+    log_id found missing before then either shows up in any later read or never will.
+    """
+    try:
+        # 2 s margin: trx_started has second precision and the view is cached up to 0.1 s
+        cur.execute(
+            "SELECT LEAST(NOW(), IFNULL(MIN(trx_started), NOW())) - INTERVAL 2 SECOND "
+            "FROM information_schema.INNODB_TRX WHERE trx_mysql_thread_id <> CONNECTION_ID()"
+        )
+    except Error as e:
+        if e.errno not in (errorcode.ER_SPECIFIC_ACCESS_DENIED_ERROR, errorcode.ER_TABLEACCESS_DENIED_ERROR):
+            raise
+        cur.execute("SELECT NOW() - INTERVAL %s SECOND", (GAP_TIMEOUT_SECONDS,))
+    return cur.fetchone()[0]
+
+
+def scan_log(cur, lo, hi=None, max_ids=None, max_gaps=None):
+    """
+    Which log ids after `lo` (through `hi`) are present, in one read.
+    Returns (top, gaps): top is the highest id covered (hi when bounded, else the last id
+    read; None when nothing was read) and gaps the [(first, last)] ranges missing up to it.
+    With max_gaps, top stops just before the range that would exceed it.
+    """
+    cur.execute(SCAN_SQL, (lo, lo, _NO_LIMIT if hi is None else hi, max_ids or _NO_LIMIT))
+    rows = cur.fetchall()
+    gaps, top = [], None
+    for log_id, prev, last in rows:
+        log_id, prev = int(log_id), int(prev)
+        if log_id > prev + 1:
+            if max_gaps is not None and len(gaps) == max_gaps:
+                return prev, gaps
+            gaps.append((prev + 1, log_id - 1))
+        top = int(last)
+    if hi is not None:
+        if top is None:
+            return hi, [(lo + 1, hi)] if hi > lo else []
+        if top < hi:
+            gaps.append((top + 1, hi))
+        top = hi
+    return top, gaps
+
+
+def _fold(cur, lo, hi, gaps):
+    """Fold the log rows in (lo, hi] except the gap ranges (rows there were not read yet)."""
+    skip = "".join(" AND log_id NOT BETWEEN %s AND %s" for _ in gaps)
+    cur.execute(FOLD_SQL.format(skip=skip), (lo, hi) + tuple(v for g in gaps for v in g))
+
+
+def _fold_batch(conn, max_ids=BATCH_LOG_IDS):
+    """
+    Fold log rows that appeared in earlier gaps, then the next batch after the high-water
+    mark. Returns how many log ids were settled (folded, or found missing for good).
+    """
+    cur = conn.cursor()
+    try:
+        settled = settled_before(cur)
+        conn.rollback()
+        # every read sees what was committed before it (so after `settled`), and
+        # INSERT ... SELECT takes no locks on transaction_log
+        conn.start_transaction(isolation_level="READ COMMITTED")
+        # row lock on the state row serializes concurrent rollup runs
+        cur.execute("SELECT last_log_id FROM rollup_state WHERE name = %s FOR UPDATE", (ROLLUP_NAME,))
+        row = cur.fetchone()
+        if row is None:
+            cur.execute("INSERT INTO rollup_state (name, last_log_id) VALUES (%s, 0)", (ROLLUP_NAME,))
+            lo = 0
+        else:
+            lo = int(row[0])
+        done = 0
+
+        cur.execute("SELECT first_id, last_id, seen_at FROM rollup_gap WHERE name = %s ORDER BY first_id",
+                    (ROLLUP_NAME,))
+        for first, last, seen_at in cur.fetchall():
+            first, last = int(first), int(last)
+            _, missing = scan_log(cur, first - 1, last)
+            if len(missing) == 1 and missing[0] == (first, last) and seen_at >= settled:
+                continue
+            _fold(cur, first - 1, last, missing)
+            cur.execute("DELETE FROM rollup_gap WHERE name = %s AND first_id = %s", (ROLLUP_NAME, first))
+            if seen_at >= settled:
+                _insert_gaps(cur, missing, seen_at)
+                done += (last - first + 1) - sum(b - a + 1 for a, b in missing)
+            else:
+                # every writer that could still add these ids has ended
+                done += last - first + 1
+
+        hi, gaps = scan_log(cur, lo, max_ids=max_ids, max_gaps=MAX_GAPS_PER_BATCH)
+        if hi is not None and hi > lo:
+            _fold(cur, lo, hi, gaps)
+            _insert_gaps(cur, gaps, None)
+            cur.execute("UPDATE rollup_state SET last_log_id = %s WHERE name = %s", (hi, ROLLUP_NAME))
+            done += hi - lo
+        if done:
+            conn.commit()
+        else:
+            conn.rollback()
+        return done
+    except Error:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def _insert_gaps(cur, gaps, seen_at):
+    if gaps:
+        cur.executemany(
+            "INSERT INTO rollup_gap (name, first_id, last_id, seen_at) VALUES (%s, %s, %s, IFNULL(%s, NOW()))",
+            [(ROLLUP_NAME, a, b, seen_at) for a, b in gaps],
+        )
+
+
+def pending_gaps(cur):
+    """[(first_id, last_id)] of log ids not folded yet below the high-water mark."""
+    cur.execute("SELECT first_id, last_id FROM rollup_gap WHERE name = %s ORDER BY first_id", (ROLLUP_NAME,))
+    return [(int(a), int(b)) for a, b in cur.fetchall()]
+
+
+def update_daily(max_batches=None):
+    """Bring tlog_daily up to date. Returns the number of log_ids settled."""
+    conn = db.get_connection()
+    total = 0
+    batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            n = _fold_batch(conn)
+            if not n:
+                break
+            total += n
+            batches += 1
+    finally:
+        conn.close()
+    if total:
+        query_cache.invalidate_tables("tlog_daily", "rollup_state", "rollup_gap")
+    return total
+
+
+def backfill(reset=False, progress=None):
+    """
+    Fold the whole existing log. With reset=True the rollup is emptied first;
+    without it, an interrupted backfill simply resumes from the high-water mark.
+    """
+    if reset:
+        conn = db.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM tlog_daily WHERE day IS NOT NULL")
+            cur.execute("DELETE FROM rollup_gap WHERE name = %s", (ROLLUP_NAME,))
+            cur.execute(
+                "INSERT INTO rollup_state (name, last_log_id) VALUES (%s, 0) "
+                "ON DUPLICATE KEY UPDATE last_log_id = 0",
+                (ROLLUP_NAME,),
+            )
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+    total = 0
+    while True:
+        n = update_daily(max_batches=1)
+        if not n:
+            break
+        total += n
+        if progress:
+            progress(total)
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the tlog_daily rollup of transaction_log.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("update", help="fold new log rows since the last run")
+    bf = sub.add_parser("backfill", help="fold the whole existing log (resumable)")
+    bf.add_argument("--reset", action="store_true", help="empty tlog_daily and start from log_id 0")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.cmd == "update":
+            print(f"folded {update_daily()} log ids")
+        else:
+            n = backfill(reset=args.reset, progress=lambda t: print(f"... {t} log ids", flush=True))
+            print(f"backfill done: {n} log ids")
+    except Error as e:
+        print(f"rollup failed: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,588 @@
+# scan_ingest.py
+# High-rate ingestion of single-unit barcode scans (dock scanners, via api.py POST /scans).
+# Pushing every scan through adjust_stock() costs a connection checkout, a locking SELECT,
+# an UPDATE and a log INSERT per scan. Here scans are:
+#   1. appended to a local journal (write-ahead, fsync'd before submit() returns) and
+#      queued in memory,
+#   2. taken off the queue every `window` seconds (or at `max_batch` scans) and committed
+#      as one transaction: stock rows locked once in (warehouse_id, item_id) order, one
+#      aggregated relative upsert per (warehouse, item), one transaction_log row per scan
+#      in bulk with the scan's own time and employee,
+#   3. marked done by a per-journal sequence high-water mark (scan_ingest_state) written
+#      in the same transaction, so replaying the journal after a crash applies every scan
+#      exactly once.
+# A scan that would take stock below zero, or names an unknown warehouse/item/employee,
+# is rejected on its own (written to rejected.jsonl in the journal slot) without holding
+# up the rest of its batch. A batch that fails (database down, or a bug) stays queued and
+# is retried with backoff; the worker thread's health is in status() and the metrics.
+#
+# Each process takes its own journal slot (flock'd directory under SCAN_CONFIG["dir"]),
+# so pre-forked API workers never share one; a restarted worker recovers its slot first.
+#
+#   python scan_ingest.py status        # pending scans per slot
+#   python scan_ingest.py drain         # apply what free slots still hold (e.g. after fewer workers)
+#   python scan_ingest.py feed < scans.jsonl
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import traceback
+from collections import deque
+from datetime import datetime
+from itertools import groupby, islice
+
+from mysql.connector import Error
+
+import db
+import metrics
+import query_cache
+from stock_ops import BATCH_ROWS, INSERT_LOG_SQL, UPSERT_STOCK_SQL
+
+try:
+    import fcntl
+except ImportError:  # Windows: one unlocked slot
+    fcntl = None
+
+try:
+    from config import SCAN_CONFIG
+except ImportError:
+    SCAN_CONFIG = {}
+
+SCAN_DEFAULTS = {
+    "dir": "journal",
+    "window": 0.25,                     # seconds scans are coalesced before a commit
+    "max_batch": 5000,                  # commit early once this many scans are queued
+    "max_pending": 200000,              # submit() refuses scans beyond this backlog
+    "fsync": True,                      # fsync the journal before submit() returns
+    "segment_bytes": 16 * 1024 * 1024,  # start a new journal segment after this size
+    "slots": 32,
+    "source": socket.gethostname(),     # scan_ingest_state key prefix; unique per host
+}
+
+_opts = dict(SCAN_DEFAULTS)
+_opts.update(SCAN_CONFIG or {})
+
+DIRECTIONS = ("IN", "OUT")
+MAX_RETRY_DELAY = 10.0
+
+# net outbound pairs: ck_stock_nonneg is checked on an upsert's insert row before ON
+# DUPLICATE KEY applies, so a negative quantity cannot go through UPSERT_STOCK_SQL
+DECREMENT_STOCK_SQL = (
+    "UPDATE stock SET quantity = quantity + %s, last_updated = %s WHERE warehouse_id = %s AND item_id = %s"
+)
+
+SCANS = metrics.counter("inv_scan_events_total", "Scans applied to stock.", ("direction",))
+SCANS_REJECTED = metrics.counter("inv_scan_rejected_total", "Scans rejected at commit time.", ("reason",))
+SCAN_BATCH_SECONDS = metrics.histogram("inv_scan_batch_seconds", "Scan micro-batch transaction time, commit included.")
+SCAN_ERRORS = metrics.counter("inv_scan_batch_errors_total", "Scan micro-batches that failed and were retried.",
+                             ("kind",))
+SCAN_BATCH_SIZE = metrics.histogram("inv_scan_batch_events", "Scans per committed micro-batch.",
+                                    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+
+
+class Backlog(Exception):
+    """More than max_pending scans are waiting; the caller should back off and resend."""
+
+
+def _in_list(values):
+    return ",".join(["%s"] * len(values))
+
+
+def _executemany(cur, sql, rows):
+    for i in range(0, len(rows), BATCH_ROWS):
+        cur.executemany(sql, rows[i:i + BATCH_ROWS])
+
+
+# ---------- SCAN EVENTS ----------
+def _id(value, name, required=True):
+    if value in (None, "") and not required:
+        return None
+    try:
+        v = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer") from None
+    if v <= 0:
+        raise ValueError(f"{name} must be positive")
+    return v
+
+
+def _when(value):
+    if value in (None, ""):
+        return datetime.now()
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        try:
+            dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            raise ValueError("scanned_at must be an ISO 8601 timestamp") from None
+    # logged_at is a TIMESTAMP read in the session time zone: store local wall time
+    return dt.astimezone().replace(tzinfo=None) if dt.tzinfo else dt
+
+
+def normalize(scan):
+    """
+    Validate one scan {'warehouse_id','item_id','direction': 'IN'|'OUT','quantity'?: 1,
+    'emp_id'?,'scanned_at'?} -> (warehouse_id, item_id, signed delta, emp_id, scanned_at).
+    """
+    if not isinstance(scan, dict):
+        raise ValueError("each scan must be an object")
+    direction = str(scan.get("direction", "")).upper()
+    if direction not in DIRECTIONS:
+        raise ValueError("direction must be IN or OUT")
+    qty = _id(scan.get("quantity", 1), "quantity")
+    return (_id(scan.get("warehouse_id"), "warehouse_id"), _id(scan.get("item_id"), "item_id"),
+            qty if direction == "IN" else -qty, _id(scan.get("emp_id"), "emp_id", required=False),
+            _when(scan.get("scanned_at")))
+
+
+def _encode(seq, ev):
+    wh, item, delta, emp, at = ev
+    return json.dumps({"seq": seq, "wh": wh, "item": item, "delta": delta, "emp": emp,
+                       "at": at.isoformat(timespec="microseconds")}, separators=(",", ":"))
+
+
+def _decode(line):
+    d = json.loads(line)
+    return d["seq"], (d["wh"], d["item"], d["delta"], d["emp"], datetime.fromisoformat(d["at"]))
+
+
+# ---------- JOURNAL ----------
+class Journal:
+    """
+    Append-only segments seg-<first seq>.jsonl in one slot directory. A segment is
+    deleted once every scan in it is committed (its successor starts past the mark).
+    """
+
+    def __init__(self, directory):
+        self.dir = directory
+        self.f = None
+        self.start = None
+
+    def segments(self):
+        names = sorted(n for n in os.listdir(self.dir) if n.startswith("seg-") and n.endswith(".jsonl"))
+        return [(int(n[4:-6]), os.path.join(self.dir, n)) for n in names]
+
+    def read(self, after):
+        """Journalled scans with seq > after, in order; also returns the highest seq seen."""
+        events, last = [], after
+        for _, path in self.segments():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        seq, ev = _decode(line)
+                    except (ValueError, KeyError):
+                        # torn last line of a crashed append: that submit() never returned
+                        continue
+                    last = max(last, seq)
+                    if seq > after:
+                        events.append((seq, ev))
+        return events, last
+
+    def open(self, first_seq):
+        if self.f is not None:
+            self.f.close()
+        self.start = first_seq
+        self.f = open(os.path.join(self.dir, f"seg-{first_seq:012d}.jsonl"), "a", encoding="utf-8")
+        if self.f.tell():
+            # reopening a segment that may end in a torn line: never append onto it
+            self.f.write("\n")
+
+    def append(self, lines, sync):
+        self.f.write("".join(line + "\n" for line in lines))
+        self.f.flush()
+        if sync:
+            os.fsync(self.f.fileno())
+
+    def size(self):
+        return self.f.tell() if self.f is not None else 0
+
+    def prune(self, committed):
+        segs = self.segments()
+        for (start, path), (next_start, _) in zip(segs, segs[1:]):
+            if next_start <= committed + 1 and start != self.start:
+                os.remove(path)
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+def _lock_slot(root, slots):
+    """First free slot directory under root, flock'd for this process's lifetime."""
+    for i in range(slots if fcntl else 1):
+        path = os.path.join(root, f"slot-{i:02d}")
+        os.makedirs(path, exist_ok=True)
+        fh = open(os.path.join(path, "lock"), "a")
+        if fcntl is None:
+            return path, fh
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return path, fh
+        except OSError:
+            fh.close()
+    raise RuntimeError(f"all {slots} scan journal slots under {root} are in use")
+
+
+# ---------- INGESTOR ----------
+class ScanIngestor:
+    def __init__(self, directory=None, window=None, max_batch=None, max_pending=None, fsync=None):
+        self.root = directory or _opts["dir"]
+        self.window = float(window if window is not None else _opts["window"])
+        self.max_batch = int(max_batch or _opts["max_batch"])
+        self.max_pending = int(max_pending or _opts["max_pending"])
+        self.fsync = bool(_opts["fsync"] if fsync is None else fsync)
+        self._lock = threading.Lock()          # seq assignment + journal append
+        self._flush_lock = threading.Lock()    # one micro-batch transaction at a time
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._pending = deque()                # (seq, event)
+        self._thread = None
+        self._slot_fh = None
+        self._seq = 0
+        self.slot = None
+        self.committed = 0
+        self.last_error = None
+        self.failing = 0                       # consecutive failed flush attempts
+        self.stats = {"applied": 0, "rejected": 0, "batches": 0, "errors": 0}
+
+    def open(self, slot_dir=None):
+        """Take a journal slot and queue what it still holds past the committed mark."""
+        if slot_dir:
+            self.slot = slot_dir
+        else:
+            self.slot, self._slot_fh = _lock_slot(self.root, int(_opts["slots"]))
+        self.source = f"{_opts['source']}:{os.path.basename(self.slot)}"
+        self.journal = Journal(self.slot)
+        self.committed = self._committed_seq()
+        events, last = self.journal.read(self.committed)
+        self._pending.extend(events)
+        self._seq = max(last, self.committed)
+        self.journal.open(self._seq + 1)
+        self.journal.prune(self.committed)
+        return self
+
+    def start(self):
+        if self.slot is None:
+            self.open()
+        self._thread = threading.Thread(target=self._run, name="scan-ingest", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, scans):
+        """
+        Journal and queue scans (dicts, see normalize()); all or none are accepted.
+        Returns (first_seq, last_seq). Raises ValueError on a bad scan, Backlog when full,
+        RuntimeError when the worker thread has died (nothing would commit them).
+        """
+        events = [normalize(s) for s in scans]
+        if not events:
+            raise ValueError("no scans")
+        if self._thread is not None and not self._thread.is_alive() and not self._stop.is_set():
+            raise RuntimeError(f"scan worker has stopped (last error: {self.last_error})")
+        with self._lock:
+            if len(self._pending) + len(events) > self.max_pending:
+                raise Backlog(f"{len(self._pending)} scans pending; retry later")
+            first = self._seq + 1
+            numbered = list(enumerate(events, first))
+            self.journal.append([_encode(seq, ev) for seq, ev in numbered], self.fsync)
+            self._seq += len(events)
+            self._pending.extend(numbered)
+        if len(self._pending) >= self.max_batch:
+            self._wake.set()
+        return first, self._seq
+
+    def _run(self):
+        delay = 0.0
+        while not self._stop.is_set():
+            self._wake.wait(self.window if not delay else delay)
+            self._wake.clear()
+            try:
+                while self._pending and self.flush_once():
+                    pass
+                delay = 0.0
+                self.failing = 0
+            except Exception as e:
+                # scans stay queued (and journalled); retry with backoff. Anything but a
+                # database or journal error is a bug: log it, but keep the worker running
+                kind = "db" if isinstance(e, Error) else "io" if isinstance(e, OSError) else "internal"
+                if kind == "internal":
+                    print(f"scan batch failed ({self.slot}):\n{traceback.format_exc()}", file=sys.stderr)
+                self.last_error = f"{datetime.now():%H:%M:%S} {type(e).__name__}: {e}"
+                self.stats["errors"] += 1
+                self.failing += 1
+                SCAN_ERRORS.inc(kind=kind)
+                delay = min(MAX_RETRY_DELAY, max(0.5, delay * 2))
+
+    def flush(self):
+        """Commit everything queued now (synchronously); raises mysql.connector.Error."""
+        while self._pending:
+            self.flush_once()
+
+    def flush_once(self):
+        """Commit up to max_batch queued scans; returns True when more are queued."""
+        with self._flush_lock:
+            batch = list(islice(self._pending, self.max_batch))
+            if not batch:
+                return False
+            with metrics.source("scan_ingest"), SCAN_BATCH_SECONDS.time():
+                applied, rejected = self._apply(batch)
+            for _ in batch:
+                self._pending.popleft()
+            self.committed = batch[-1][0]
+        self._record(batch, applied, rejected)
+        with self._lock:
+            if self.journal.size() >= int(_opts["segment_bytes"]):
+                self.journal.open(self._seq + 1)
+            self.journal.prune(self.committed)
+        return bool(self._pending)
+
+    def _committed_seq(self):
+        conn = db.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT last_seq FROM scan_ingest_state WHERE source = %s", (self.source,))
+            row = cur.fetchone()
+            cur.close()
+            return int(row[0]) if row else 0
+        finally:
+            conn.close()
+
+    def _apply(self, batch):
+        """One transaction for the batch. Returns (applied events, [(seq, event, reason)])."""
+        now = datetime.now()
+        conn = db.get_connection()
+        try:
+            cur = conn.cursor()
+            try:
+                # the mark row serializes flushes of this journal and filters scans a previous
+                # run committed but did not get to acknowledge
+                cur.execute("SELECT last_seq FROM scan_ingest_state WHERE source = %s FOR UPDATE", (self.source,))
+                row = cur.fetchone()
+                done = int(row[0]) if row else 0
+                batch = [(s, ev) for s, ev in batch if s > done]
+                known = self._known(cur, batch)
+
+                keys = sorted({(ev[0], ev[1]) for _, ev in batch})
+                on_hand = self._lock_stock(cur, keys)
+                applied, rejected, net = [], [], {}
+                for seq, ev in batch:
+                    wh, item, delta, emp, _ = ev
+                    reason = ("unknown_warehouse" if wh not in known["warehouse"] else
+                              "unknown_item" if item not in known["item"] else
+                              "unknown_employee" if emp is not None and emp not in known["employee"] else None)
+                    if reason is None and on_hand.get((wh, item), 0) + delta < 0:
+                        reason = "insufficient_stock"
+                    if reason:
+                        rejected.append((seq, ev, reason))
+                        continue
+                    on_hand[(wh, item)] = on_hand.get((wh, item), 0) + delta
+                    net[(wh, item)] = net.get((wh, item), 0) + delta
+                    applied.append(ev)
+
+                # sorted keys keep the shared (warehouse_id, item_id) lock order; a pair that
+                # nets out has a row, locked by _lock_stock (stock never started below zero)
+                nets = sorted(net.items())
+                _executemany(cur, UPSERT_STOCK_SQL, [(w, i, d, now) for (w, i), d in nets if d > 0])
+                _executemany(cur, DECREMENT_STOCK_SQL, [(d, now, w, i) for (w, i), d in nets if d < 0])
+                _executemany(cur, INSERT_LOG_SQL, [
+                    (wh, item, "IN" if delta > 0 else "OUT", abs(delta), "MANUAL", None, emp, at)
+                    for wh, item, delta, emp, at in applied
+                ])
+                if batch:
+                    cur.execute(
+                        "INSERT INTO scan_ingest_state (source, last_seq) VALUES (%s,%s) "
+                        "ON DUPLICATE KEY UPDATE last_seq = VALUES(last_seq)",
+                        (self.source, batch[-1][0]),
+                    )
+            finally:
+                cur.close()
+            conn.commit()
+        except Error:
+            try:
+                conn.rollback()
+            except Error:
+                pass
+            metrics.db_error("scan_batch")
+            raise
+        finally:
+            conn.close()
+        if applied:
+            query_cache.invalidate_tables("stock", "transaction_log")
+        return applied, rejected
+
+    @staticmethod
+    def _known(cur, batch):
+        """Ids the batch references that exist, per table (FK checks up front, so one bad id fails one scan)."""
+        wanted = {
+            "warehouse": {ev[0] for _, ev in batch},
+            "item": {ev[1] for _, ev in batch},
+            "employee": {ev[3] for _, ev in batch if ev[3] is not None},
+        }
+        known = {}
+        for table, ids in wanted.items():
+            idc = "emp_id" if table == "employee" else f"{table}_id"
+            ids, found = sorted(ids), set()
+            for i in range(0, len(ids), BATCH_ROWS):
+                chunk = ids[i:i + BATCH_ROWS]
+                cur.execute(f"SELECT {idc} FROM {table} WHERE {idc} IN ({_in_list(chunk)})", chunk)
+                found.update(int(r[0]) for r in cur.fetchall())
+            known[table] = found
+        return known
+
+    @staticmethod
+    def _lock_stock(cur, keys):
+        """Lock the batch's stock rows in (warehouse_id, item_id) order; returns current quantities."""
+        on_hand = {}
+        for wh, group in groupby(keys, key=lambda k: k[0]):
+            items = [i for _, i in group]
+            for i in range(0, len(items), BATCH_ROWS):
+                chunk = items[i:i + BATCH_ROWS]
+                cur.execute(
+                    f"SELECT item_id, quantity FROM stock WHERE warehouse_id = %s AND item_id IN ({_in_list(chunk)}) "
+                    "ORDER BY item_id FOR UPDATE",
+                    [wh] + chunk,
+                )
+                on_hand.update(((wh, int(item)), int(q)) for item, q in cur.fetchall())
+        return on_hand
+
+    def _record(self, batch, applied, rejected):
+        self.stats["batches"] += 1
+        self.stats["applied"] += len(applied)
+        self.stats["rejected"] += len(rejected)
+        SCAN_BATCH_SIZE.observe(len(batch))
+        for ev in applied:
+            SCANS.inc(direction="IN" if ev[2] > 0 else "OUT")
+        if rejected:
+            with open(os.path.join(self.slot, "rejected.jsonl"), "a", encoding="utf-8") as f:
+                for seq, ev, reason in rejected:
+                    SCANS_REJECTED.inc(reason=reason)
+                    rec = json.loads(_encode(seq, ev))
+                    rec.update(reason=reason, rejected_at=datetime.now().isoformat(timespec="seconds"))
+                    f.write(json.dumps(rec) + "\n")
+
+    def alive(self):
+        """True while the worker thread runs (False before start() and after stop())."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self):
+        return {"slot": self.slot, "pending": len(self._pending), "last_seq": self._seq,
+                "committed_seq": self.committed, "worker_alive": self.alive(), "failing": self.failing,
+                "last_error": self.last_error, **self.stats}
+
+    def stop(self, flush=True):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            if flush:
+                self.flush()
+        finally:
+            # whatever is left stays in the journal for the next run of this slot
+            self.journal.close()
+            if self._slot_fh is not None:
+                self._slot_fh.close()
+
+
+# ---------- PROCESS-WIDE INGESTOR ----------
+_ingestor = None
+_ingestor_lock = threading.Lock()
+
+
+def get_ingestor():
+    """The process's ingestor, started on first use (after any fork, like the DB pool)."""
+    global _ingestor
+    if _ingestor is None:
+        with _ingestor_lock:
+            if _ingestor is None:
+                _ingestor = ScanIngestor().start()
+    return _ingestor
+
+
+def submit(scans):
+    return get_ingestor().submit(scans)
+
+
+def shutdown():
+    """Stop the process's ingestor (if started), committing what is queued."""
+    if _ingestor is not None:
+        _ingestor.stop()
+
+
+def _scan_metrics():
+    if _ingestor is None:
+        return []
+    return [("inv_scan_pending", "gauge", "Scans journalled but not yet committed.",
+             [({}, len(_ingestor._pending))]),
+            ("inv_scan_worker_up", "gauge", "1 while the scan commit thread of this process runs.",
+             [({}, 1 if _ingestor.alive() else 0)]),
+            ("inv_scan_failing_batches", "gauge", "Consecutive failed commit attempts (0 when healthy).",
+             [({}, _ingestor.failing)])]
+
+
+metrics.add_collector(_scan_metrics)
+
+
+# ---------- CLI ----------
+def _free_slots(root):
+    if not os.path.isdir(root):
+        return []
+    out = []
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if not name.startswith("slot-"):
+            continue
+        fh = open(os.path.join(path, "lock"), "a")
+        try:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            continue
+        out.append((path, fh))
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan ingestion journal tools.")
+    parser.add_argument("command", choices=("status", "drain", "feed"))
+    parser.add_argument("--dir", default=_opts["dir"])
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "feed":
+            # one JSON scan per line on stdin, e.g. from a serial scanner gateway
+            ing = ScanIngestor(args.dir).start()
+            try:
+                for n, line in enumerate(sys.stdin, 1):
+                    if line.strip():
+                        try:
+                            ing.submit([json.loads(line)])
+                        except ValueError as e:
+                            print(f"line {n}: {e}", file=sys.stderr)
+            finally:
+                ing.stop()
+            print(json.dumps(ing.status()))
+            return 0
+
+        for path, fh in _free_slots(args.dir):
+            try:
+                ing = ScanIngestor(args.dir).open(slot_dir=path)
+                if args.command == "drain":
+                    ing.flush()
+                print(json.dumps(ing.status()))
+                ing.journal.close()
+            finally:
+                fh.close()
+    except Error as e:
+        print(f"failed: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+# services.py
+# UI-independent stock and order operations, shared by the Streamlit pages and the
+# HTTP API (api.py). Each call checks out a pooled connection, runs one transaction,
+# commits, invalidates the result cache for the tables it wrote and updates the
+# operational metrics, so both front ends take the same code path.
+#
+# Errors: bad input raises ValueError, a business-rule failure stock_ops.StockOpError,
+# a database failure mysql.connector.Error; the transaction is rolled back in all cases.
+import time
+from contextlib import contextmanager
+from datetime import date
+
+from mysql.connector import Error
+
+import db
+import metrics
+import order_totals
+import query_cache
+import stock_ops
+from stock_ops import StockOpError
+
+STOCK_LOOKUP_MAX_ROWS = 1000
+
+# order side -> header table, detail table, id column, party column, open status, closed statuses
+ORDER_SIDES = {
+    "purchase": ("purchase_order", "purchase_order_details", "po_id", "supplier_id", "po_date",
+                 "CREATED", ("RECEIVED", "CANCELLED")),
+    "sales": ("sales_order", "sales_order_details", "so_id", "customer_id", "so_date",
+              "NEW", ("SHIPPED", "CANCELLED")),
+}
+
+
+@contextmanager
+def _transaction(operation, *tables):
+    """Pooled connection in a transaction; commit + cache invalidation on success, rollback and metrics on failure."""
+    try:
+        conn = db.get_connection()
+    except Error:
+        metrics.db_error("connect")
+        raise
+    try:
+        yield conn
+        conn.commit()
+    except StockOpError:
+        conn.rollback()
+        metrics.STOCK_OP_REJECTED.inc(operation=operation)
+        raise
+    except Error:
+        _rollback_quietly(conn)
+        metrics.db_error(operation)
+        raise
+    except BaseException:
+        _rollback_quietly(conn)
+        raise
+    finally:
+        conn.close()
+    query_cache.invalidate_tables(*tables)
+
+
+def _rollback_quietly(conn):
+    try:
+        conn.rollback()
+    except Error:
+        pass
+
+
+def _positive_int(value, name):
+    try:
+        v = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer") from None
+    if v <= 0:
+        raise ValueError(f"{name} must be positive")
+    return v
+
+
+# ---------- STOCK MOVEMENTS ----------
+def receive_po(po_id, emp_id):
+    """Receive one PO into stock. Returns {'po_id','warehouse_id','lines','units'}."""
+    po_id, emp_id = _positive_int(po_id, "po_id"), _positive_int(emp_id, "emp_id")
+    with metrics.PO_RECEIVE_SECONDS.time(mode="single"):
+        with _transaction("receive_po", "stock", "transaction_log", "purchase_order") as conn:
+            # one stock upsert + one batched log insert, whatever the line count
+            res = stock_ops.receive_po(conn, po_id, emp_id)
+    metrics.PO_RECEIVED.inc(warehouse=res["warehouse_id"], mode="single")
+    metrics.PO_RECEIVED_UNITS.inc(res["units"], warehouse=res["warehouse_id"])
+    return res
+
+
+def receive_pos_batch(po_ids, emp_id):
+    """
+    Receive many POs in one transaction; POs that cannot be received are reported, not fatal.
+    Returns one {'po_id','warehouse_id','ok','lines','units','error'} per PO.
+    """
+    po_ids = [_positive_int(p, "po_id") for p in po_ids]
+    emp_id = _positive_int(emp_id, "emp_id")
+    with metrics.PO_RECEIVE_SECONDS.time(mode="batch"):
+        with _transaction("receive_po_batch", "stock", "transaction_log", "purchase_order") as conn:
+            results = stock_ops.receive_pos_batch(conn, po_ids, emp_id)
+    for r in results:
+        if r["ok"]:
+            metrics.PO_RECEIVED.inc(warehouse=r["warehouse_id"], mode="batch")
+            metrics.PO_RECEIVED_UNITS.inc(r["units"], warehouse=r["warehouse_id"])
+        else:
+            metrics.STOCK_OP_REJECTED.inc(operation="receive_po")
+    return results
+
+
+def ship_so(so_id, emp_id, check_stock=True):
+    """Ship one SO from stock. Returns {'so_id','warehouse_id','lines','units','skipped'}."""
+    so_id, emp_id = _positive_int(so_id, "so_id"), _positive_int(emp_id, "emp_id")
+    t0, warehouse = time.perf_counter(), ""
+    try:
+        with _transaction("ship_so", "stock", "transaction_log", "sales_order") as conn:
+            # locks the affected stock rows in item order, checks all lines in one query,
+            # then applies relative decrements in bulk
+            res = stock_ops.ship_so(conn, so_id, emp_id, check_stock=check_stock)
+        warehouse = res["warehouse_id"]
+    finally:
+        metrics.SO_SHIP_SECONDS.observe(time.perf_counter() - t0, warehouse=warehouse)
+    metrics.SO_SHIPPED.inc(warehouse=warehouse)
+    return res
+
+
+def adjust_stock(warehouse_id, item_id, delta, emp_id=None):
+    """Manual adjustment (+/-). Returns the new quantity."""
+    warehouse_id, item_id = _positive_int(warehouse_id, "warehouse_id"), _positive_int(item_id, "item_id")
+    try:
+        delta = int(delta)
+    except (TypeError, ValueError):
+        raise ValueError("delta must be an integer") from None
+    if delta == 0:
+        raise ValueError("delta must not be zero")
+    emp_id = _positive_int(emp_id, "emp_id") if emp_id is not None else None
+    with _transaction("adjust", "stock", "transaction_log") as conn:
+        qty = stock_ops.adjust_stock(conn, warehouse_id, item_id, delta, emp_id=emp_id)
+    metrics.STOCK_ADJUSTS.inc(warehouse=warehouse_id, kind="adjust")
+    return qty
+
+
+RETURN_KINDS = {"customer": "IN", "supplier": "OUT"}
+
+
+def process_return(warehouse_id, item_id, quantity, kind, emp_id=None):
+    """
+    Customer return (stock IN) or return to supplier (stock OUT). The ref_type ENUM has
+    no return values, so returns are logged as MANUAL IN/OUT. Returns the new quantity.
+    """
+    if kind not in RETURN_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(RETURN_KINDS)}")
+    warehouse_id, item_id = _positive_int(warehouse_id, "warehouse_id"), _positive_int(item_id, "item_id")
+    quantity = _positive_int(quantity, "quantity")
+    emp_id = _positive_int(emp_id, "emp_id") if emp_id is not None else None
+    change_type = RETURN_KINDS[kind]
+    delta = quantity if change_type == "IN" else -quantity
+    with _transaction("return", "stock", "transaction_log") as conn:
+        qty = stock_ops.adjust_stock(conn, warehouse_id, item_id, delta, emp_id=emp_id, change_type=change_type)
+    metrics.STOCK_ADJUSTS.inc(warehouse=warehouse_id, kind=f"return_{change_type.lower()}")
+    return qty
+
+
+def stock_lookup(warehouse_id=None, item_id=None, limit=100):
+    """
+    Current stock rows [{'warehouse_id','item_id','item_name','quantity','reorder_level','low'}],
+    by primary key / item index; read straight from the database (never the result cache).
+    """
+    where, params = [], []
+    if warehouse_id is not None:
+        where.append("s.warehouse_id = %s")
+        params.append(_positive_int(warehouse_id, "warehouse_id"))
+    if item_id is not None:
+        where.append("s.item_id = %s")
+        params.append(_positive_int(item_id, "item_id"))
+    limit = min(_positive_int(limit, "limit"), STOCK_LOOKUP_MAX_ROWS)
+    sql = (
+        "SELECT s.warehouse_id, s.item_id, i.name AS item_name, s.quantity, i.reorder_level "
+        "FROM stock s JOIN item i ON i.item_id = s.item_id"
+        + (" WHERE " + " AND ".join(where) if where else "")
+        + " ORDER BY s.warehouse_id, s.item_id LIMIT %s"
+    )
+    try:
+        conn = db.get_connection()
+    except Error:
+        metrics.db_error("connect")
+        raise
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(sql, tuple(params) + (limit,))
+        rows = cur.fetchall()
+        cur.close()
+    except Error:
+        metrics.db_error("stock_lookup")
+        raise
+    finally:
+        conn.close()
+    for r in rows:
+        r["low"] = r["reorder_level"] is not None and r["quantity"] < r["reorder_level"]
+    return rows
+
+
+# ---------- ORDERS ----------
+def _side(side):
+    if side not in ORDER_SIDES:
+        raise ValueError(f"side must be one of {', '.join(ORDER_SIDES)}")
+    return ORDER_SIDES[side]
+
+
+def _lock_open_order(cur, side, order_id):
+    head, _, idc, _, _, _, closed = _side(side)
+    cur.execute(f"SELECT status FROM {head} WHERE {idc} = %s FOR UPDATE", (order_id,))
+    row = cur.fetchone()
+    if not row:
+        raise StockOpError(f"{head} {order_id} not found.")
+    if row[0] in closed:
+        raise StockOpError(f"{head} {order_id} is {row[0]}; lines can no longer be added.")
+
+
+def _item_prices(cur, item_ids):
+    cur.execute(f"SELECT item_id, price FROM item WHERE item_id IN ({','.join(['%s'] * len(item_ids))})", item_ids)
+    return {int(i): p for i, p in cur.fetchall()}
+
+
+def _lines(cur, lines, price_from_item):
+    """Validate [{'item_id','quantity','price'?}] -> [(item_id, quantity, price)]."""
+    out = []
+    for ln in lines:
+        item_id = _positive_int(ln.get("item_id"), "item_id")
+        qty = _positive_int(ln.get("quantity"), "quantity")
+        price = None if price_from_item else ln.get("price")
+        if price is not None and float(price) < 0:
+            raise ValueError("price must not be negative")
+        out.append((item_id, qty, price))
+    if len({i for i, _, _ in out}) != len(out):
+        raise ValueError("an item can only appear once per order")
+    missing_price = sorted({i for i, _, p in out if p is None})
+    if missing_price:
+        prices = _item_prices(cur, missing_price)
+        unknown = [i for i in missing_price if i not in prices]
+        if unknown:
+            raise StockOpError(f"item not found: {', '.join(map(str, unknown))}")
+        out = [(i, q, prices[i] if p is None else p) for i, q, p in out]
+    return out
+
+
+def create_order(side, party_id, warehouse_id, order_date=None, lines=()):
+    """
+    Create a PO ('purchase', party = supplier) or SO ('sales', party = customer) with optional
+    lines [{'item_id','quantity','price'?}]. PO prices always come from the item; SO lines
+    default to the item price. Returns the new order id.
+    """
+    head, det, idc, partyc, datec, status, _ = _side(side)
+    party_id, warehouse_id = _positive_int(party_id, partyc), _positive_int(warehouse_id, "warehouse_id")
+    with _transaction(f"create_{side}_order", head, det) as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                f"INSERT INTO {head} ({partyc}, warehouse_id, {datec}, status) VALUES (%s,%s,%s,%s)",
+                (party_id, warehouse_id, order_date or date.today(), status),
+            )
+            order_id = cur.lastrowid
+            rows = _lines(cur, lines, price_from_item=(side == "purchase"))
+        finally:
+            cur.close()
+        if rows:
+            # bulk path: per-row total triggers deferred, header total computed once
+            order_totals.insert_lines(conn, side, [(order_id, i, q, p) for i, q, p in rows])
+    return order_id
+
+
+def add_order_line(side, order_id, item_id, quantity, price=None):
+    """Add one line to an open order (header locked first); the delta trigger updates its total. Returns the line id."""
+    head, det, idc, _, _, _, _ = _side(side)
+    order_id = _positive_int(order_id, idc)
+    with _transaction(f"add_{side}_line", head, det) as conn:
+        cur = conn.cursor()
+        try:
+            _lock_open_order(cur, side, order_id)
+            (item, qty, line_price), = _lines(cur, [{"item_id": item_id, "quantity": quantity, "price": price}],
+                                              price_from_item=(side == "purchase"))
+            cur.execute(f"INSERT INTO {det} ({idc}, item_id, quantity, price) VALUES (%s,%s,%s,%s)",
+                        (order_id, item, qty, line_price))
+            line_id = cur.lastrowid
+        finally:
+            cur.close()
+    return line_id
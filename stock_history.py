@@ -0,0 +1,265 @@
+# stock_history.py
+# Point-in-time stock: "what was on hand in warehouse W at time T".
+# Periodic checkpoints copy the stock table together with the highest log_id they
+# include; an as-of query starts from the nearest checkpoint at or before T and
+# replays only the transaction_log rows written after it, so its cost is bounded
+# by the checkpoint interval rather than by the length of the history.
+# Ids below that mark whose transactions had not committed at the snapshot are kept as
+# gap ranges of the checkpoint (stock_checkpoint_gap) and replayed as well.
+#
+#   python stock_history.py checkpoint [--if-older-than HOURS]
+#   python stock_history.py as-of WAREHOUSE_ID "YYYY-MM-DD HH:MM" [--item ITEM_ID]
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+from mysql.connector import Error
+
+import columnar
+import db
+import query_cache
+import rollups
+from rollups import SIGNED_DELTA_SQL
+
+CHECKPOINT_INTERVAL_HOURS = 24
+COPY_BATCH_ROWS = 5000
+
+
+def latest_checkpoint(at=None):
+    """(checkpoint_id, taken_at, last_log_id) of the newest checkpoint at or before `at`, or None."""
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        if at is None:
+            cur.execute("SELECT checkpoint_id, taken_at, last_log_id FROM stock_checkpoint ORDER BY taken_at DESC LIMIT 1")
+        else:
+            cur.execute(
+                "SELECT checkpoint_id, taken_at, last_log_id FROM stock_checkpoint "
+                "WHERE taken_at <= %s ORDER BY taken_at DESC LIMIT 1",
+                (at,),
+            )
+        row = cur.fetchone()
+        cur.close()
+        return row
+    finally:
+        conn.close()
+
+
+def _snapshot_gaps(cur, settled):
+    """
+    [(first_id, last_id, seen_at)] of log ids at or below the snapshot's MAX(log_id) that it
+    does not see: new ones since the previous checkpoint, plus that checkpoint's gaps whose
+    writers may still have been open (seen after `settled`) and are still missing.
+    """
+    cur.execute("SELECT NOW(), IFNULL(MAX(log_id), 0) FROM transaction_log")
+    now, last_log_id = cur.fetchone()
+    cur.execute("SELECT checkpoint_id, last_log_id FROM stock_checkpoint ORDER BY checkpoint_id DESC LIMIT 1")
+    prev = cur.fetchone()
+    gaps = []
+    if prev is not None:
+        cur.execute("SELECT first_id, last_id, seen_at FROM stock_checkpoint_gap WHERE checkpoint_id = %s "
+                    "ORDER BY first_id", (prev[0],))
+        for first, last, seen_at in cur.fetchall():
+            if seen_at >= settled:
+                _, missing = rollups.scan_log(cur, int(first) - 1, int(last))
+                gaps += [(a, b, seen_at) for a, b in missing]
+    lo = int(prev[1]) if prev is not None else 0
+    if last_log_id > lo:
+        # the first checkpoint scans the whole log once
+        _, missing = rollups.scan_log(cur, lo, int(last_log_id))
+        gaps += [(a, b, now) for a, b in missing]
+    return now, last_log_id, gaps
+
+
+def take_checkpoint():
+    """
+    Copy the current stock table into a new checkpoint.
+    Stock, MAX(log_id) and the ids below it not yet committed are read from one
+    consistent snapshot on a reader connection, and written through a second
+    connection in one transaction. Returns (checkpoint_id, row_count).
+    """
+    reader = db.get_connection()
+    writer = db.get_connection()
+    try:
+        rcur = reader.cursor()
+        # before the snapshot: writers of older gaps have ended by then and are visible in it
+        settled = rollups.settled_before(rcur)
+        reader.rollback()
+        reader.start_transaction(consistent_snapshot=True, isolation_level="REPEATABLE READ", readonly=True)
+        taken_at, last_log_id, gaps = _snapshot_gaps(rcur, settled)
+
+        wcur = writer.cursor()
+        wcur.execute(
+            "INSERT INTO stock_checkpoint (taken_at, last_log_id) VALUES (%s, %s)",
+            (taken_at, last_log_id),
+        )
+        ckpt_id = wcur.lastrowid
+        if gaps:
+            wcur.executemany(
+                "INSERT INTO stock_checkpoint_gap (checkpoint_id, first_id, last_id, seen_at) VALUES (%s,%s,%s,%s)",
+                [(ckpt_id, a, b, seen) for a, b, seen in gaps],
+            )
+
+        rcur.execute("SELECT warehouse_id, item_id, quantity FROM stock ORDER BY warehouse_id, item_id")
+        rows = 0
+        while True:
+            chunk = rcur.fetchmany(COPY_BATCH_ROWS)
+            if not chunk:
+                break
+            wcur.executemany(
+                "INSERT INTO stock_checkpoint_line (checkpoint_id, warehouse_id, item_id, quantity) VALUES (%s,%s,%s,%s)",
+                [(ckpt_id, w, i, q) for w, i, q in chunk],
+            )
+            rows += len(chunk)
+        wcur.execute("UPDATE stock_checkpoint SET row_count = %s WHERE checkpoint_id = %s", (rows, ckpt_id))
+        writer.commit()
+        reader.rollback()
+        rcur.close()
+        wcur.close()
+    except Error:
+        writer.rollback()
+        raise
+    finally:
+        reader.close()
+        writer.close()
+    query_cache.invalidate_tables("stock_checkpoint", "stock_checkpoint_line", "stock_checkpoint_gap")
+    return ckpt_id, rows
+
+
+def checkpoint_if_due(max_age_hours=CHECKPOINT_INTERVAL_HOURS):
+    """Take a checkpoint unless one newer than max_age_hours exists. Returns the new id or None."""
+    last = latest_checkpoint()
+    if last is not None and last[1] > datetime.now() - timedelta(hours=max_age_hours):
+        return None
+    return take_checkpoint()[0]
+
+
+def stock_as_of_query(warehouse_id, at, item_id=None, checkpoint=None):
+    """
+    SQL + params for stock in one warehouse as of `at`, given the checkpoint to start
+    from ((id, taken_at, last_log_id) or None to replay the whole log). Log rows in the
+    checkpoint's gap ranges are replayed too (one primary-key range per gap).
+    """
+    item_sql = " AND item_id = %s" if item_id is not None else ""
+    item_param = (item_id,) if item_id is not None else ()
+    if checkpoint is not None:
+        base_sql = (
+            "SELECT item_id, quantity AS qty FROM stock_checkpoint_line "
+            "WHERE checkpoint_id = %s AND warehouse_id = %s" + item_sql
+        )
+        base_params = (checkpoint[0], warehouse_id) + item_param
+        after_log_id = checkpoint[2]
+    else:
+        base_sql, base_params, after_log_id = None, (), 0
+    delta_sql = (
+        f"SELECT item_id, SUM({SIGNED_DELTA_SQL}) AS qty FROM transaction_log "
+        "WHERE warehouse_id = %s AND log_id > %s AND logged_at <= %s" + item_sql + " GROUP BY item_id"
+    )
+    delta_params = (warehouse_id, after_log_id, at) + item_param
+    parts = ([base_sql] if base_sql else []) + [delta_sql]
+    if checkpoint is not None:
+        parts.append(
+            f"SELECT item_id, SUM({SIGNED_DELTA_SQL}) AS qty FROM stock_checkpoint_gap g "
+            "JOIN transaction_log l ON l.log_id BETWEEN g.first_id AND g.last_id "
+            "WHERE g.checkpoint_id = %s AND warehouse_id = %s AND logged_at <= %s" + item_sql + " GROUP BY item_id"
+        )
+        delta_params += (checkpoint[0], warehouse_id, at) + item_param
+    q = f"""
+        SELECT t.item_id, i.name AS item_name, i.unit_of_measure, CAST(SUM(t.qty) AS SIGNED) AS quantity
+        FROM ({" UNION ALL ".join(parts)}) t
+        JOIN item i ON i.item_id = t.item_id
+        GROUP BY t.item_id, i.name, i.unit_of_measure
+        HAVING quantity <> 0
+        ORDER BY t.item_id
+    """
+    return q, base_params + delta_params
+
+
+def retired_log():
+    """(range_end, max_log_id) of the log retired by tlog_partitions.py, or (None, None)."""
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT MAX(range_end), MAX(max_log_id) FROM tlog_retention")
+        row = cur.fetchone()
+        cur.close()
+        return row
+    finally:
+        conn.close()
+
+
+def first_gap_id(checkpoint_id):
+    """Lowest log id in the checkpoint's gap ranges (replayed from the log), or None."""
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT MIN(first_id) FROM stock_checkpoint_gap WHERE checkpoint_id = %s", (checkpoint_id,))
+        row = cur.fetchone()
+        cur.close()
+        return row[0]
+    finally:
+        conn.close()
+
+
+def stock_as_of(warehouse_id, at, item_id=None):
+    """
+    DataFrame (item_id, item_name, unit_of_measure, quantity) of stock in a warehouse as of `at`,
+    plus the checkpoint used ((id, taken_at, last_log_id) or None).
+    Raises ValueError when the log needed for `at` has been retired.
+    """
+    ckpt = latest_checkpoint(at)
+    retired_until, retired_log_id = retired_log()
+    if retired_until is not None and at < retired_until:
+        raise ValueError(f"the transaction log before {retired_until:%Y-%m-%d} has been archived")
+    if retired_log_id is not None and (ckpt is None or ckpt[2] < retired_log_id):
+        raise ValueError("no stock checkpoint covers the archived part of the transaction log before this time")
+    if retired_log_id is not None:
+        first_gap = first_gap_id(ckpt[0])
+        if first_gap is not None and first_gap <= retired_log_id:
+            raise ValueError(f"log ids the checkpoint of {ckpt[1]:%Y-%m-%d %H:%M} replays have been archived")
+    q, params = stock_as_of_query(warehouse_id, at, item_id, ckpt)
+    conn = db.get_connection()
+    try:
+        # a whole warehouse can be a large result: typed columns, item names as categoricals
+        df = columnar.fetch_frame(conn, q, params)
+    finally:
+        conn.close()
+    return df, ckpt
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stock checkpoints and point-in-time stock.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    cp = sub.add_parser("checkpoint", help="copy current stock into a new checkpoint")
+    cp.add_argument("--if-older-than", type=float, default=None, metavar="HOURS",
+                    help="only if the newest checkpoint is older than this")
+    ao = sub.add_parser("as-of", help="print stock of a warehouse at a point in time")
+    ao.add_argument("warehouse_id", type=int)
+    ao.add_argument("at", help="YYYY-MM-DD or 'YYYY-MM-DD HH:MM'")
+    ao.add_argument("--item", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.cmd == "checkpoint":
+            if args.if_older_than is not None:
+                ckpt = checkpoint_if_due(args.if_older_than)
+                print(f"checkpoint {ckpt} taken" if ckpt else "recent checkpoint exists; nothing to do")
+            else:
+                ckpt, rows = take_checkpoint()
+                print(f"checkpoint {ckpt} taken ({rows} stock rows)")
+        else:
+            fmt = "%Y-%m-%d %H:%M" if " " in args.at else "%Y-%m-%d"
+            at = datetime.strptime(args.at, fmt)
+            if fmt == "%Y-%m-%d":
+                at = at.replace(hour=23, minute=59, second=59)
+            df, ckpt = stock_as_of(args.warehouse_id, at, args.item)
+            print(f"from checkpoint {ckpt[0]} ({ckpt[1]})" if ckpt else "no checkpoint before this time; replayed the whole log")
+            print(df.to_string(index=False) if not df.empty else "no stock")
+    except (Error, ValueError) as e:
+        print(f"failed: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
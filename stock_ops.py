@@ -0,0 +1,300 @@
+# stock_ops.py
+# Stock movement transactions (PO receipt, SO shipment, ...) kept free of Streamlit so
+# the pages and batch tools run the same statements. Every function takes an open
+# connection and works inside the caller's transaction: the caller commits or rolls back.
+#
+# Lock order: order header first, then stock rows in ascending (warehouse_id, item_id).
+# Receipts and shipments both follow it, so concurrent movements on the same hot SKUs
+# queue behind each other instead of deadlocking.
+from datetime import datetime
+
+from mysql.connector import Error
+
+# multi-row VALUES lists are sent in chunks of this many rows
+BATCH_ROWS = 1000
+
+UPSERT_STOCK_SQL = (
+    "INSERT INTO stock (warehouse_id, item_id, quantity, last_updated) VALUES (%s,%s,%s,%s) "
+    "ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity), last_updated = VALUES(last_updated)"
+)
+INSERT_LOG_SQL = (
+    "INSERT INTO transaction_log (warehouse_id, item_id, change_type, delta_qty, ref_type, ref_id, emp_id, logged_at) "
+    "VALUES (%s,%s,%s,%s,%s,%s,%s,%s)"
+)
+
+
+class StockOpError(Exception):
+    """Business-rule failure (wrong order status, empty order, ...); the caller should roll back."""
+
+
+# checked by check_refs(): transaction_log has no foreign keys (see tlog_partitions.py)
+REF_TABLES = (("warehouse", "warehouse_id"), ("item", "item_id"), ("employee", "emp_id"))
+
+
+def check_refs(cur, warehouse_id=None, item_id=None, emp_id=None):
+    """
+    Raise StockOpError unless every given id exists. The rows are read FOR SHARE, like a
+    foreign key check, so they cannot be deleted before the caller commits its log rows.
+    """
+    for (table, idc), value in zip(REF_TABLES, (warehouse_id, item_id, emp_id)):
+        if value is None:
+            continue
+        cur.execute(f"SELECT 1 FROM {table} WHERE {idc} = %s FOR SHARE", (value,))
+        if not cur.fetchall():
+            raise StockOpError(f"{table.capitalize()} {value} not found.")
+
+
+def _executemany(cur, sql, rows):
+    # mysql.connector rewrites INSERT ... VALUES executemany into one multi-row statement
+    for i in range(0, len(rows), BATCH_ROWS):
+        cur.executemany(sql, rows[i:i + BATCH_ROWS])
+
+
+def receive_po(conn, po_id, emp_id, now=None):
+    """
+    Receive a purchase order: add every line to stock with one upsert on
+    uq_stock_wh_item, write the IN log rows in one batch and mark the PO RECEIVED.
+    Statement count is constant in the number of lines.
+    Returns {'po_id', 'warehouse_id', 'lines', 'units'}.
+    """
+    now = now or datetime.now()
+    cur = conn.cursor()
+    try:
+        # header lock: a second clerk receiving the same PO waits here, then sees RECEIVED
+        cur.execute("SELECT warehouse_id, status FROM purchase_order WHERE po_id = %s FOR UPDATE", (po_id,))
+        head = cur.fetchone()
+        if not head:
+            raise StockOpError(f"PO {po_id} not found.")
+        whid, status = int(head[0]), head[1]
+        if status in ("RECEIVED", "CANCELLED"):
+            raise StockOpError(f"PO {po_id} cannot be received (status {status}).")
+        check_refs(cur, emp_id=emp_id)
+
+        cur.execute("SELECT item_id, quantity FROM purchase_order_details WHERE po_id = %s ORDER BY item_id", (po_id,))
+        lines = cur.fetchall()
+        if not lines:
+            raise StockOpError("PO has no lines.")
+
+        _executemany(cur, UPSERT_STOCK_SQL, [(whid, int(item), int(qty), now) for item, qty in lines])
+        _executemany(cur, INSERT_LOG_SQL,
+                     [(whid, int(item), "IN", int(qty), "PO", po_id, emp_id, now) for item, qty in lines])
+        cur.execute("UPDATE purchase_order SET status = %s WHERE po_id = %s", ("RECEIVED", po_id))
+    finally:
+        cur.close()
+    return {
+        "po_id": po_id,
+        "warehouse_id": whid,
+        "lines": len(lines),
+        "units": sum(int(q) for _, q in lines),
+    }
+
+
+def _in_list(values):
+    return ",".join(["%s"] * len(values))
+
+
+def ship_so(conn, so_id, emp_id, check_stock=True, now=None):
+    """
+    Ship a sales order with a constant number of statements:
+      1. lock the SO header and read its lines,
+      2. lock every affected stock row in one ordered SELECT ... FOR UPDATE,
+      3. check availability for all lines in one joined query (check_stock=True),
+      4. decrement stock with one relative UPDATE ... JOIN, log OUT rows in one batch.
+    Raises StockOpError listing every short line when stock is insufficient.
+    Returns {'so_id', 'warehouse_id', 'lines', 'units', 'skipped'}; `skipped` holds
+    item ids with no stock row (only possible with check_stock=False).
+    """
+    now = now or datetime.now()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT warehouse_id, status FROM sales_order WHERE so_id = %s FOR UPDATE", (so_id,))
+        head = cur.fetchone()
+        if not head:
+            raise StockOpError(f"SO {so_id} not found.")
+        whid, status = int(head[0]), head[1]
+        if status in ("SHIPPED", "CANCELLED"):
+            raise StockOpError(f"SO {so_id} cannot be shipped (status {status}).")
+        check_refs(cur, emp_id=emp_id)
+
+        cur.execute("SELECT item_id, quantity FROM sales_order_details WHERE so_id = %s ORDER BY item_id", (so_id,))
+        lines = [(int(i), int(q)) for i, q in cur.fetchall()]
+        if not lines:
+            raise StockOpError("SO has no lines.")
+        item_ids = [i for i, _ in lines]
+
+        # range scan on uq_stock_wh_item: rows are locked in ascending item order
+        cur.execute(
+            f"SELECT item_id FROM stock WHERE warehouse_id = %s AND item_id IN ({_in_list(item_ids)}) "
+            "ORDER BY item_id FOR UPDATE",
+            [whid] + item_ids,
+        )
+        present = {int(r[0]) for r in cur.fetchall()}
+
+        if check_stock:
+            # locking read (FOR SHARE) so we compare against the latest committed quantities
+            cur.execute(
+                """
+                SELECT sod.item_id, sod.quantity, IFNULL(s.quantity, 0)
+                FROM sales_order_details sod
+                LEFT JOIN stock s ON s.warehouse_id = %s AND s.item_id = sod.item_id
+                WHERE sod.so_id = %s AND IFNULL(s.quantity, 0) < sod.quantity
+                ORDER BY sod.item_id
+                FOR SHARE
+                """,
+                (whid, so_id),
+            )
+            short = cur.fetchall()
+            if short:
+                detail = "; ".join(f"item {i}: available {int(a)}, requested {int(q)}" for i, q, a in short)
+                raise StockOpError(f"Insufficient stock to ship SO {so_id}. {detail}. Aborting.")
+
+        cur.execute(
+            """
+            UPDATE stock s
+            JOIN sales_order_details sod ON sod.item_id = s.item_id AND sod.so_id = %s
+            SET s.quantity = s.quantity - sod.quantity, s.last_updated = %s
+            WHERE s.warehouse_id = %s
+            """,
+            (so_id, now, whid),
+        )
+        _executemany(cur, INSERT_LOG_SQL,
+                     [(whid, item, "OUT", qty, "SO", so_id, emp_id, now) for item, qty in lines])
+        cur.execute("UPDATE sales_order SET status = %s WHERE so_id = %s", ("SHIPPED", so_id))
+    finally:
+        cur.close()
+    return {
+        "so_id": so_id,
+        "warehouse_id": whid,
+        "lines": len(lines),
+        "units": sum(q for _, q in lines),
+        "skipped": [i for i in item_ids if i not in present],
+    }
+
+
+def _result(po_id, ok, lines=0, units=0, error=None, warehouse_id=None):
+    return {"po_id": po_id, "warehouse_id": warehouse_id, "ok": ok, "lines": lines, "units": units, "error": error}
+
+
+def receive_pos_batch(conn, po_ids, emp_id, now=None):
+    """
+    Receive many POs in one pass inside the caller's transaction.
+    Headers are locked together; POs that are missing, already received/cancelled
+    or empty are reported and left out. Lines of the remaining POs are merged per
+    (warehouse, item) into one aggregated stock upsert, their log rows go in one
+    batch, and the headers are flipped with one UPDATE.
+    If the bulk statements fail, the batch falls back to receive_po() per PO behind
+    savepoints, so one bad PO does not undo the others.
+    Returns one result dict per requested PO: {'po_id','warehouse_id','ok','lines','units','error'}.
+    """
+    now = now or datetime.now()
+    po_ids = sorted({int(p) for p in po_ids})
+    if not po_ids:
+        return []
+    results = {}
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            f"SELECT po_id, warehouse_id, status FROM purchase_order WHERE po_id IN ({_in_list(po_ids)}) "
+            "ORDER BY po_id FOR UPDATE",
+            po_ids,
+        )
+        heads = {int(p): (int(w), s) for p, w, s in cur.fetchall()}
+        # one receiving clerk for the whole batch
+        check_refs(cur, emp_id=emp_id)
+        for p in po_ids:
+            if p not in heads:
+                results[p] = _result(p, False, error=f"PO {p} not found.")
+            elif heads[p][1] in ("RECEIVED", "CANCELLED"):
+                results[p] = _result(p, False, error=f"PO {p} cannot be received (status {heads[p][1]}).",
+                                     warehouse_id=heads[p][0])
+        todo = [p for p in po_ids if p not in results]
+
+        lines_by_po = {p: [] for p in todo}
+        if todo:
+            cur.execute(
+                f"SELECT po_id, item_id, quantity FROM purchase_order_details WHERE po_id IN ({_in_list(todo)})",
+                todo,
+            )
+            for p, item, qty in cur.fetchall():
+                lines_by_po[int(p)].append((int(item), int(qty)))
+        for p in todo:
+            if not lines_by_po[p]:
+                results[p] = _result(p, False, error="PO has no lines.", warehouse_id=heads[p][0])
+        todo = [p for p in todo if lines_by_po[p]]
+
+        if todo:
+            merged = {}
+            log_rows = []
+            for p in todo:
+                whid = heads[p][0]
+                for item, qty in lines_by_po[p]:
+                    merged[(whid, item)] = merged.get((whid, item), 0) + qty
+                    log_rows.append((whid, item, "IN", qty, "PO", p, emp_id, now))
+            cur.execute("SAVEPOINT po_batch")
+            try:
+                # sorted pairs keep the shared (warehouse_id, item_id) lock order
+                _executemany(cur, UPSERT_STOCK_SQL, [(w, i, q, now) for (w, i), q in sorted(merged.items())])
+                _executemany(cur, INSERT_LOG_SQL, log_rows)
+                cur.execute(
+                    f"UPDATE purchase_order SET status = 'RECEIVED' WHERE po_id IN ({_in_list(todo)})",
+                    todo,
+                )
+                for p in todo:
+                    results[p] = _result(p, True, len(lines_by_po[p]), sum(q for _, q in lines_by_po[p]),
+                                         warehouse_id=heads[p][0])
+            except Error:
+                # raises again if the server already rolled back the whole transaction (deadlock)
+                cur.execute("ROLLBACK TO SAVEPOINT po_batch")
+                for p in todo:
+                    cur.execute("SAVEPOINT po_one")
+                    try:
+                        res = receive_po(conn, p, emp_id, now)
+                        results[p] = _result(p, True, res["lines"], res["units"], warehouse_id=heads[p][0])
+                    except (StockOpError, Error) as e:
+                        cur.execute("ROLLBACK TO SAVEPOINT po_one")
+                        results[p] = _result(p, False, error=str(e), warehouse_id=heads[p][0])
+    finally:
+        cur.close()
+    return [results[p] for p in po_ids]
+
+
+def adjust_stock(conn, warehouse_id, item_id, delta, emp_id=None, change_type="ADJUST",
+                 ref_type="MANUAL", now=None):
+    """
+    Apply a relative stock change (manual adjustment, customer return, return to
+    supplier) and log it. The stock row is locked before it is read, so two clerks
+    adjusting the same SKU cannot overwrite each other's change.
+    Raises StockOpError when the change would take stock below zero or an id does not exist.
+    Returns the new quantity.
+    """
+    now = now or datetime.now()
+    delta = int(delta)
+    cur = conn.cursor()
+    try:
+        check_refs(cur, warehouse_id, item_id, emp_id)
+        cur.execute(
+            "SELECT quantity FROM stock WHERE warehouse_id = %s AND item_id = %s FOR UPDATE",
+            (warehouse_id, item_id),
+        )
+        row = cur.fetchone()
+        new_qty = (int(row[0]) if row else 0) + delta
+        if new_qty < 0:
+            if not row:
+                raise StockOpError("No stock row found; negative stock not created.")
+            raise StockOpError(f"Insufficient stock: available {int(row[0])}, requested {-delta}.")
+        if row:
+            cur.execute(
+                "UPDATE stock SET quantity = %s, last_updated = %s WHERE warehouse_id = %s AND item_id = %s",
+                (new_qty, now, warehouse_id, item_id),
+            )
+        else:
+            cur.execute(
+                "INSERT INTO stock (warehouse_id, item_id, quantity, last_updated) VALUES (%s,%s,%s,%s)",
+                (warehouse_id, item_id, new_qty, now),
+            )
+        # IN/OUT rows carry the unsigned amount, ADJUST keeps its sign (see rollups.SIGNED_DELTA_SQL)
+        logged = delta if change_type == "ADJUST" else abs(delta)
+        cur.execute(INSERT_LOG_SQL, (warehouse_id, item_id, change_type, logged, ref_type, None, emp_id, now))
+    finally:
+        cur.close()
+    return new_qty
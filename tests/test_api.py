@@ -0,0 +1,119 @@
+# tests/test_api.py
+# The HTTP layer of api.py on a real socket, with the service calls replaced: routing,
+# bearer-token auth, request validation and the mapping of errors to status codes.
+import http.client
+import json
+import threading
+
+import pytest
+from mysql.connector import errors
+
+import api
+import services
+from stock_ops import StockOpError
+
+
+@pytest.fixture
+def server():
+    srv = api.PooledHTTPServer(("127.0.0.1", 0), api.Handler, 2)
+    t = threading.Thread(target=srv.serve_forever, daemon=True)
+    t.start()
+    yield srv
+    srv.shutdown()
+    srv._executor.shutdown(wait=True)
+    srv.server_close()
+
+
+@pytest.fixture
+def call(server):
+    def request(method, path, body=None, token=None, raw=None):
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        data = raw if raw is not None else (json.dumps(body) if body is not None else None)
+        conn.request(method, path, body=data, headers=headers)
+        resp = conn.getresponse()
+        payload = resp.read()
+        conn.close()
+        ctype = resp.getheader("Content-Type", "")
+        return resp.status, json.loads(payload) if ctype == "application/json" else payload.decode()
+    return request
+
+
+@pytest.fixture
+def shipped(monkeypatch):
+    calls = []
+
+    def ship_so(so_id, emp_id, check_stock=True):
+        calls.append((so_id, emp_id, check_stock))
+        return {"so_id": so_id, "warehouse_id": 1, "lines": 1, "units": 1, "skipped": []}
+    monkeypatch.setattr(services, "ship_so", ship_so)
+    return calls
+
+
+def test_routes_and_path_ids(call, shipped):
+    assert call("POST", "/so/17/ship", {"emp_id": 3}) == (200, {"so_id": 17, "warehouse_id": 1, "lines": 1,
+                                                                "units": 1, "skipped": []})
+    assert call("POST", "/so/17/ship/", {"emp_id": 3})[0] == 200
+    assert shipped == [(17, 3, True), (17, 3, True)]
+    assert call("GET", "/nowhere") == (404, {"error": "not found"})
+    assert call("GET", "/so/17/ship") == (405, {"error": "method not allowed"})
+    assert call("POST", "/so/abc/ship", {"emp_id": 3})[0] == 404
+
+
+def test_check_stock_must_be_a_json_boolean(call, shipped):
+    assert call("POST", "/so/5/ship", {"emp_id": 1, "check_stock": False})[0] == 200
+    for bad in ("false", 0, None, []):
+        status, payload = call("POST", "/so/5/ship", {"emp_id": 1, "check_stock": bad})
+        assert status == 400 and "check_stock" in payload["error"]
+    assert shipped == [(5, 1, False)]
+
+
+def test_bad_bodies(call, shipped):
+    assert call("POST", "/so/5/ship", raw="{not json") == (400, {"error": "body is not valid JSON"})
+    assert call("POST", "/so/5/ship", [1, 2]) == (400, {"error": "body must be a JSON object"})
+    assert call("POST", "/so/5/ship", {}) == (400, {"error": "missing field(s): emp_id"})
+    assert call("POST", "/po/receive-batch", {"po_ids": 4, "emp_id": 1}) == (400, {"error": "po_ids must be a list"})
+    assert shipped == []
+
+
+@pytest.mark.parametrize("exc, status", [
+    (ValueError("delta must not be zero"), 400),
+    (StockOpError("Insufficient stock: available 1, requested 5."), 409),
+    (errors.IntegrityError(msg="Duplicate entry", errno=1062), 409),
+    (errors.PoolError(msg="pool exhausted"), 503),
+    (errors.OperationalError(msg="Lost connection", errno=2013), 500),
+    (RuntimeError("boom"), 500),
+])
+def test_error_status(call, monkeypatch, exc, status):
+    def adjust_stock(*args):
+        raise exc
+    monkeypatch.setattr(services, "adjust_stock", adjust_stock)
+    got, payload = call("POST", "/stock/adjust", {"warehouse_id": 1, "item_id": 1, "delta": 5})
+    assert got == status
+    if status == 500:
+        # driver and internal details stay in the server log
+        assert payload["error"] in ("database error", "internal error")
+    else:
+        assert payload["error"] == (exc.msg if isinstance(exc, errors.Error) else str(exc))
+
+
+def test_bearer_tokens(call, shipped, monkeypatch):
+    monkeypatch.setitem(api._opts, "tokens", ["s3cret"])
+    assert call("POST", "/so/5/ship", {"emp_id": 1}) == (401, {"error": "missing or unknown bearer token"})
+    assert call("POST", "/so/5/ship", {"emp_id": 1}, token="wrong")[0] == 401
+    assert call("POST", "/so/5/ship", {"emp_id": 1}, token="s3cret")[0] == 200
+    assert shipped == [(5, 1, True)]
+    # routes are matched before the token is checked
+    assert call("GET", "/nowhere")[0] == 404
+
+
+def test_health_needs_no_token(call, monkeypatch):
+    monkeypatch.setitem(api._opts, "tokens", ["s3cret"])
+    monkeypatch.setattr(api.db, "pool_stats", lambda: {"size": 0})
+    status, payload = call("GET", "/health")
+    assert status == 200 and payload["ok"] is True
+
+
+def test_metrics_endpoint(call):
+    status, text = call("GET", "/metrics")
+    assert status == 200 and "inv_api_request_seconds" in text
@@ -0,0 +1,210 @@
+# tests/test_rollups.py
+# The rollup's high-water mark against a small in-memory model of the statements it
+# issues: log rows become visible at commit, in any id order, like InnoDB auto-increment.
+import copy
+import re
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import rollups
+
+
+class FakeLog:
+    """transaction_log + rollup tables; writers take ids at insert and publish them at commit."""
+
+    def __init__(self):
+        self.now = datetime(2026, 1, 5, 12, 0, 0)
+        self.next_id = 1
+        self.committed = {}            # log_id -> (day, warehouse, item, change_type, ref_type, delta)
+        self.open = {}                 # writer -> (started, {log_id: row})
+        self.tables = {"state": {}, "gaps": {}, "daily": defaultdict(lambda: [0, 0])}
+
+    def begin(self, writer):
+        self.open[writer] = (self.now, {})
+
+    def insert(self, writer, warehouse=1, item=1, change_type="IN", delta=1, day=date(2026, 1, 5)):
+        log_id, self.next_id = self.next_id, self.next_id + 1
+        self.open[writer][1][log_id] = (day, warehouse, item, change_type, "MANUAL", delta)
+        return log_id
+
+    def commit(self, writer):
+        self.committed.update(self.open.pop(writer)[1])
+
+    def rollback(self, writer):
+        self.open.pop(writer)
+
+    def write(self, warehouse=1, item=1, change_type="IN", delta=1):
+        """One committed single-row transaction."""
+        self.begin("auto")
+        log_id = self.insert("auto", warehouse, item, change_type, delta)
+        self.commit("auto")
+        return log_id
+
+    def tick(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+    def daily(self, warehouse=1, item=1):
+        return sum(v[0] for k, v in self.tables["daily"].items() if k[1] == warehouse and k[2] == item)
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        db, sql, p = self.db, " ".join(sql.split()), tuple(params or ())
+        t = db.tables
+        if "information_schema.INNODB_TRX" in sql:
+            oldest = min([started for started, _ in db.open.values()] + [db.now])
+            self.rows = [(oldest - timedelta(seconds=2),)]
+        elif sql.startswith("SELECT last_log_id FROM rollup_state"):
+            self.rows = [(t["state"][p[0]],)] if p[0] in t["state"] else []
+        elif sql.startswith("INSERT INTO rollup_state"):
+            t["state"][p[0]] = 0
+        elif sql.startswith("UPDATE rollup_state SET last_log_id"):
+            t["state"][p[1]] = p[0]
+        elif sql.startswith("SELECT first_id, last_id"):
+            self.rows = sorted((f, last, seen)[:3 if "seen_at" in sql else 2]
+                               for (name, f), (last, seen) in t["gaps"].items() if name == p[0])
+        elif sql.startswith("DELETE FROM rollup_gap"):
+            del t["gaps"][(p[0], p[1])]
+        elif "LAG(log_id" in sql:
+            lo, _, hi, limit = p
+            ids = sorted(i for i in db.committed if lo < i <= hi)[:limit]
+            prevs = [lo] + ids[:-1]
+            self.rows = [(i, prev, ids[-1]) for i, prev in zip(ids, prevs) if i > prev + 1 or i == ids[-1]]
+        elif sql.startswith("INSERT INTO tlog_daily"):
+            lo, hi, skips = p[0], p[1], list(zip(p[2::2], p[3::2]))
+            assert sql.count("NOT BETWEEN") == len(skips)
+            for log_id, (day, wh, item, ctype, rtype, delta) in db.committed.items():
+                if lo < log_id <= hi and not any(a <= log_id <= b for a, b in skips):
+                    signed = -abs(delta) if ctype == "OUT" else abs(delta) if ctype == "IN" else delta
+                    acc = t["daily"][(day, wh, item, ctype, rtype)]
+                    acc[0] += signed
+                    acc[1] += 1
+        else:
+            raise AssertionError(f"unexpected statement: {sql}")
+
+    def executemany(self, sql, seq):
+        assert sql.startswith("INSERT INTO rollup_gap")
+        for name, first, last, seen in seq:
+            self.db.tables["gaps"][(name, first)] = (last, seen or self.db.now)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.saved = None
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+    def start_transaction(self, isolation_level=None):
+        assert isolation_level == "READ COMMITTED"
+        self.saved = copy.deepcopy(self.db.tables)
+
+    def commit(self):
+        self.saved = None
+
+    def rollback(self):
+        if self.saved is not None:
+            self.db.tables, self.saved = self.saved, None
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def log(monkeypatch):
+    db = FakeLog()
+    monkeypatch.setattr(rollups.db, "get_connection", lambda: FakeConnection(db))
+    monkeypatch.setattr(rollups.query_cache, "invalidate_tables", lambda *tables: None)
+    return db
+
+
+def test_late_committing_low_id_is_counted(log):
+    log.write(delta=5)                              # id 1
+    log.begin("slow")
+    log.insert("slow", delta=7)                     # id 2, still open
+    log.write(delta=11)                             # id 3 commits first
+    log.tick(120)
+
+    rollups.update_daily()
+    assert log.tables["state"]["tlog_daily"] == 3
+    assert log.daily() == 16
+    assert [k[1] for k in log.tables["gaps"]] == [2]
+
+    log.tick(300)                                   # far past any logged_at based lag
+    log.commit("slow")
+    rollups.update_daily()
+    assert log.daily() == 23
+    assert log.tables["gaps"] == {}
+
+
+def test_open_gap_is_kept_until_its_writer_ends(log):
+    log.begin("slow")
+    log.insert("slow")                              # id 1
+    log.write()                                     # id 2
+    rollups.update_daily()
+    log.tick(7200)
+    rollups.update_daily()                          # writer still open: still waiting
+    assert list(log.tables["gaps"]) == [("tlog_daily", 1)]
+
+    log.rollback("slow")
+    log.tick(5)
+    assert rollups.update_daily() == 1              # rolled back id given up
+    assert log.tables["gaps"] == {}
+    assert log.daily() == 1
+
+
+def test_gap_partly_filled_is_split(log):
+    log.begin("a")
+    log.begin("b")
+    a1, b1, a2 = log.insert("a", delta=1), log.insert("b", delta=10), log.insert("a", delta=100)
+    log.write(delta=1000)
+    rollups.update_daily()
+    assert list(log.tables["gaps"]) == [("tlog_daily", a1)]
+
+    log.commit("a")
+    rollups.update_daily()
+    assert log.daily() == 1101
+    assert [(k[1], v[0]) for k, v in log.tables["gaps"].items()] == [(b1, b1)]
+
+    log.commit("b")
+    rollups.update_daily()
+    assert log.daily() == 1111
+    assert log.tables["gaps"] == {}
+
+
+def test_batch_stops_before_too_many_gaps(log, monkeypatch):
+    monkeypatch.setattr(rollups, "MAX_GAPS_PER_BATCH", 2)
+    log.begin("slow")
+    for _ in range(3):
+        log.insert("slow")
+        log.write()                                 # ids: 1 open, 2, 3 open, 4, 5 open, 6
+    assert rollups._fold_batch(FakeConnection(log)) == 4
+    assert log.tables["state"]["tlog_daily"] == 4
+    assert sorted(k[1] for k in log.tables["gaps"]) == [1, 3]
+    assert log.daily() == 2
+
+
+def test_scan_log_bounded_range():
+    cur = FakeCursor(FakeLog())
+    cur.db.committed = {i: (date(2026, 1, 1), 1, 1, "IN", "MANUAL", 1) for i in (11, 12, 15)}
+    assert rollups.scan_log(cur, 9, 17) == (17, [(10, 10), (13, 14), (16, 17)])
+    assert rollups.scan_log(cur, 20, 25) == (25, [(21, 25)])
+    assert rollups.scan_log(cur, 9) == (15, [(10, 10), (13, 14)])
+    assert rollups.scan_log(cur, 15) == (None, [])
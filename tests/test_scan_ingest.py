@@ -0,0 +1,111 @@
+# tests/test_scan_ingest.py
+# The scan commit thread: a failing batch, whatever the exception, is retried and
+# reported instead of ending the thread; and the statements one micro-batch issues.
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+import scan_ingest
+from stock_ops import INSERT_LOG_SQL, UPSERT_STOCK_SQL
+
+
+def _wait(cond, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.01)
+
+
+def test_worker_survives_unexpected_errors(monkeypatch, tmp_path):
+    monkeypatch.setattr(scan_ingest, "MAX_RETRY_DELAY", 0.05)
+    ing = scan_ingest.ScanIngestor(str(tmp_path), window=0.01)
+    ing.slot = str(tmp_path)
+    calls = []
+
+    def flush_once():
+        calls.append(1)
+        if len(calls) <= 2:
+            raise KeyError("wh")
+        ing._pending.clear()
+        return False
+    monkeypatch.setattr(ing, "flush_once", flush_once)
+    before = scan_ingest.SCAN_ERRORS.value(kind="internal")
+    ing._pending.append((1, None))
+    ing.start()
+    _wait(lambda: not ing._pending)
+
+    status = ing.status()
+    assert status["worker_alive"] and status["failing"] == 0 and status["errors"] == 2
+    assert "KeyError" in status["last_error"]
+    assert scan_ingest.SCAN_ERRORS.value(kind="internal") == before + 2
+    ing._stop.set()
+    ing._wake.set()
+    ing._thread.join()
+    assert not ing.alive()
+
+
+def test_submit_refuses_when_the_worker_is_gone(tmp_path):
+    ing = scan_ingest.ScanIngestor(str(tmp_path))
+    ing._thread = threading.Thread(target=lambda: None)
+    ing._thread.start()
+    ing._thread.join()
+    with pytest.raises(RuntimeError, match="scan worker has stopped"):
+        ing.submit([{"warehouse_id": 1, "item_id": 1, "direction": "IN"}])
+
+
+class BatchCursor:
+    """Answers _apply's reads from `stock` ({(wh, item): qty}); records what it writes."""
+
+    def __init__(self, stock):
+        self.stock = stock
+        self.rows = []
+        self.written = {}
+
+    def execute(self, sql, params=()):
+        if sql.startswith("SELECT last_seq"):
+            self.rows = []
+        elif sql.startswith("SELECT item_id, quantity FROM stock"):
+            wh, items = params[0], params[1:]
+            self.rows = [(i, q) for (w, i), q in sorted(self.stock.items()) if w == wh and i in items]
+        elif sql.startswith("SELECT"):
+            self.rows = [(i,) for i in params]            # every id exists
+        else:
+            self.written.setdefault(sql.split()[0] + " " + sql.split()[2], []).append(params)
+
+    def executemany(self, sql, rows):
+        self.written.setdefault(sql, []).extend(rows)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+def test_net_outbound_pairs_are_decremented_not_upserted(monkeypatch, tmp_path):
+    cur = BatchCursor({(1, 1): 5, (1, 3): 2})
+    conn = type("Conn", (), {"cursor": lambda self: cur, "commit": lambda self: None,
+                             "rollback": lambda self: None, "close": lambda self: None})()
+    monkeypatch.setattr(scan_ingest.db, "get_connection", lambda: conn)
+    monkeypatch.setattr(scan_ingest.query_cache, "invalidate_tables", lambda *t: None)
+    ing = scan_ingest.ScanIngestor(str(tmp_path))
+    ing.source = "test:slot-00"
+    at = datetime(2026, 1, 5, 12, 0)
+    batch = list(enumerate([
+        (1, 1, -1, None, at), (1, 1, -1, None, at), (1, 1, 1, None, at),   # nets -1
+        (1, 2, 3, None, at),                                                # new row, nets +3
+        (1, 3, -1, None, at), (1, 3, 1, None, at),                          # nets 0
+    ], 1))
+
+    applied, rejected = ing._apply(batch)
+    assert len(applied) == 6 and rejected == []
+    assert [r[:3] for r in cur.written[UPSERT_STOCK_SQL]] == [(1, 2, 3)]
+    assert [(d, w, i) for d, _, w, i in cur.written[scan_ingest.DECREMENT_STOCK_SQL]] == [(-1, 1, 1)]
+    assert [(r[1], r[2], r[3]) for r in cur.written[INSERT_LOG_SQL]] == [
+        (1, "OUT", 1), (1, "OUT", 1), (1, "IN", 1), (2, "IN", 3), (3, "OUT", 1), (3, "IN", 1)]
+    assert cur.written["INSERT scan_ingest_state"] == [("test:slot-00", 6)]
@@ -0,0 +1,138 @@
+# tests/test_services.py
+# services.py without a database: input validation happens before a connection is taken,
+# and each kind of failure from stock_ops / the driver ends in a rollback and the right
+# exception and metric.
+import pytest
+from mysql.connector import errors
+
+import metrics
+import services
+import stock_ops
+from stock_ops import StockOpError
+
+
+class FakeConnection:
+    def __init__(self):
+        self.events = []
+
+    def cursor(self, **kwargs):
+        return FakeCursor()
+
+    def commit(self):
+        self.events.append("commit")
+
+    def rollback(self):
+        self.events.append("rollback")
+
+    def close(self):
+        self.events.append("close")
+
+
+class FakeCursor:
+    """Answers the id lookups of stock_ops.check_refs from `existing`."""
+
+    existing = {"warehouse": {1}, "item": {1}, "employee": {1}}
+
+    def __init__(self):
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        table = sql.split(" FROM ")[1].split()[0]
+        self.rows = [(1,)] if params[0] in self.existing[table] else []
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    c = FakeConnection()
+    c.invalidated = []
+    monkeypatch.setattr(services.db, "get_connection", lambda: c)
+    monkeypatch.setattr(services.query_cache, "invalidate_tables", lambda *t: c.invalidated.extend(t))
+    return c
+
+
+@pytest.fixture
+def no_conn(monkeypatch):
+    def refuse():
+        raise AssertionError("bad input must be rejected before a connection is taken")
+    monkeypatch.setattr(services.db, "get_connection", refuse)
+
+
+@pytest.mark.parametrize("call", [
+    lambda: services.receive_po("abc", 1),
+    lambda: services.receive_po(0, 1),
+    lambda: services.receive_po(5, None),
+    lambda: services.receive_pos_batch([1, -2], 1),
+    lambda: services.ship_so(3, "x"),
+    lambda: services.adjust_stock(1, 1, 0),
+    lambda: services.adjust_stock(1, 1, "many"),
+    lambda: services.adjust_stock(1, 0, 5),
+    lambda: services.process_return(1, 1, 2, "lost"),
+    lambda: services.process_return(1, 1, -2, "customer"),
+    lambda: services.create_order("transfer", 1, 1),
+    lambda: services.stock_lookup(limit=0),
+])
+def test_bad_input_is_a_value_error(no_conn, call):
+    with pytest.raises(ValueError):
+        call()
+
+
+def test_success_commits_and_invalidates(conn, monkeypatch):
+    monkeypatch.setattr(stock_ops, "adjust_stock", lambda c, wh, item, delta, emp_id=None, change_type="ADJUST": 12)
+    assert services.adjust_stock("1", "2", "-3", emp_id="4") == 12
+    assert conn.events == ["commit", "close"]
+    assert set(conn.invalidated) == {"stock", "transaction_log"}
+
+
+def test_return_to_supplier_is_logged_out(conn, monkeypatch):
+    calls = []
+    monkeypatch.setattr(stock_ops, "adjust_stock", lambda c, *a, **kw: calls.append((a, kw)) or 0)
+    services.process_return(1, 2, 5, "supplier", emp_id=7)
+    services.process_return(1, 2, 5, "customer")
+    assert calls == [((1, 2, -5), {"emp_id": 7, "change_type": "OUT"}),
+                     ((1, 2, 5), {"emp_id": None, "change_type": "IN"})]
+
+
+def test_business_rule_rolls_back(conn, monkeypatch):
+    def refuse(*args, **kwargs):
+        raise StockOpError("SO 9 cannot be shipped (status SHIPPED).")
+    monkeypatch.setattr(stock_ops, "ship_so", refuse)
+    before = metrics.STOCK_OP_REJECTED.value(operation="ship_so")
+    with pytest.raises(StockOpError):
+        services.ship_so(9, 1)
+    assert conn.events == ["rollback", "close"]
+    assert conn.invalidated == []
+    assert metrics.STOCK_OP_REJECTED.value(operation="ship_so") == before + 1
+
+
+def test_database_error_rolls_back(conn, monkeypatch):
+    def fail(*args, **kwargs):
+        raise errors.OperationalError(msg="Lock wait timeout exceeded", errno=1205)
+    monkeypatch.setattr(stock_ops, "receive_po", fail)
+    before = metrics.DB_ERRORS.value(page="none", operation="receive_po")
+    with pytest.raises(errors.OperationalError):
+        services.receive_po(4, 1)
+    assert conn.events == ["rollback", "close"]
+    assert metrics.DB_ERRORS.value(page="none", operation="receive_po") == before + 1
+
+
+def test_unknown_employee_is_refused(conn):
+    with pytest.raises(StockOpError, match="Employee 99 not found"):
+        services.adjust_stock(1, 1, 5, emp_id=99)
+    assert conn.events == ["rollback", "close"]
+
+
+@pytest.mark.parametrize("ids, missing", [
+    ((2, 1, None), "Warehouse 2"),
+    ((1, 2, None), "Item 2"),
+    ((1, 1, 2), "Employee 2"),
+])
+def test_check_refs(ids, missing):
+    with pytest.raises(StockOpError, match=missing):
+        stock_ops.check_refs(FakeCursor(), *ids)
+    stock_ops.check_refs(FakeCursor(), 1, 1, None)
@@ -0,0 +1,298 @@
+# tlog_partitions.py
+# Monthly RANGE partitions of transaction_log on logged_at, and log retention.
+# Each month pYYYYMM holds rows with logged_at < the first of the next month (the oldest
+# partition also catches anything older); pmax catches rows beyond the pre-created months.
+# Queries filtered on logged_at only touch the partitions of their range, and expiring a
+# month is a metadata operation instead of a long locking DELETE:
+#   - "archive": the partition is swapped (EXCHANGE PARTITION) with an empty table
+#     transaction_log_archive_YYYYMM, which then holds its rows, and dropped;
+#   - "drop": the same swap, then the table is dropped with its rows.
+# A month is only retired once the daily rollup and a stock checkpoint cover all of its
+# log ids (reports keep their history, "stock as of" stays exact for later times). Both
+# marks are capped below their lowest open gap (rollup_gap, stock_checkpoint_gap): an id
+# there may still commit, into any month. The swapped-out rows are checked against the
+# marks again before anything is dropped, since writers still open at the first check
+# commit before the swap. Each retirement is recorded in tlog_retention, which
+# stock_history.py checks.
+# Needs the key changes in changes_made.sql (no FKs, PRIMARY KEY (log_id, logged_at)).
+#
+#   python tlog_partitions.py convert [--dry-run]   # one-time: partition the existing table
+#   python tlog_partitions.py maintain [--dry-run]  # cron, e.g. daily: add months, apply retention
+#   python tlog_partitions.py list | check
+import argparse
+import sys
+from datetime import date, datetime
+
+from mysql.connector import Error
+
+import db
+import query_cache
+import rollups
+
+try:
+    from config import TLOG_PARTITION_CONFIG
+except ImportError:
+    TLOG_PARTITION_CONFIG = {}
+
+PARTITION_DEFAULTS = {
+    "months_ahead": 3,      # empty future months kept pre-created
+    "retain_months": 24,    # months kept in transaction_log besides the current one; None = keep all
+    "mode": "archive",      # "archive" (exchange out to transaction_log_archive_YYYYMM) or "drop"
+}
+
+_opts = dict(PARTITION_DEFAULTS)
+_opts.update(TLOG_PARTITION_CONFIG or {})
+
+TABLE = "transaction_log"
+ARCHIVE_PREFIX = "transaction_log_archive_"
+MAX_PARTITION = "pmax"
+
+
+def _month(d):
+    return date(d.year, d.month, 1)
+
+
+def _add_months(d, n):
+    y, m = divmod(d.month - 1 + n, 12)
+    return date(d.year + y, m + 1, 1)
+
+
+def _name(month):
+    return f"p{month:%Y%m}"
+
+
+def _month_of(name):
+    return date(int(name[1:5]), int(name[5:7]), 1)
+
+
+def _definition(month):
+    # boundary evaluated by the server in its time zone, like logged_at itself
+    return (f"PARTITION {_name(month)} VALUES LESS THAN "
+            f"(UNIX_TIMESTAMP('{_add_months(month, 1):%Y-%m-%d} 00:00:00'))")
+
+
+def partitions(cur):
+    """[(name, rows estimate)] in order; [] when the table is not partitioned."""
+    cur.execute(
+        "SELECT PARTITION_NAME, TABLE_ROWS FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY PARTITION_ORDINAL_POSITION",
+        (TABLE,),
+    )
+    return [(name, int(rows or 0)) for name, rows in cur.fetchall() if name is not None]
+
+
+def _months(parts):
+    return [_month_of(n) for n, _ in parts if n != MAX_PARTITION]
+
+
+def _run(cur, sql, dry_run, params=()):
+    print(sql if not params else f"{sql}  -- {params}")
+    if not dry_run:
+        cur.execute(sql, params)
+
+
+# ---------- CONVERT ----------
+def convert(dry_run=False, months_ahead=None):
+    """Partition the existing table by month, from its oldest row through months_ahead."""
+    months_ahead = int(_opts["months_ahead"] if months_ahead is None else months_ahead)
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        if partitions(cur):
+            raise ValueError(f"{TABLE} is already partitioned; use maintain")
+        cur.execute("SELECT MIN(logged_at) FROM transaction_log")
+        oldest = cur.fetchone()[0]
+        first = _month(oldest or datetime.now())
+        last = _add_months(_month(datetime.now()), months_ahead)
+        months, m = [], first
+        while m <= last:
+            months.append(m)
+            m = _add_months(m, 1)
+        defs = ",\n  ".join([_definition(m) for m in months] + [f"PARTITION {MAX_PARTITION} VALUES LESS THAN MAXVALUE"])
+        # rebuilds the table (copies every row): run it in a quiet period
+        _run(cur, f"ALTER TABLE {TABLE} PARTITION BY RANGE (UNIX_TIMESTAMP(logged_at)) (\n  {defs}\n)", dry_run)
+        cur.close()
+    finally:
+        conn.close()
+    query_cache.invalidate_tables(TABLE)
+    return len(months)
+
+
+# ---------- MAINTAIN ----------
+def add_future(cur, months_ahead, dry_run=False):
+    """Split pmax so that months through now + months_ahead exist. Returns the new partition names."""
+    months = _months(partitions(cur))
+    if not months:
+        raise ValueError(f"{TABLE} is not partitioned; run convert first")
+    target = _add_months(_month(datetime.now()), months_ahead)
+    new, m = [], _add_months(months[-1], 1)
+    while m <= target:
+        new.append(m)
+        m = _add_months(m, 1)
+    if not new:
+        return []
+    cur.execute(f"SELECT 1 FROM {TABLE} PARTITION ({MAX_PARTITION}) LIMIT 1")
+    if cur.fetchall():
+        # rows beyond the last month: the split has to move them (no longer instant)
+        print(f"warning: {MAX_PARTITION} holds rows; reorganizing it copies them", file=sys.stderr)
+    defs = ", ".join([_definition(m) for m in new] + [f"PARTITION {MAX_PARTITION} VALUES LESS THAN MAXVALUE"])
+    _run(cur, f"ALTER TABLE {TABLE} REORGANIZE PARTITION {MAX_PARTITION} INTO ({defs})", dry_run)
+    return [_name(m) for m in new]
+
+
+def _covered_log_id(cur):
+    """
+    Highest log id up to which both the daily rollup and the newest stock checkpoint
+    include every row: their high-water marks, each capped just below its first gap.
+    """
+    cur.execute("SELECT IFNULL(MAX(last_log_id), 0) FROM rollup_state WHERE name = %s", (rollups.ROLLUP_NAME,))
+    rolled = int(cur.fetchone()[0])
+    cur.execute("SELECT MIN(first_id) FROM rollup_gap WHERE name = %s", (rollups.ROLLUP_NAME,))
+    gap = cur.fetchone()[0]
+    if gap is not None:
+        rolled = min(rolled, int(gap) - 1)
+    cur.execute("SELECT checkpoint_id, last_log_id FROM stock_checkpoint ORDER BY checkpoint_id DESC LIMIT 1")
+    ckpt = cur.fetchone()
+    if ckpt is None:
+        return 0
+    checkpointed = int(ckpt[1])
+    cur.execute("SELECT MIN(first_id) FROM stock_checkpoint_gap WHERE checkpoint_id = %s", (ckpt[0],))
+    gap = cur.fetchone()[0]
+    if gap is not None:
+        checkpointed = min(checkpointed, int(gap) - 1)
+    return min(rolled, checkpointed)
+
+
+def retire(conn, retain_months, mode, dry_run=False, force=False):
+    """
+    Archive or drop the months older than retain_months (the current month not counted).
+    Returns [(partition, action)] with action 'archived', 'dropped' or 'skipped: <why>'.
+    """
+    if mode not in ("archive", "drop"):
+        raise ValueError("mode must be archive or drop")
+    if int(retain_months) < 1:
+        raise ValueError("retain_months must be at least 1")
+    cur = conn.cursor()
+    cutoff = _add_months(_month(datetime.now()), -int(retain_months))
+    parts = partitions(cur)
+    rows_by_name = dict(parts)
+    expired = [m for m in _months(parts) if m < cutoff]
+    covered = None if force else _covered_log_id(cur)
+    done = []
+    for m in expired:
+        name = _name(m)
+        # end of the primary key: no scan of the month
+        cur.execute(f"SELECT MAX(log_id) FROM {TABLE} PARTITION ({name})")
+        max_id = cur.fetchone()[0]
+        if max_id is not None and covered is not None and int(max_id) > covered:
+            # later months depend on this one being rolled up / checkpointed first
+            done.append((name, f"skipped: log id {max_id} not yet in the rollup and a checkpoint"))
+            break
+        # a drop goes through the archive table too, so its rows are checked before they go
+        archive = f"{ARCHIVE_PREFIX}{m:%Y%m}" if max_id is not None else None
+        if archive:
+            cur.execute("SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() "
+                        "AND TABLE_NAME = %s", (archive,))
+            if cur.fetchone()[0]:
+                done.append((name, f"skipped: {archive} already exists"))
+                break
+        # recorded first: DDL commits on its own, and a retirement that failed halfway
+        # must still stop "stock as of" from trusting the log before this month
+        _run(cur,
+             "INSERT INTO tlog_retention (partition_name, range_end, max_log_id, row_count, action, archive_table) "
+             "VALUES (%s,%s,%s,%s,%s,%s) ON DUPLICATE KEY UPDATE max_log_id = VALUES(max_log_id), "
+             "row_count = VALUES(row_count), action = VALUES(action), archive_table = VALUES(archive_table)",
+             dry_run, (name, _add_months(m, 1), max_id, rows_by_name[name], "ARCHIVE" if mode == "archive" else "DROP",
+                       archive if mode == "archive" else None))
+        if not dry_run:
+            conn.commit()
+        if archive:
+            _run(cur, f"CREATE TABLE {archive} LIKE {TABLE}", dry_run)
+            _run(cur, f"ALTER TABLE {archive} REMOVE PARTITIONING", dry_run)
+            # rows are known to fit the partition: skip the per-row check, the swap is instant
+            _run(cur, f"ALTER TABLE {TABLE} EXCHANGE PARTITION {name} WITH TABLE {archive} WITHOUT VALIDATION", dry_run)
+        _run(cur, f"ALTER TABLE {TABLE} DROP PARTITION {name}", dry_run)
+        if archive and covered is not None and not dry_run:
+            cur.execute(f"SELECT MAX(log_id) FROM {archive}")
+            swapped = cur.fetchone()[0]
+            if swapped is not None and int(swapped) > covered:
+                # committed after the first check: keep the rows and stop here
+                cur.execute("UPDATE tlog_retention SET max_log_id = %s, action = 'ARCHIVE', archive_table = %s "
+                            "WHERE partition_name = %s", (swapped, archive, name))
+                conn.commit()
+                done.append((name, f"archived to {archive}: log id {swapped} committed meanwhile "
+                                   "and is not in the rollup and a checkpoint"))
+                break
+        if archive and mode == "drop":
+            _run(cur, f"DROP TABLE {archive}", dry_run)
+        done.append((name, "archived" if mode == "archive" and archive else "dropped"))
+    cur.close()
+    return done
+
+
+def maintain(dry_run=False, force=False):
+    """Pre-create future months, then apply retention. Returns (added, retired)."""
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        added = add_future(cur, int(_opts["months_ahead"]), dry_run)
+        cur.close()
+        retired = []
+        if _opts["retain_months"] is not None:
+            retired = retire(conn, _opts["retain_months"], _opts["mode"], dry_run, force)
+    finally:
+        conn.close()
+    if not dry_run and (added or retired):
+        query_cache.invalidate_tables(TABLE)
+    return added, retired
+
+
+def check_pruning(cur, start, end):
+    """Partitions EXPLAIN reports for a logged_at range scan (pruning works if only those months show)."""
+    cur.execute(
+        f"EXPLAIN SELECT COUNT(*) FROM {TABLE} WHERE logged_at >= %s AND logged_at < %s",
+        (start, end),
+    )
+    cols = [d[0] for d in cur.description]
+    row = cur.fetchone()
+    return dict(zip(cols, row)).get("partitions")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monthly partitions and retention for transaction_log.")
+    parser.add_argument("cmd", choices=("convert", "maintain", "list", "check"))
+    parser.add_argument("--dry-run", action="store_true", help="print the DDL without running it")
+    parser.add_argument("--force", action="store_true",
+                        help="retire months even if the rollup / stock checkpoints have not caught up")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.cmd == "convert":
+            n = convert(args.dry_run)
+            print(f"{TABLE}: {n} monthly partitions + {MAX_PARTITION}")
+        elif args.cmd == "maintain":
+            added, retired = maintain(args.dry_run, args.force)
+            print(f"added: {', '.join(added) or 'none'}")
+            for name, action in retired:
+                print(f"{name}: {action}")
+        else:
+            conn = db.get_connection()
+            try:
+                cur = conn.cursor()
+                if args.cmd == "list":
+                    for name, rows in partitions(cur) or [("(not partitioned)", 0)]:
+                        print(f"{name:>20}  ~{rows} rows")
+                else:
+                    month = _month(datetime.now())
+                    print(f"logged_at in {month:%Y-%m}: partitions {check_pruning(cur, month, _add_months(month, 1))}")
+                cur.close()
+            finally:
+                conn.close()
+    except (Error, ValueError) as e:
+        print(f"failed: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())